@@ -0,0 +1,64 @@
+import json
+import multiprocessing
+import tempfile
+
+from pathlib import Path
+from typing import Annotated
+
+from h2mob.services.simulation import get_simulation_service
+from h2mob.settings.simulation import SumoBackend, get_simulation_config
+
+import typer
+
+from loguru import logger
+
+
+app = typer.Typer()
+
+
+def measure_steps_per_second(
+    scenario_path: Path,
+    percent_of_hydrogen_cars: float,
+    backend: SumoBackend,
+    end_time_sec: int,
+) -> float:
+    config = get_simulation_config().model_copy(
+        update={"sumo_backend": backend, "end_time_sec": end_time_sec}
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        service = get_simulation_service(
+            logger=logger,  # type: ignore
+            simulation_config=config,
+            hydrogen_stations=set(),
+            scenario_path=scenario_path,
+            percent_of_hydrogen_cars=percent_of_hydrogen_cars,
+            output_folder=Path(tmp) / "out",
+        )
+        service.run()
+
+    return service.steps_per_second  # type: ignore
+
+
+@app.command()
+def main(
+    scenario_path: Annotated[Path, typer.Argument()],
+    percent_of_hydrogen_cars: Annotated[float, typer.Option()] = 0.1,
+    end_time_sec: Annotated[int, typer.Option()] = 3600,
+) -> None:
+    results: dict[str, float] = {}
+
+    # libsumo allows a single simulation per process, every backend is
+    # measured in a fresh one
+    context = multiprocessing.get_context("spawn")
+    for backend in SumoBackend:
+        with context.Pool(processes=1) as pool:
+            results[backend.value] = pool.apply(
+                measure_steps_per_second,
+                (scenario_path, percent_of_hydrogen_cars, backend, end_time_sec),
+            )
+
+    print(json.dumps({"steps_per_second": results}, indent=2))
+
+
+if __name__ == "__main__":
+    app()
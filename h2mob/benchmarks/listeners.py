@@ -0,0 +1,96 @@
+import json
+import statistics
+import tempfile
+
+from pathlib import Path
+from typing import Annotated
+
+from h2mob.services.simulation import (
+    SimulationService,
+    load_scenario_config,
+)
+from h2mob.services.station_index import get_station_index
+from h2mob.settings import outputs
+from h2mob.settings.simulation import get_simulation_config
+
+import typer
+
+from loguru import logger
+
+
+app = typer.Typer()
+
+
+def replay_run(
+    scenario_path: Path, output_folder: Path, profile: bool
+) -> SimulationService:
+    # the recorded run decides the vehicles, the listeners and the stations
+    scenario_config = load_scenario_config(output_folder)
+    config = get_simulation_config().model_copy(
+        update={
+            "profile": profile,
+            "record_traci_trace": False,
+            "snapshot_times_sec": [],
+        }
+    )
+    route_file = output_folder / config.vehicle_route_file_path
+    station_index = get_station_index(
+        scenario_path=scenario_path,
+        simulation_config=config,
+        fuel_stations=scenario_config.fuel_stations,
+        hydrogen_stations=scenario_config.hydrogen_stations,
+        logger=logger,  # type: ignore
+    )
+
+    with tempfile.TemporaryDirectory() as tmp:
+        service = SimulationService(
+            logger=logger,  # type: ignore
+            simulation_config=config,
+            scenario_config=scenario_config,
+            scenario_path=scenario_path,
+            output_folder=Path(tmp),
+            route_file=route_file if route_file.exists() else None,
+            station_index=station_index,
+            replay_trace=output_folder / outputs.TRACI_TRACE_OUTPUT,
+        )
+        service.run()
+
+    return service
+
+
+@app.command()
+def main(
+    scenario_path: Annotated[Path, typer.Argument()],
+    output_folder: Annotated[Path, typer.Argument()],
+    repeat: Annotated[int, typer.Option()] = 5,
+    profile: Annotated[bool, typer.Option()] = False,
+) -> None:
+    """
+    Replay the TraCI trace of a run recorded with `h2mob run --record-trace`
+    and measure the listeners without SUMO.
+    """
+    logger.remove()
+    steps_per_second: list[float] = []
+    service: SimulationService | None = None
+    for _ in range(repeat):
+        service = replay_run(
+            scenario_path=scenario_path, output_folder=output_folder, profile=profile
+        )
+        steps_per_second.append(service.steps_per_second)
+
+    results: dict = {
+        "steps": service.client.traci_calls.steps if service else 0,
+        "steps_per_second_median": statistics.median(steps_per_second),
+        "steps_per_second": steps_per_second,
+    }
+    if service is not None and service.profiler is not None:
+        report = service.profiler.report()
+        results["calls"] = {
+            name: {"calls": stats.calls, "total_sec": stats.total_sec}
+            for name, stats in report.calls.items()
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    app()
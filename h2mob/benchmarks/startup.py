@@ -0,0 +1,96 @@
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+from typing import Annotated
+
+import typer
+
+
+app = typer.Typer()
+
+# modules only the commands that need them may import
+HEAVY_MODULES: tuple[str, ...] = (
+    "traci",
+    "libsumo",
+    "numpy",
+    "pydantic",
+    "pydantic_settings",
+    "loguru",
+    "rich.traceback",
+)
+
+
+def measure_wall_ms(command: list[str], repeats: int) -> float:
+    durations: list[float] = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        subprocess.run(command, check=True, capture_output=True)
+        durations.append((time.perf_counter() - started) * 1000)
+    return statistics.median(durations)
+
+
+def measure_import_ms(module: str) -> float:
+    # cumulative microseconds of the module in the -X importtime report
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    for line in reversed(result.stderr.splitlines()):
+        _, cumulative, name = (part.strip() for part in line.split("|"))
+        if name == module:
+            return int(cumulative) / 1000
+    raise ValueError(f"{module} is missing in the import time report")
+
+
+def get_loaded_heavy_modules(module: str) -> list[str]:
+    script = (
+        f"import sys, {module}; "
+        f"print(' '.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", script], check=True, capture_output=True, text=True
+    )
+    return result.stdout.split()
+
+
+@app.command()
+def main(
+    repeats: Annotated[int, typer.Option()] = 10,
+    max_import_ms: Annotated[float, typer.Option()] = 250.0,
+) -> None:
+    """
+    Measure how long importing h2mob.main and `h2mob --help` take and fail
+    if the import gets slower than --max-import-ms or loads a module of
+    HEAVY_MODULES.
+    """
+    results = {
+        "import_ms": statistics.median(
+            measure_import_ms("h2mob.main") for _ in range(repeats)
+        ),
+        "help_wall_ms": measure_wall_ms(
+            [sys.executable, "-m", "h2mob.main", "--help"], repeats=repeats
+        ),
+        "python_wall_ms": measure_wall_ms([sys.executable, "-c", "pass"], repeats),
+        "heavy_modules": get_loaded_heavy_modules("h2mob.main"),
+    }
+    print(json.dumps(results, indent=2))
+
+    if results["heavy_modules"]:
+        typer.echo(f"h2mob.main imports {results['heavy_modules']}", err=True)
+        raise typer.Exit(code=1)
+    if results["import_ms"] > max_import_ms:
+        typer.echo(
+            f"importing h2mob.main took {results['import_ms']:.0f}ms, "
+            f"more than {max_import_ms:.0f}ms",
+            err=True,
+        )
+        raise typer.Exit(code=1)
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,300 @@
+import json
+import multiprocessing
+import platform
+import resource
+import shutil
+import subprocess
+import time
+
+from enum import Enum
+from pathlib import Path
+from typing import Annotated
+
+from h2mob.services.generate_scenario import get_scenario_generator_service
+from h2mob.services.simulation import ScenarioParser, get_simulation_service
+from h2mob.services.trip_generation import TripNetwork
+from h2mob.settings.generator_config import get_scenario_conf
+from h2mob.settings.simulation import get_simulation_config
+
+import numpy as np
+import typer
+
+from loguru import logger
+
+
+app = typer.Typer()
+
+# profiled calls compared between benchmark runs
+HOT_PATHS: tuple[str, ...] = (
+    "listener.VehicleRouter.step",
+    "listener.MonitorVehicles.step",
+    "client.route_to_nearest_gas_station",
+    "client.update_vehicle_states",
+)
+
+
+class NetworkKind(Enum):
+    grid = "grid"
+    spider = "spider"
+
+
+def build_network(kind: NetworkKind, size: int, net_file: Path) -> None:
+    if kind == NetworkKind.grid:
+        options = ["--grid", "--grid.number", str(size), "--grid.length", "200"]
+    else:
+        options = [
+            "--spider",
+            "--spider.arm-number",
+            str(size),
+            "--spider.circle-number",
+            str(size),
+            "--spider.space-radius",
+            "200",
+        ]
+    subprocess.run(
+        ["netgenerate", *options, "--default.lanenumber", "2", "-o", str(net_file)],
+        check=True,
+        capture_output=True,
+    )
+
+
+def place_charging_stations(
+    net_file: Path, charging_station_file: Path, stations: int, seed: int
+) -> list[str]:
+    network = TripNetwork(net_file=net_file, vehicle_class="passenger")
+    candidates = np.flatnonzero(network.lengths > 30)
+    rng = np.random.default_rng(seed)
+    chosen = rng.choice(candidates, size=min(stations, len(candidates)), replace=False)
+
+    station_ids: list[str] = []
+    with charging_station_file.open(mode="w") as out:
+        out.write('<?xml version="1.0" encoding="UTF-8"?>\n\n<additional>\n')
+        for i, edge in enumerate(chosen):
+            station_id = f"cs_{i}"
+            start = network.lengths[edge] / 2 - 10
+            out.write(
+                f'    <chargingStation id="{station_id}" '
+                f'lane="{network.edge_ids[edge]}_0" '
+                f'startPos="{start:.2f}" endPos="{start + 20:.2f}"/>\n'
+            )
+            station_ids.append(station_id)
+        out.write("</additional>\n")
+
+    return station_ids
+
+
+def generate_scenario(
+    net_file: Path,
+    charging_station_file: Path,
+    scenario_path: Path,
+    vehicles: int,
+    seed: int,
+) -> float:
+    config = get_scenario_conf().model_copy(update={"seed": seed})
+    service = get_scenario_generator_service(
+        scenario_path=scenario_path,
+        charging_station_file=charging_station_file,
+        config=config,
+        net_file=net_file,
+        total_vehicle_volume=vehicles,
+        logger=logger,  # type: ignore
+    )
+    started = time.perf_counter()
+    service.generate_scenario()
+    return time.perf_counter() - started
+
+
+def measure_simulation(
+    scenario_path: Path,
+    hydrogen_stations: set[str],
+    percent_of_hydrogen_cars: float,
+    end_time_sec: int,
+) -> dict:
+    config = get_simulation_config().model_copy(
+        update={
+            "end_time_sec": end_time_sec,
+            "profile": True,
+            "snapshot_times_sec": [],
+            "resume_from_snapshot": False,
+        }
+    )
+    scenario_parser = ScenarioParser(
+        simulation_config=config,
+        scenario_path=scenario_path,
+        hydrogen_stations=hydrogen_stations,
+        percent_of_hydrogen_cars=percent_of_hydrogen_cars,
+    )
+    started = time.perf_counter()
+    scenario_parser.get_scenario_config(logger)  # type: ignore
+    parser_sec = time.perf_counter() - started
+
+    output_folder = scenario_path / "benchmark_out"
+    shutil.rmtree(output_folder, ignore_errors=True)
+    service = get_simulation_service(
+        logger=logger,  # type: ignore
+        simulation_config=config,
+        hydrogen_stations=hydrogen_stations,
+        scenario_path=scenario_path,
+        percent_of_hydrogen_cars=percent_of_hydrogen_cars,
+        output_folder=output_folder,
+    )
+    service.run()
+
+    traci_calls = service.client.traci_calls  # type: ignore
+    profile = service.profiler.report()  # type: ignore
+    return {
+        "scenario_parser_sec": parser_sec,
+        "steps_per_second": service.steps_per_second,  # type: ignore
+        "traci_calls_per_step": traci_calls.total_calls / max(traci_calls.steps, 1),
+        "max_traci_calls_per_step": traci_calls.max_step_calls,
+        # ru_maxrss is in KiB on Linux, the SUMO child is only counted
+        # once it has exited
+        "peak_rss_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "peak_sumo_rss_mib": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        / 1024,
+        "hot_paths": {
+            name: {
+                "calls": profile.calls[name].calls,
+                "total_sec": profile.calls[name].total_sec,
+                "mean_us": profile.calls[name].total_sec
+                / profile.calls[name].calls
+                * 1e6,
+            }
+            for name in HOT_PATHS
+            if name in profile.calls
+        },
+    }
+
+
+def run_case(
+    work_path: Path,
+    kind: NetworkKind,
+    size: int,
+    vehicles: int,
+    stations: int,
+    percent_of_hydrogen_cars: float,
+    end_time_sec: int,
+    seed: int,
+) -> dict:
+    case_path = work_path / f"{kind.value}_{size}"
+    case_path.mkdir(parents=True, exist_ok=True)
+    net_file = case_path / "net.net.xml"
+    charging_station_file = case_path / "charging.add.xml"
+    if not net_file.exists():
+        build_network(kind=kind, size=size, net_file=net_file)
+    station_ids = place_charging_stations(
+        net_file=net_file,
+        charging_station_file=charging_station_file,
+        stations=stations,
+        seed=seed,
+    )
+
+    scenario_path = case_path / f"vehicles_{vehicles}"
+    generation_sec = generate_scenario(
+        net_file=net_file,
+        charging_station_file=charging_station_file,
+        scenario_path=scenario_path,
+        vehicles=vehicles,
+        seed=seed,
+    )
+
+    # libsumo allows a single simulation per process and the peak RSS has to
+    # belong to this case only, so every simulation gets a fresh process
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(processes=1) as pool:
+        simulation = pool.apply(
+            measure_simulation,
+            (
+                scenario_path,
+                set(station_ids[: max(1, len(station_ids) // 4)]),
+                percent_of_hydrogen_cars,
+                end_time_sec,
+            ),
+        )
+
+    return {
+        "edges": len(TripNetwork(net_file=net_file, vehicle_class="passenger")),
+        "stations": len(station_ids),
+        "generation_sec": generation_sec,
+        **simulation,
+    }
+
+
+@app.command()
+def run(
+    work_path: Annotated[Path, typer.Argument()],
+    results_file: Annotated[Path, typer.Option()] = Path("benchmark_results.json"),
+    kinds: Annotated[str, typer.Option()] = "grid,spider",
+    sizes: Annotated[str, typer.Option()] = "10,20,40",
+    vehicle_counts: Annotated[str, typer.Option()] = "1000,10000,50000",
+    stations: Annotated[int, typer.Option()] = 20,
+    percent_of_hydrogen_cars: Annotated[float, typer.Option()] = 0.1,
+    end_time_sec: Annotated[int, typer.Option()] = 8 * 3600,
+    seed: Annotated[int, typer.Option()] = 42,
+) -> None:
+    """
+    Generate synthetic networks of every kind and size, run a bounded
+    simulation for every vehicle count and write the measurements to
+    --results-file.
+    """
+    cases: dict[str, dict] = {}
+    for kind in [NetworkKind(kind) for kind in kinds.split(",")]:
+        for size in [int(size) for size in sizes.split(",")]:
+            for vehicles in [int(count) for count in vehicle_counts.split(",")]:
+                case = f"{kind.value}_{size}/vehicles_{vehicles}"
+                logger.info(f"Benchmark {case}")
+                cases[case] = run_case(
+                    work_path=work_path,
+                    kind=kind,
+                    size=size,
+                    vehicles=vehicles,
+                    stations=stations,
+                    percent_of_hydrogen_cars=percent_of_hydrogen_cars,
+                    end_time_sec=end_time_sec,
+                    seed=seed,
+                )
+
+    results = {
+        "environment": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+        },
+        "end_time_sec": end_time_sec,
+        "cases": cases,
+    }
+    results_file.write_text(json.dumps(results, indent=2, sort_keys=True))
+    logger.info(f"Results written to {results_file}")
+
+
+def flatten(values: dict, prefix: str = "") -> dict[str, float]:
+    flat: dict[str, float] = {}
+    for key, value in values.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, prefix=f"{prefix}{key}."))
+        elif isinstance(value, int | float):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+@app.command()
+def compare(
+    baseline_file: Annotated[Path, typer.Argument()],
+    results_file: Annotated[Path, typer.Argument()],
+    threshold: Annotated[float, typer.Option()] = 0.1,
+) -> None:
+    """
+    Print every measurement that changed by more than --threshold
+    (relative) between two result files.
+    """
+    baseline = flatten(json.loads(baseline_file.read_text())["cases"])
+    results = flatten(json.loads(results_file.read_text())["cases"])
+    for name in sorted(baseline.keys() & results.keys()):
+        before, after = baseline[name], results[name]
+        change = (after - before) / before if before else 0.0
+        if abs(change) > threshold:
+            print(f"{name}: {before:.4g} -> {after:.4g} ({change:+.0%})")
+
+
+if __name__ == "__main__":
+    app()
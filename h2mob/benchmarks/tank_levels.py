@@ -0,0 +1,139 @@
+import json
+import tempfile
+
+from pathlib import Path
+from typing import Annotated
+
+from h2mob.services.simulation import (
+    ConfigureVehicle,
+    ScenarioConfig,
+    ScenarioParser,
+    SumoClient,
+)
+from h2mob.services.vehicle_routes import VehicleRouteWriter
+from h2mob.settings.simulation import (
+    MG_IN_LITERS,
+    SimulationConfig,
+    get_simulation_config,
+)
+
+import typer
+
+from loguru import logger
+
+
+app = typer.Typer()
+
+
+def record_first_tank_levels(
+    scenario_path: Path,
+    config: SimulationConfig,
+    scenario_config: ScenarioConfig,
+    route_file: Path | None,
+    end_time_sec: int,
+) -> dict[str, float]:
+    # tank of every vehicle at its first subscription read, one step after
+    # it departed
+    client = SumoClient(logger=logger, backend=config.sumo_backend)  # type: ignore
+    command: list = ["sumo", "-c", scenario_path / config.sumocfg_file_path]
+    if route_file is not None:
+        command.extend(["--route-files", route_file])
+    client.start(command=command, port=None, label="tank_levels")
+    configure = (
+        ConfigureVehicle(
+            client=client,
+            logger=logger,  # type: ignore
+            simulation_config=config,
+            scenario_config=scenario_config,
+        )
+        if route_file is None
+        else None
+    )
+    tank_levels_mg: dict[str, float] = {}
+    try:
+        client.set_vehicle_class_to_custom1()
+        client.subscribe_simulation()
+        while client.get_time() < end_time_sec and client.get_min_expected_number():
+            client.simulation_step()
+            client.update_vehicle_states()
+            if configure is not None:
+                configure.step()
+            for vehicle_id, tank_mg in client.vehicles_tank_mg.items():
+                tank_levels_mg.setdefault(vehicle_id, tank_mg)
+    finally:
+        client.close()
+
+    return tank_levels_mg
+
+
+@app.command()
+def main(
+    scenario_path: Annotated[Path, typer.Argument()],
+    percent_of_hydrogen_cars: Annotated[float, typer.Option()] = 0.5,
+    end_time_sec: Annotated[int, typer.Option()] = 3600,
+    tolerance_liters: Annotated[float, typer.Option()] = 0.05,
+) -> None:
+    """
+    Start the vehicles of the first --end-time-sec from a baked route file
+    and through setParameter, and fail if their tank levels differ by more
+    than --tolerance-liters between both paths or from the fleet.
+    """
+    config = get_simulation_config()
+    # both paths have to draw the same fleet
+    config = config.model_copy(update={"seed": config.seed or 0})
+    scenario_config = ScenarioParser(
+        simulation_config=config,
+        scenario_path=scenario_path,
+        hydrogen_stations=set(),
+        percent_of_hydrogen_cars=percent_of_hydrogen_cars,
+    ).get_scenario_config(logger)  # type: ignore
+    fleet = scenario_config.vehicles
+
+    with tempfile.TemporaryDirectory() as tmp:
+        route_file = Path(tmp) / config.vehicle_route_file_path
+        VehicleRouteWriter(
+            vehicles=fleet,
+            source_route_file=scenario_path / config.route_file_path,
+            vehicle_type_file=scenario_path / config.vehicle_type_path,
+            vehicle_type_name=config.vehicle_type_name,
+            logger=logger,  # type: ignore
+        ).write(route_file=route_file)
+        baked = record_first_tank_levels(
+            scenario_path, config, scenario_config, route_file, end_time_sec
+        )
+    runtime = record_first_tank_levels(
+        scenario_path, config, scenario_config, None, end_time_sec
+    )
+
+    tank_liters = fleet.get_column("tank_liters")
+    index = fleet.get_index()
+    mismatches: dict[str, dict[str, float]] = {}
+    for vehicle_id in sorted(baked.keys() | runtime.keys()):
+        levels = {
+            "fleet": float(tank_liters[index[vehicle_id]]),
+            "baked": baked.get(vehicle_id, float("nan")) / MG_IN_LITERS,
+            "runtime": runtime.get(vehicle_id, float("nan")) / MG_IN_LITERS,
+        }
+        # nan never compares within the tolerance
+        if not (
+            abs(levels["baked"] - levels["runtime"]) <= tolerance_liters
+            and abs(levels["baked"] - levels["fleet"]) <= tolerance_liters
+        ):
+            mismatches[vehicle_id] = levels
+
+    print(
+        json.dumps(
+            {
+                "vehicles": len(baked.keys() | runtime.keys()),
+                "mismatches": len(mismatches),
+                "examples": dict(list(mismatches.items())[:10]),
+            },
+            indent=2,
+        )
+    )
+    if mismatches:
+        raise typer.Exit(code=1)
+
+
+if __name__ == "__main__":
+    app()
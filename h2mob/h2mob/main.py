@@ -1,29 +1,53 @@
 from pathlib import Path
-from typing import Annotated
+from typing import TYPE_CHECKING, Annotated
 
-from h2mob.services.generate_scenario import get_scenario_generator_service
-from h2mob.services.simulation import get_simulation_service
-from h2mob.settings.generator_config import get_scenario_conf
-from h2mob.settings.simulation import SimulationConfig, get_simulation_config
+from h2mob.settings.choices import SearchStrategy, SumoBackend
 
 import typer
 
-from loguru import logger
-from rich.traceback import install
 
+if TYPE_CHECKING:
+    from h2mob.services.sweep import SweepJobs
 
-install(show_locals=True)
+# every command imports the services and settings it uses on its own, so
+# --help and short commands do not pay for traci, numpy and pydantic
 app = typer.Typer()
 
 
+@app.callback()
+def callback(
+    rich_traceback: Annotated[
+        bool, typer.Option(envvar="H2MOB_RICH_TRACEBACK")
+    ] = False,
+) -> None:
+    if rich_traceback:
+        from rich.traceback import install
+
+        install(show_locals=True)
+
+
 @app.command()
 def generate_scenario(
     net_file: Annotated[Path, typer.Argument()],
     charging_station_file: Annotated[Path, typer.Argument()],
     total_vehicles: Annotated[int, typer.Argument()],
     scenario_path: Annotated[Path, typer.Argument()],
+    seed: Annotated[int | None, typer.Option()] = None,  # noqa
+    cache: Annotated[bool, typer.Option()] = True,
 ) -> None:
+    from h2mob.services.artifact_cache import get_artifact_cache
+    from h2mob.services.generate_scenario import get_scenario_generator_service
+    from h2mob.settings.cache import get_cache_config
+    from h2mob.settings.generator_config import get_scenario_conf
+
+    from loguru import logger
+
     config = get_scenario_conf()
+    if seed is not None:
+        config = config.model_copy(update={"seed": seed})
+    artifact_cache = (
+        get_artifact_cache(config=get_cache_config(), logger=logger) if cache else None
+    )
     service = get_scenario_generator_service(
         config=config,
         net_file=net_file,
@@ -31,29 +55,430 @@ def generate_scenario(
         total_vehicle_volume=total_vehicles,
         scenario_path=scenario_path,
         logger=logger,
+        cache=artifact_cache,
     )
     service.generate_scenario()
 
 
+def parse_hydrogen_stations(hydrogen_stations: str | None) -> set[str]:
+    return (
+        set()
+        if hydrogen_stations is None
+        else {station.strip() for station in hydrogen_stations.split(",")}
+    )
+
+
+@app.command()
+def build_station_index(
+    scenario_path: Annotated[Path, typer.Argument()],
+    hydrogen_stations: Annotated[str | None, typer.Option()] = None,  # noqa
+) -> None:
+    from h2mob.services.artifact_cache import get_artifact_cache
+    from h2mob.services.simulation import ScenarioParser
+    from h2mob.services.station_index import get_station_index
+    from h2mob.settings.cache import get_cache_config
+    from h2mob.settings.simulation import SimulationConfig, get_simulation_config
+
+    from loguru import logger
+
+    config: SimulationConfig = get_simulation_config()
+    scenario_parser = ScenarioParser(
+        simulation_config=config,
+        scenario_path=scenario_path,
+        hydrogen_stations=parse_hydrogen_stations(hydrogen_stations),
+        percent_of_hydrogen_cars=0.0,
+    )
+    fuel_stations, hstations = scenario_parser.get_fuel_stations()
+    get_station_index(
+        scenario_path=scenario_path,
+        simulation_config=config,
+        fuel_stations=fuel_stations,
+        hydrogen_stations=hstations,
+        logger=logger,
+        rebuild=True,
+        cache=get_artifact_cache(config=get_cache_config(), logger=logger),
+    )
+
+
 @app.command()
 def run(
     scenario_path: Annotated[Path, typer.Argument()],
     percent_of_hydrogen_cars: Annotated[float, typer.Argument()],
     hydrogen_stations: Annotated[str | None, typer.Option()] = None,  # noqa
+    backend: Annotated[SumoBackend | None, typer.Option()] = None,  # noqa
+    profile: Annotated[bool, typer.Option()] = False,
+    record_trace: Annotated[bool, typer.Option()] = False,
+    telemetry_port: Annotated[int | None, typer.Option()] = None,  # noqa
 ) -> None:
-    hstation: set[str] = (
-        set()
-        if hydrogen_stations is None
-        else {station.strip() for station in hydrogen_stations.split(",")}
-    )
+    from h2mob.services.artifact_cache import get_artifact_cache
+    from h2mob.services.simulation import Service, get_simulation_service
+    from h2mob.settings.cache import get_cache_config
+    from h2mob.settings.simulation import SimulationConfig, get_simulation_config
+
+    from loguru import logger
+
+    hstation: set[str] = parse_hydrogen_stations(hydrogen_stations)
     logger.info(f"hydrogen stations {hstation}")
     config: SimulationConfig = get_simulation_config()
+    if backend is not None:
+        config = config.model_copy(update={"sumo_backend": backend})
+    if profile:
+        config = config.model_copy(update={"profile": True})
+    if record_trace:
+        config = config.model_copy(update={"record_traci_trace": True})
+    if telemetry_port is not None:
+        config = config.model_copy(update={"telemetry_port": telemetry_port})
     service: Service = get_simulation_service(
         logger=logger,
         percent_of_hydrogen_cars=percent_of_hydrogen_cars,
         hydrogen_stations=hstation,
         simulation_config=config,
         scenario_path=scenario_path,
+        cache=get_artifact_cache(config=get_cache_config(), logger=logger),
+    )
+    service.run()
+
+
+def parse_sweep_jobs(
+    hydrogen_shares: str | None,
+    station_sets: str | None,
+    combinations_file: Path | None,
+) -> "SweepJobs":
+    from h2mob.services.sweep import build_sweep_grid, load_sweep_jobs
+
+    jobs: SweepJobs = []
+    if hydrogen_shares is not None:
+        shares = [float(share) for share in hydrogen_shares.split(",")]
+        sets = (
+            [set()]
+            if station_sets is None
+            else [parse_hydrogen_stations(s) for s in station_sets.split(";")]
+        )
+        jobs.extend(build_sweep_grid(hydrogen_shares=shares, station_sets=sets))
+    if combinations_file is not None:
+        jobs.extend(load_sweep_jobs(combinations_file=combinations_file))
+    if not jobs:
+        raise typer.BadParameter("pass --hydrogen-shares or --combinations-file")
+
+    return jobs
+
+
+@app.command()
+def sweep(
+    scenario_path: Annotated[Path, typer.Argument()],
+    hydrogen_shares: Annotated[str | None, typer.Option()] = None,  # noqa
+    station_sets: Annotated[str | None, typer.Option()] = None,  # noqa
+    combinations_file: Annotated[Path | None, typer.Option()] = None,  # noqa
+    workers: Annotated[int | None, typer.Option()] = None,  # noqa
+    base_port: Annotated[int, typer.Option()] = 8813,
+    backend: Annotated[SumoBackend | None, typer.Option()] = None,  # noqa
+) -> None:
+    """
+    Run every combination of --hydrogen-shares (comma separated) and
+    --station-sets (semicolon separated, e.g. "cs_0,cs_1;cs_7") and/or
+    the combinations listed in a JSON --combinations-file.
+    """
+    from h2mob.services.artifact_cache import get_artifact_cache
+    from h2mob.services.sweep import get_sweep_service
+    from h2mob.settings.cache import get_cache_config
+    from h2mob.settings.simulation import SimulationConfig, get_simulation_config
+
+    from loguru import logger
+
+    jobs = parse_sweep_jobs(
+        hydrogen_shares=hydrogen_shares,
+        station_sets=station_sets,
+        combinations_file=combinations_file,
+    )
+    config: SimulationConfig = get_simulation_config()
+    if backend is not None:
+        config = config.model_copy(update={"sumo_backend": backend})
+    service = get_sweep_service(
+        logger=logger,
+        simulation_config=config,
+        scenario_path=scenario_path,
+        jobs=jobs,
+        workers=workers,
+        base_port=base_port,
+        cache=get_artifact_cache(config=get_cache_config(), logger=logger),
+    )
+    service.run()
+
+
+@app.command()
+def monte_carlo(
+    scenario_path: Annotated[Path, typer.Argument()],
+    percent_of_hydrogen_cars: Annotated[float, typer.Argument()],
+    hydrogen_stations: Annotated[str | None, typer.Option()] = None,  # noqa
+    min_replicas: Annotated[int | None, typer.Option()] = None,  # noqa
+    max_replicas: Annotated[int | None, typer.Option()] = None,  # noqa
+    workers: Annotated[int | None, typer.Option()] = None,  # noqa
+    base_port: Annotated[int, typer.Option()] = 8813,
+    backend: Annotated[SumoBackend | None, typer.Option()] = None,  # noqa
+) -> None:
+    """
+    Run seeded replicas of one configuration in parallel until the confidence
+    intervals of the station KPIs are within the tolerance, or --max-replicas.
+    """
+    from h2mob.services.artifact_cache import get_artifact_cache
+    from h2mob.services.monte_carlo import get_monte_carlo_service
+    from h2mob.services.sweep import SweepJob
+    from h2mob.settings.cache import get_cache_config
+    from h2mob.settings.monte_carlo import get_monte_carlo_config
+    from h2mob.settings.outputs import get_output_config
+    from h2mob.settings.simulation import SimulationConfig, get_simulation_config
+
+    from loguru import logger
+
+    monte_carlo_config = get_monte_carlo_config()
+    if min_replicas is not None:
+        monte_carlo_config = monte_carlo_config.model_copy(
+            update={"min_replicas": min_replicas}
+        )
+    if max_replicas is not None:
+        monte_carlo_config = monte_carlo_config.model_copy(
+            update={"max_replicas": max_replicas}
+        )
+    config: SimulationConfig = get_simulation_config()
+    if backend is not None:
+        config = config.model_copy(update={"sumo_backend": backend})
+    service = get_monte_carlo_service(
+        logger=logger,
+        simulation_config=config,
+        output_config=get_output_config(),
+        monte_carlo_config=monte_carlo_config,
+        scenario_path=scenario_path,
+        job=SweepJob(
+            percent_of_hydrogen_cars=percent_of_hydrogen_cars,
+            hydrogen_stations=parse_hydrogen_stations(hydrogen_stations),
+        ),
+        workers=workers,
+        base_port=base_port,
+        cache=get_artifact_cache(config=get_cache_config(), logger=logger),
+    )
+    service.run()
+
+
+@app.command()
+def surrogate(
+    scenario_path: Annotated[Path, typer.Argument()],
+    hydrogen_shares: Annotated[str | None, typer.Option()] = None,  # noqa
+    station_sets: Annotated[str | None, typer.Option()] = None,  # noqa
+    combinations_file: Annotated[Path | None, typer.Option()] = None,  # noqa
+    top: Annotated[int, typer.Option()] = 10,
+) -> None:
+    """
+    Estimate the station demand of the same combinations as sweep without
+    SUMO, from the routes, the fleet profiles and the calibrated consumption.
+    """
+    from h2mob.services.surrogate import get_surrogate_service
+    from h2mob.settings.simulation import get_simulation_config
+    from h2mob.settings.surrogate import get_surrogate_config
+
+    from loguru import logger
+
+    service = get_surrogate_service(
+        logger=logger,
+        simulation_config=get_simulation_config(),
+        surrogate_config=get_surrogate_config(),
+        scenario_path=scenario_path,
+        jobs=parse_sweep_jobs(
+            hydrogen_shares=hydrogen_shares,
+            station_sets=station_sets,
+            combinations_file=combinations_file,
+        ),
+        top=top,
+    )
+    service.run()
+
+
+@app.command()
+def calibrate_surrogate(
+    scenario_path: Annotated[Path, typer.Argument()],
+    output_folders: Annotated[list[Path], typer.Argument()],
+) -> None:
+    """
+    Fit the surrogate consumption and travel times to simulated runs of the
+    scenario and compare its station refuels with theirs.
+    """
+    from h2mob.services.surrogate import get_surrogate_calibration_service
+    from h2mob.settings.outputs import get_output_config
+    from h2mob.settings.simulation import get_simulation_config
+    from h2mob.settings.surrogate import get_surrogate_config
+
+    from loguru import logger
+
+    service = get_surrogate_calibration_service(
+        logger=logger,
+        simulation_config=get_simulation_config(),
+        surrogate_config=get_surrogate_config(),
+        output_config=get_output_config(),
+        scenario_path=scenario_path,
+        output_folders=output_folders,
+    )
+    service.run()
+
+
+@app.command()
+def search_stations(
+    scenario_path: Annotated[Path, typer.Argument()],
+    percent_of_hydrogen_cars: Annotated[float, typer.Argument()],
+    stations_count: Annotated[int, typer.Argument()],
+    strategy: Annotated[SearchStrategy, typer.Option()] = SearchStrategy.local,
+    workers: Annotated[int | None, typer.Option()] = None,  # noqa
+    top: Annotated[int, typer.Option()] = 10,
+) -> None:
+    """
+    Search the set of stations_count hydrogen stations with the shortest
+    detour and queue per refuel, scored by the surrogate.
+    """
+    from h2mob.services.station_search import get_station_search_service
+    from h2mob.settings.simulation import get_simulation_config
+    from h2mob.settings.station_search import get_station_search_config
+    from h2mob.settings.surrogate import get_surrogate_config
+
+    from loguru import logger
+
+    service = get_station_search_service(
+        logger=logger,
+        simulation_config=get_simulation_config(),
+        surrogate_config=get_surrogate_config(),
+        search_config=get_station_search_config(),
+        scenario_path=scenario_path,
+        percent_of_hydrogen_cars=percent_of_hydrogen_cars,
+        stations_count=stations_count,
+        strategy=strategy,
+        workers=workers,
+        top=top,
+    )
+    service.run()
+
+
+@app.command()
+def submit_jobs(
+    queue_file: Annotated[Path, typer.Argument()],
+    scenario_path: Annotated[Path, typer.Argument()],
+    hydrogen_shares: Annotated[str | None, typer.Option()] = None,  # noqa
+    station_sets: Annotated[str | None, typer.Option()] = None,  # noqa
+    combinations_file: Annotated[Path | None, typer.Option()] = None,  # noqa
+    seeds: Annotated[str | None, typer.Option()] = None,  # noqa
+) -> None:
+    """
+    Queue the same combinations as sweep in a SQLite queue_file on a
+    filesystem shared with the workers, each once per --seeds (comma
+    separated) if given.
+    """
+    from h2mob.services.artifact_cache import get_artifact_cache
+    from h2mob.services.job_queue import get_job_submit_service
+    from h2mob.settings.cache import get_cache_config
+    from h2mob.settings.job_queue import get_job_queue_config
+    from h2mob.settings.simulation import get_simulation_config
+
+    from loguru import logger
+
+    jobs = parse_sweep_jobs(
+        hydrogen_shares=hydrogen_shares,
+        station_sets=station_sets,
+        combinations_file=combinations_file,
+    )
+    if seeds is not None:
+        jobs = [
+            job.model_copy(update={"seed": int(seed)})
+            for job in jobs
+            for seed in seeds.split(",")
+        ]
+    service = get_job_submit_service(
+        logger=logger,
+        queue_file=queue_file,
+        queue_config=get_job_queue_config(),
+        simulation_config=get_simulation_config(),
+        scenario_path=scenario_path,
+        jobs=jobs,
+        cache=get_artifact_cache(config=get_cache_config(), logger=logger),
+    )
+    service.run()
+
+
+@app.command()
+def worker(
+    queue_file: Annotated[Path, typer.Argument()],
+    port: Annotated[int | None, typer.Option()] = None,  # noqa
+    exit_when_empty: Annotated[bool, typer.Option()] = False,
+    backend: Annotated[SumoBackend | None, typer.Option()] = None,  # noqa
+) -> None:
+    """
+    Run the jobs of queue_file one after another until it is interrupted,
+    or the queue is empty with --exit-when-empty. Start one per host or more
+    on hosts with spare cores.
+    """
+    from h2mob.services.job_queue import get_job_worker
+    from h2mob.settings.job_queue import get_job_queue_config
+    from h2mob.settings.simulation import SimulationConfig, get_simulation_config
+
+    from loguru import logger
+
+    config: SimulationConfig = get_simulation_config()
+    if backend is not None:
+        config = config.model_copy(update={"sumo_backend": backend})
+    service = get_job_worker(
+        logger=logger,
+        queue_file=queue_file,
+        queue_config=get_job_queue_config(),
+        simulation_config=config,
+        port=port,
+        exit_when_empty=exit_when_empty,
+    )
+    service.run()
+
+
+@app.command()
+def job_status(
+    queue_file: Annotated[Path, typer.Argument()],
+) -> None:
+    """
+    Show the jobs of queue_file by status, the throughput of the workers,
+    the estimated completion time, the running jobs and the failures.
+    """
+    from h2mob.services.job_queue import get_job_status_service
+    from h2mob.settings.job_queue import get_job_queue_config
+
+    service = get_job_status_service(
+        queue_file=queue_file,
+        queue_config=get_job_queue_config(),
+    )
+    service.run()
+
+
+@app.command()
+def convert_outputs(
+    output_folder: Annotated[Path, typer.Argument()],
+) -> None:
+    from h2mob.services.output_conversion import get_output_converter_service
+    from h2mob.settings.outputs import get_output_config
+
+    from loguru import logger
+
+    service = get_output_converter_service(
+        output_folder=output_folder,
+        config=get_output_config(),
+        logger=logger,
+    )
+    service.run()
+
+
+@app.command()
+def analyze(
+    output_folders: Annotated[list[Path], typer.Argument()],
+) -> None:
+    from h2mob.services.analysis import get_analysis_service
+    from h2mob.settings.outputs import get_output_config
+
+    from loguru import logger
+
+    service = get_analysis_service(
+        output_folders=output_folders,
+        config=get_output_config(),
+        logger=logger,
     )
     service.run()
 
@@ -0,0 +1,367 @@
+import json
+
+from abc import ABC, abstractmethod
+from logging import Logger
+from pathlib import Path
+
+from h2mob.services.fleet import Fleet
+from h2mob.services.output_conversion import (
+    FUEL_TYPES,
+    get_output_converter_service,
+    list_windows,
+    read_table,
+    read_vocabularies,
+)
+from h2mob.settings import outputs
+from h2mob.settings.outputs import OutputConfig
+from h2mob.settings.simulation import MG_IN_LITERS
+
+import numpy as np
+import rich
+
+from pydantic import BaseModel
+from rich.table import Table
+
+
+HOURS = 24
+
+
+class StationReport(BaseModel):
+    station: str
+    fuel_type: str
+    refuels: int
+    waiting_time_sec_total: float
+    waiting_time_sec_mean: float
+    charged_liters: float
+    refuels_per_hour: list[int]
+
+
+class RunReport(BaseModel):
+    output_folder: str
+    vehicles: dict[str, int]
+    refuels: dict[str, int]
+    stranded_vehicles: dict[str, int]
+    consumption_liters: dict[str, float]
+    consumption_liters_per_hour: dict[str, list[float]]
+    running_vehicles_per_hour: list[float]
+    stations: list[StationReport]
+    # KPIs of a run resumed from a snapshot only cover the time after it
+    resumed_from_sec: float | None = None
+
+
+class Stations:
+    def __init__(self, scenario_config: dict, vocabularies: dict[str, list]) -> None:
+        stations = [
+            *scenario_config["fuel_stations"],
+            *scenario_config["hydrogen_stations"],
+        ]
+        self.ids: list[str] = [station["id"] for station in stations]
+        self.fuel_types: list[str] = [station["fuel_type"] for station in stations]
+        index = {station_id: i for i, station_id in enumerate(self.ids)}
+        edge_index = {station["lane"]: i for i, station in enumerate(stations)}
+
+        # interned station and lane ids of the columnar tables -> station index,
+        # the trailing -1 maps missing values (interned as -1) to no station
+        self.by_station_id: np.ndarray = np.asarray(
+            [
+                *(
+                    index.get(station, -1)
+                    for station in vocabularies.get("station", [])
+                ),
+                -1,
+            ],
+            dtype=np.int32,
+        )
+        self.by_lane_id: np.ndarray = np.asarray(
+            [
+                *(
+                    edge_index.get(lane.rsplit("_", 1)[0], -1)
+                    for lane in vocabularies.get("lane", [])
+                ),
+                -1,
+            ],
+            dtype=np.int32,
+        )
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+class Service(ABC):
+    @abstractmethod
+    def run(self) -> None: ...
+
+
+class AnalysisService(Service):
+    def __init__(
+        self, output_folders: list[Path], config: OutputConfig, logger: Logger
+    ) -> None:
+        self.output_folders: list[Path] = output_folders
+        self.config: OutputConfig = config
+        self.logger: Logger = logger
+
+    def get_columnar_path(self, output_folder: Path) -> Path:
+        columnar_path = output_folder / self.config.columnar_path
+        if not (columnar_path / self.config.vocabulary_file).exists():
+            self.logger.info(f"Converting outputs of {output_folder}")
+            converter = get_output_converter_service(
+                output_folder=output_folder, config=self.config, logger=self.logger
+            )
+            converter.run()
+
+        return columnar_path
+
+    @staticmethod
+    def get_hours(time: np.ndarray) -> np.ndarray:
+        return np.minimum(time // 3600, HOURS - 1).astype(np.int64)
+
+    def analyze_charging(
+        self, columnar_path: Path, stations: Stations, vehicles: int
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        refuels_per_hour = np.zeros((len(stations), HOURS), dtype=np.int64)
+        charged_mg = np.zeros(len(stations))
+        table = read_table(
+            columnar_path,
+            "charging_stations",
+            columns=["time", "station", "vehicle", "energyCharged"],
+        )
+        if not table:
+            empty = np.zeros(0, dtype=np.int64)
+            return refuels_per_hour, charged_mg, empty, np.zeros(0)
+
+        station = stations.by_station_id[table["station"]]
+        known = station >= 0
+        np.add.at(charged_mg, station[known], table["energyCharged"][known])
+
+        # a refuel is a (station, vehicle) pair, it starts at its first step,
+        # rows without a vehicle (interned as -1) would count for the
+        # previous station
+        known &= table["vehicle"] >= 0
+        session = station[known].astype(np.int64) * vehicles + table["vehicle"][known]
+        time = table["time"][known]
+        order = np.lexsort((time, session))
+        sessions, first = np.unique(session[order], return_index=True)
+        session_start = time[order][first]
+        np.add.at(
+            refuels_per_hour,
+            (sessions // vehicles, self.get_hours(session_start)),
+            1,
+        )
+
+        return refuels_per_hour, charged_mg, sessions, session_start
+
+    def analyze_battery(
+        self,
+        columnar_path: Path,
+        stations: Stations,
+        vehicles: int,
+        sessions: np.ndarray,
+        session_start: np.ndarray,
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        waiting_sec = np.zeros(len(stations))
+        consumption_mg = np.zeros((len(FUEL_TYPES), HOURS))
+        lowest_tank_mg = np.full(vehicles, np.inf)
+        step_length: float | None = None
+
+        # one time window at a time keeps the memory bounded by the window size
+        for window in list_windows(columnar_path, "battery"):
+            table = read_table(
+                columnar_path,
+                "battery",
+                windows=[window],
+                columns=[
+                    "time",
+                    "vehicle",
+                    "fuel_type",
+                    "station",
+                    "lane",
+                    "speed",
+                    "energyConsumed",
+                    "actualBatteryCapacity",
+                ],
+            )
+            if step_length is None:
+                times = np.unique(table["time"])
+                step_length = float(np.min(np.diff(times))) if len(times) > 1 else 1.0
+
+            fuel_type = table["fuel_type"]
+            known = fuel_type >= 0
+            np.add.at(
+                consumption_mg,
+                (fuel_type[known], self.get_hours(table["time"][known])),
+                table["energyConsumed"][known],
+            )
+            vehicle = table["vehicle"]
+            known = vehicle >= 0
+            np.minimum.at(
+                lowest_tank_mg, vehicle[known], table["actualBatteryCapacity"][known]
+            )
+
+            # vehicles halted on a station edge before they charge there are
+            # queuing for the station, others only pass or stop at a light
+            charging = stations.by_station_id[table["station"]] >= 0
+            station_edge = stations.by_lane_id[table["lane"]]
+            halted = np.flatnonzero(
+                (table["speed"] < self.config.halted_speed_threshold)
+                & ~charging
+                & (station_edge >= 0)
+                & known
+            )
+            session = station_edge[halted].astype(np.int64) * vehicles + vehicle[halted]
+            position = np.minimum(
+                np.searchsorted(sessions, session), max(len(sessions) - 1, 0)
+            )
+            waiting = (
+                halted[
+                    (sessions[position] == session)
+                    & (table["time"][halted] < session_start[position])
+                ]
+                if len(sessions)
+                else halted[:0]
+            )
+            waiting_sec += (
+                np.bincount(station_edge[waiting], minlength=len(stations))
+                * step_length
+            )
+
+        return waiting_sec, consumption_mg, lowest_tank_mg
+
+    def analyze_summary(self, columnar_path: Path) -> list[float]:
+        table = read_table(columnar_path, "summary", columns=["time", "running"])
+        if not table:
+            return [0.0] * HOURS
+
+        hours = self.get_hours(table["time"])
+        running = np.bincount(hours, weights=table["running"], minlength=HOURS)
+        steps = np.maximum(np.bincount(hours, minlength=HOURS), 1)
+        return (running / steps).round(1).tolist()
+
+    def analyze(self, output_folder: Path) -> RunReport:
+        columnar_path = self.get_columnar_path(output_folder)
+        vocabularies = read_vocabularies(columnar_path, self.config)
+        with (output_folder / outputs.SCENARIO_CONFIG_OUTPUT).open() as f:
+            scenario_config = json.load(f)
+
+        stations = Stations(scenario_config, vocabularies)
+        fuel_names = [fuel_type.value for fuel_type in FUEL_TYPES]
+        vehicle_fuel = (
+            Fleet.load(output_folder / outputs.FLEET_OUTPUT)
+            .get_fuel_type_ids()
+            .astype(np.int64)
+        )
+        vehicles = max(len(vocabularies.get("vehicle", [])), 1)
+
+        refuels_per_hour, charged_mg, sessions, session_start = self.analyze_charging(
+            columnar_path, stations, vehicles
+        )
+        waiting_sec, consumption_mg, lowest_tank_mg = self.analyze_battery(
+            columnar_path, stations, vehicles, sessions, session_start
+        )
+        refueled_vehicles = sessions % vehicles
+
+        # vehicles past the scenario ones have no fuel type
+        refueled_vehicles = refueled_vehicles[refueled_vehicles < len(vehicle_fuel)]
+        refuels = np.bincount(
+            vehicle_fuel[refueled_vehicles], minlength=len(fuel_names)
+        )
+        stranded = np.bincount(
+            vehicle_fuel[lowest_tank_mg[: len(vehicle_fuel)] <= 0],
+            minlength=len(fuel_names),
+        )
+        station_refuels = refuels_per_hour.sum(axis=1)
+        resumed_from_sec = scenario_config.get("resumed_from_sec")
+        if resumed_from_sec is not None:
+            self.logger.warning(
+                f"{output_folder} resumed from a snapshot, "
+                f"its KPIs start at {resumed_from_sec}s"
+            )
+
+        return RunReport(
+            output_folder=str(output_folder),
+            vehicles=dict(
+                zip(
+                    fuel_names,
+                    np.bincount(vehicle_fuel, minlength=len(fuel_names)).tolist(),
+                )
+            ),
+            refuels=dict(zip(fuel_names, refuels.tolist())),
+            stranded_vehicles=dict(zip(fuel_names, stranded.tolist())),
+            consumption_liters=dict(
+                zip(fuel_names, (consumption_mg.sum(axis=1) / MG_IN_LITERS).tolist())
+            ),
+            consumption_liters_per_hour={
+                fuel_name: (consumption_mg[i] / MG_IN_LITERS).round(2).tolist()
+                for i, fuel_name in enumerate(fuel_names)
+            },
+            running_vehicles_per_hour=self.analyze_summary(columnar_path),
+            stations=[
+                StationReport(
+                    station=station_id,
+                    fuel_type=stations.fuel_types[i],
+                    refuels=int(station_refuels[i]),
+                    waiting_time_sec_total=float(waiting_sec[i]),
+                    waiting_time_sec_mean=float(
+                        waiting_sec[i] / max(station_refuels[i], 1)
+                    ),
+                    charged_liters=float(charged_mg[i] / MG_IN_LITERS),
+                    refuels_per_hour=refuels_per_hour[i].tolist(),
+                )
+                for i, station_id in enumerate(stations.ids)
+            ],
+            resumed_from_sec=resumed_from_sec,
+        )
+
+    def print_reports(self, reports: list[RunReport]) -> None:
+        table = Table(title="Simulation KPIs")
+        table.add_column("KPI")
+        for report in reports:
+            table.add_column(Path(report.output_folder).name, justify="right")
+
+        for fuel_type in FUEL_TYPES:
+            name = fuel_type.value
+            rows = {
+                f"{name} vehicles": [r.vehicles[name] for r in reports],
+                f"{name} refuels": [r.refuels[name] for r in reports],
+                f"{name} stranded": [r.stranded_vehicles[name] for r in reports],
+                f"{name} consumption l": [
+                    f"{r.consumption_liters[name]:.0f}" for r in reports
+                ],
+                f"{name} mean wait s": [
+                    f"{self.mean_waiting_time(r, name):.1f}" for r in reports
+                ],
+            }
+            for kpi, values in rows.items():
+                table.add_row(kpi, *[str(value) for value in values])
+        if any(r.resumed_from_sec is not None for r in reports):
+            table.add_row(
+                "resumed from s",
+                *[
+                    "-" if r.resumed_from_sec is None else f"{r.resumed_from_sec:.0f}"
+                    for r in reports
+                ],
+            )
+
+        rich.print(table)
+
+    @staticmethod
+    def mean_waiting_time(report: RunReport, fuel_type: str) -> float:
+        stations = [s for s in report.stations if s.fuel_type == fuel_type]
+        refuels = sum(s.refuels for s in stations)
+        waiting = sum(s.waiting_time_sec_total for s in stations)
+        return waiting / max(refuels, 1)
+
+    def run(self) -> None:
+        reports: list[RunReport] = []
+        for output_folder in self.output_folders:
+            report = self.analyze(output_folder)
+            with (output_folder / self.config.report_file).open(mode="w") as f:
+                f.write(report.model_dump_json(indent=2))
+            reports.append(report)
+
+        self.print_reports(reports)
+
+
+def get_analysis_service(
+    output_folders: list[Path], config: OutputConfig, logger: Logger
+) -> Service:
+    return AnalysisService(output_folders=output_folders, config=config, logger=logger)
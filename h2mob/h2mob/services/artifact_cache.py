@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+import shutil
+import stat
+import tempfile
+
+from logging import Logger
+from pathlib import Path
+
+from h2mob.settings.cache import CacheConfig
+
+
+# bump when the layout or the content of cached artifacts changes
+CACHE_VERSION = 1
+
+
+class ArtifactCache:
+    def __init__(self, config: CacheConfig, logger: Logger) -> None:
+        self.artifacts_path: Path = config.cache_path / "artifacts"
+        self.hashes_file: Path = config.cache_path / "file_hashes.json"
+        self.budget_bytes: int = config.cache_budget_bytes
+        self.logger: Logger = logger
+        self.artifacts_path.mkdir(parents=True, exist_ok=True)
+
+    def load_file_hashes(self) -> dict[str, str]:
+        if not self.hashes_file.exists():
+            return {}
+
+        with self.hashes_file.open() as f:
+            return json.load(f)
+
+    def save_file_hashes(self, file_hashes: dict[str, str]) -> None:
+        tmp_file = self.hashes_file.with_suffix(f".{os.getpid()}.tmp")
+        with tmp_file.open(mode="w") as f:
+            json.dump(file_hashes, f)
+        os.replace(tmp_file, self.hashes_file)
+
+    def hash_files(self, files: list[Path]) -> list[str]:
+        # hashing a large net takes a while, the digest is reused as long as
+        # the file keeps its size and modification time
+        file_hashes = self.load_file_hashes()
+        digests: list[str] = []
+        for file in files:
+            file_stat = file.stat()
+            memo_key = f"{file.resolve()}:{file_stat.st_size}:{file_stat.st_mtime_ns}"
+            if memo_key not in file_hashes:
+                with file.open(mode="rb") as f:
+                    digest = hashlib.file_digest(f, "sha256").hexdigest()
+                file_hashes[memo_key] = digest
+            digests.append(file_hashes[memo_key])
+
+        self.save_file_hashes(file_hashes)
+        return digests
+
+    def get_key(self, kind: str, files: list[Path], parameters: dict) -> str:
+        content = json.dumps(
+            {
+                "version": CACHE_VERSION,
+                "kind": kind,
+                "files": self.hash_files(files),
+                "parameters": parameters,
+            },
+            sort_keys=True,
+            default=str,
+        )
+        return f"{kind}_{hashlib.sha256(content.encode()).hexdigest()}"
+
+    def get(self, key: str) -> Path | None:
+        entry = self.artifacts_path / key
+        if not entry.is_dir():
+            return None
+
+        # the entry mtime is its last use for the LRU eviction
+        os.utime(entry)
+        self.logger.info(f"Cache hit {key}")
+        return entry
+
+    @staticmethod
+    def link(src: Path, dst: Path) -> None:
+        dst.unlink(missing_ok=True)
+        try:
+            os.link(src, dst)
+        except OSError:
+            # the cache lives on another file system
+            shutil.copy2(src, dst)
+
+    def restore(self, entry: Path, files: dict[str, Path]) -> None:
+        for name, dst in files.items():
+            self.link(entry / name, dst)
+
+    def put(self, key: str, files: dict[str, Path]) -> Path:
+        entry = self.artifacts_path / key
+        tmp_entry = Path(tempfile.mkdtemp(dir=self.artifacts_path, prefix=".tmp_"))
+        for name, src in files.items():
+            self.link(src, tmp_entry / name)
+            # cached files are shared by hard links, they must not change
+            (tmp_entry / name).chmod(stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+
+        try:
+            os.rename(tmp_entry, entry)
+        except OSError:
+            # another process stored the same artifact first
+            shutil.rmtree(tmp_entry)
+
+        self.logger.info(f"Cached {key}")
+        self.evict(keep=entry)
+        return entry
+
+    @staticmethod
+    def get_size(entry: Path) -> int:
+        return sum(file.stat().st_size for file in entry.iterdir())
+
+    def evict(self, keep: Path) -> None:
+        entries = sorted(
+            (
+                entry
+                for entry in self.artifacts_path.iterdir()
+                if entry.is_dir() and not entry.name.startswith(".tmp_")
+            ),
+            key=lambda entry: entry.stat().st_mtime,
+        )
+        sizes = {entry: self.get_size(entry) for entry in entries}
+        total_bytes = sum(sizes.values())
+
+        for entry in entries:
+            if total_bytes <= self.budget_bytes:
+                break
+            if entry == keep:
+                continue
+            shutil.rmtree(entry)
+            total_bytes -= sizes[entry]
+            self.logger.info(f"Evicted {entry.name} from the cache")
+
+
+def get_artifact_cache(config: CacheConfig, logger: Logger) -> ArtifactCache | None:
+    if not config.cache_enabled:
+        return None
+
+    return ArtifactCache(config=config, logger=logger)
@@ -0,0 +1,15 @@
+import importlib
+
+from types import ModuleType
+
+from h2mob.settings.choices import SumoBackend
+
+
+def load_sumo_backend(backend: SumoBackend) -> ModuleType:
+    # libsumo ships with SUMO itself and is only needed when it is selected
+    try:
+        return importlib.import_module(backend.value)
+    except ImportError as error:
+        raise RuntimeError(
+            f"SUMO backend {backend.value} is not available: {error}"
+        ) from error
@@ -0,0 +1,211 @@
+import heapq
+import os
+import subprocess
+import threading
+
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from logging import Logger
+from pathlib import Path
+from typing import IO, TextIO
+from xml.etree import ElementTree
+
+
+RoutedElement = tuple[float, int, str]  # depart, shard, xml
+
+
+class RouteShard:
+    def __init__(self, index: int, trip_file: Path, route_file: Path) -> None:
+        self.index: int = index
+        self.trip_file: Path = trip_file
+        self.route_file: Path = route_file
+        self.attempts: int = 0
+
+    def cleanup(self) -> None:
+        alternatives = self.route_file.with_suffix(".alt.xml")
+        for path in (self.trip_file, self.route_file, alternatives):
+            path.unlink(missing_ok=True)
+
+
+def iter_top_level_elements(xml_file: Path) -> Iterator[ElementTree.Element]:
+    root: ElementTree.Element | None = None
+    depth = 0
+
+    for event, element in ElementTree.iterparse(xml_file, events=("start", "end")):
+        if event == "start":
+            if root is None:
+                root = element
+            depth += 1
+            continue
+
+        depth -= 1
+        if depth == 1:
+            yield element
+            root.clear()  # type: ignore
+
+
+def to_xml(element: ElementTree.Element) -> str:
+    element.tail = None
+    ElementTree.indent(element, space="    ", level=1)
+    return f"    {ElementTree.tostring(element, encoding='unicode')}\n"
+
+
+class ShardedDuarouter:
+    def __init__(
+        self,
+        net_file: Path,
+        vehicle_type_file: Path,
+        shard_window_sec: int,
+        workers: int | None,
+        retries: int,
+        timeout_sec: int | None,
+        logger: Logger,
+    ) -> None:
+        self.net_file: Path = net_file
+        self.vehicle_type_file: Path = vehicle_type_file
+        self.shard_window_sec: int = shard_window_sec
+        self.retries: int = retries
+        self.timeout_sec: int | None = timeout_sec
+        self.logger: Logger = logger
+        cpus = os.cpu_count() or 1
+        self.workers: int = max(1, min(workers or cpus, cpus))
+        self.routing_threads: int = max(1, cpus // self.workers)
+
+    def split_trips(self, trip_file: Path) -> list[RouteShard]:
+        shards: dict[int, RouteShard] = {}
+        outputs: dict[int, TextIO] = {}
+
+        try:
+            for element in iter_top_level_elements(trip_file):
+                depart = element.get("depart")
+                window = 0 if depart is None else int(float(depart))
+                window //= self.shard_window_sec
+                if window not in shards:
+                    shard = RouteShard(
+                        index=window,
+                        trip_file=trip_file.with_name(f"trips.shard_{window}.xml"),
+                        route_file=trip_file.with_name(f"routes.shard_{window}.xml"),
+                    )
+                    shards[window] = shard
+                    outputs[window] = shard.trip_file.open(mode="w")
+                    outputs[window].write("<routes>\n")
+                outputs[window].write(to_xml(element))
+        finally:
+            for out in outputs.values():
+                out.write("</routes>\n")
+                out.close()
+
+        return [shards[window] for window in sorted(shards)]
+
+    def build_command(self, shard: RouteShard) -> list[str]:
+        return [
+            "duarouter",
+            "-n",
+            str(self.net_file),
+            "-t",
+            str(shard.trip_file),
+            "-o",
+            str(shard.route_file),
+            "--additional-files",
+            str(self.vehicle_type_file),
+            "--routing-threads",
+            str(self.routing_threads),
+            "--ignore-errors",
+            "--verbose",
+        ]
+
+    def drain(self, stream: IO[str], shard: RouteShard, is_error: bool) -> None:
+        for line in stream:
+            message = f"[shard {shard.index}] {line.rstrip()}"
+            if is_error:
+                self.logger.warning(message)
+            else:
+                self.logger.info(message)
+
+    def route_shard(self, shard: RouteShard) -> RouteShard:
+        while True:
+            shard.attempts += 1
+            with subprocess.Popen(
+                self.build_command(shard),
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+            ) as process:
+                # both pipes are drained at the same time, a full stderr pipe
+                # would otherwise block duarouter while stdout is being read
+                readers = [
+                    threading.Thread(
+                        target=self.drain, args=(process.stdout, shard, False)
+                    ),
+                    threading.Thread(
+                        target=self.drain, args=(process.stderr, shard, True)
+                    ),
+                ]
+                for reader in readers:
+                    reader.start()
+                try:
+                    return_code = process.wait(timeout=self.timeout_sec)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+                    return_code = process.wait()
+                for reader in readers:
+                    reader.join()
+
+            if return_code == 0:
+                return shard
+            if shard.attempts > self.retries:
+                raise RuntimeError(
+                    f"duarouter failed on shard {shard.index} "
+                    f"after {shard.attempts} attempts"
+                )
+            self.logger.warning(
+                f"duarouter failed on shard {shard.index} "
+                f"with code {return_code}, retrying"
+            )
+
+    def iter_routed(self, shard: RouteShard) -> Iterator[RoutedElement]:
+        for element in iter_top_level_elements(shard.route_file):
+            depart = element.get("depart")
+            if depart is not None:
+                yield float(depart), shard.index, to_xml(element)
+
+    def read_vehicle_types(self, shards: list[RouteShard]) -> list[str]:
+        vehicle_types: dict[str, str] = {}
+        for shard in shards:
+            for element in iter_top_level_elements(shard.route_file):
+                if element.tag != "vType":
+                    # duarouter writes the vehicle types before any vehicle
+                    break
+                vehicle_types.setdefault(element.attrib["id"], to_xml(element))
+
+        return list(vehicle_types.values())
+
+    def merge(self, shards: list[RouteShard], route_file: Path) -> None:
+        with route_file.open(mode="w") as out:
+            out.write('<?xml version="1.0" encoding="UTF-8"?>\n\n<routes>\n')
+            out.writelines(self.read_vehicle_types(shards))
+            for _, _, xml in heapq.merge(*(self.iter_routed(s) for s in shards)):
+                out.write(xml)
+            out.write("</routes>\n")
+
+    def route(self, trip_file: Path, route_file: Path) -> None:
+        shards = self.split_trips(trip_file)
+        self.logger.info(
+            f"Routing {len(shards)} shards on {self.workers} workers "
+            f"with {self.routing_threads} routing threads each"
+        )
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                futures = [executor.submit(self.route_shard, s) for s in shards]
+                for done, future in enumerate(as_completed(futures), start=1):
+                    shard = future.result()
+                    self.logger.info(
+                        f"[{done}/{len(shards)}] routed shard {shard.index} "
+                        f"in {shard.attempts} attempt(s)"
+                    )
+
+            self.merge(shards=shards, route_file=route_file)
+        finally:
+            for shard in shards:
+                shard.cleanup()
@@ -0,0 +1,142 @@
+import json
+
+from collections.abc import Iterator
+from pathlib import Path
+
+from h2mob.settings.simulation import FuelType, Vehicle, VehicleProfile
+
+import numpy as np
+
+
+FUEL_TYPES: list[FuelType] = list(FuelType)
+
+# every numeric Vehicle field is a per-vehicle column of the fleet
+COLUMN_DTYPES: dict[str, type] = {
+    name: np.int32 if field.annotation is int else np.float64
+    for name, field in Vehicle.model_fields.items()
+    if field.annotation in (int, float)
+}
+
+
+class Fleet:
+    def __init__(
+        self,
+        vehicle_ids: np.ndarray,
+        profile_ids: np.ndarray,
+        profiles: list[VehicleProfile],
+        columns: dict[str, np.ndarray] | None = None,
+        fleet_file: Path | None = None,
+    ) -> None:
+        self.vehicle_ids: np.ndarray = vehicle_ids
+        self.profile_ids: np.ndarray = profile_ids
+        self.profiles: list[VehicleProfile] = profiles
+        self.columns: dict[str, np.ndarray] = columns or {}
+        # columns of a loaded fleet are only read from the file when used
+        self.fleet_file: Path | None = fleet_file
+        self.index: dict[str, int] | None = None
+
+    @classmethod
+    def generate(
+        cls,
+        vehicle_ids: list[str],
+        profiles: list[VehicleProfile],
+        shares: list[float],
+        rng: np.random.Generator,
+    ) -> "Fleet":
+        size = len(vehicle_ids)
+        # every vehicle draws its profile independently with the given shares
+        profile_ids = np.searchsorted(
+            np.cumsum(shares[:-1]), rng.random(size), side="right"
+        ).astype(np.int8)
+        columns = {
+            name: np.zeros(size, dtype=dtype) for name, dtype in COLUMN_DTYPES.items()
+        }
+        for profile_id, profile in enumerate(profiles):
+            selected = np.flatnonzero(profile_ids == profile_id)
+            for name, values in profile.sample(rng=rng, size=len(selected)).items():
+                columns[name][selected] = values
+
+        return cls(
+            vehicle_ids=np.asarray(vehicle_ids, dtype=str),
+            profile_ids=profile_ids,
+            profiles=profiles,
+            columns=columns,
+        )
+
+    def __len__(self) -> int:
+        return len(self.vehicle_ids)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.vehicle_ids.tolist())
+
+    def __contains__(self, vehicle_id: str) -> bool:
+        return vehicle_id in self.get_index()
+
+    def get_index(self) -> dict[str, int]:
+        if self.index is None:
+            self.index = {
+                vehicle_id: i for i, vehicle_id in enumerate(self.vehicle_ids.tolist())
+            }
+        return self.index
+
+    def get_column(self, name: str) -> np.ndarray:
+        if name not in self.columns:
+            with np.load(self.fleet_file) as fleet:  # type: ignore
+                self.columns[name] = fleet[f"column_{name}"]
+        return self.columns[name]
+
+    def get_profile(self, vehicle_id: str) -> VehicleProfile:
+        return self.profiles[self.profile_ids[self.get_index()[vehicle_id]]]
+
+    def get_fuel_type(self, vehicle_id: str) -> FuelType:
+        return self.get_profile(vehicle_id).fuel_type
+
+    def get_charging_duration(self, vehicle_id: str) -> int:
+        i = self.get_index()[vehicle_id]
+        return int(self.get_column("charging_duration_seconds")[i])
+
+    def get_fuel_type_ids(self) -> np.ndarray:
+        # index into FUEL_TYPES for every vehicle, in fleet order
+        profile_fuel_types = np.asarray(
+            [FUEL_TYPES.index(profile.fuel_type) for profile in self.profiles],
+            dtype=np.int8,
+        )
+        return profile_fuel_types[self.profile_ids]
+
+    def get_vehicle_at(self, i: int) -> Vehicle:
+        profile = self.profiles[self.profile_ids[i]]
+        return Vehicle(
+            colour=profile.colour,
+            fuel_type=profile.fuel_type,
+            **{name: self.get_column(name)[i].item() for name in COLUMN_DTYPES},
+        )
+
+    def get_vehicle(self, vehicle_id: str) -> Vehicle:
+        return self.get_vehicle_at(self.get_index()[vehicle_id])
+
+    def save(self, fleet_file: Path) -> None:
+        profiles = [profile.model_dump(mode="json") for profile in self.profiles]
+        # read before the file is opened, a loaded fleet may be saved over itself
+        columns = {f"column_{name}": self.get_column(name) for name in COLUMN_DTYPES}
+        # the handle keeps numpy from appending .npz to the file name
+        with fleet_file.open(mode="wb") as f:
+            np.savez(
+                f,
+                vehicle_ids=self.vehicle_ids,
+                profile_ids=self.profile_ids,
+                profiles=np.asarray(json.dumps(profiles)),
+                **columns,
+            )
+
+    @classmethod
+    def load(cls, fleet_file: Path) -> "Fleet":
+        with np.load(fleet_file) as fleet:
+            return cls(
+                vehicle_ids=fleet["vehicle_ids"],
+                profile_ids=fleet["profile_ids"],
+                profiles=[
+                    VehicleProfile.model_validate(profile)
+                    for profile in json.loads(fleet["profiles"].item())
+                ],
+                fleet_file=fleet_file,
+            )
@@ -1,12 +1,16 @@
+import json
 import shutil
-import subprocess
 
 from abc import ABC, abstractmethod
 from logging import Logger
 from pathlib import Path
 
+from h2mob.services.artifact_cache import ArtifactCache
+from h2mob.services.duarouter import ShardedDuarouter
+from h2mob.services.trip_generation import TripGenerator, TripNetwork
 from h2mob.settings import generator_config
 
+import numpy as np
 import rich
 
 
@@ -34,6 +38,7 @@ class ScenarioGeneratorService(Service):
         net_file: Path,
         total_vehicle_volume: int,
         logger: Logger,
+        cache: ArtifactCache | None = None,
     ) -> None:
         self.net_file: Path = net_file
         self.charging_station_file: Path = charging_station_file
@@ -43,92 +48,53 @@ class ScenarioGeneratorService(Service):
         self.stop_time_sec = 24 * 3600
         self.config: generator_config.ScenarioConfig = config
         self.logger: Logger = logger
+        self.cache: ArtifactCache | None = cache
 
-    def build_random_trip_command(self, period: list[float]) -> str:
-        period_str = ",".join([str(p) for p in period])
-        script_path = self.config.sumo_home / "tools/randomTrips.py"
-        command = (
-            f"python {script_path.absolute()} "
-            f"--net-file {self.net_file} "
-            f"-o {self.scenario_path / self.config.trip_file_path} "
-            f"--begin {self.start_time_sec} "
-            f"--end {self.stop_time_sec} "
-            f"""--trip-attributes="type='{self.config.vehicle_type_name}'" """
-            f"-p {period_str} "
-            f"--max-distance {self.config.max_trip_distance_m} "
-            f"--min-distance {self.config.min_trip_distance_m} "
-            f"--prefix {self.config.prefix} "
-            f"--additional-files {self.scenario_path / self.config.vehicle_type_path} "
-            f"--random "
-            f"--verbose"
-        )
-        return command
-
-    def generate_random_trips(self, command: str) -> None:
-        with subprocess.Popen(
-            command,
-            shell=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            universal_newlines=True,
-        ) as process:
-            if process.stdout is None:
-                raise ValueError("stdout is None")
-            if process.stderr is None:
-                raise ValueError("sdterr is None")
-
-            for line in process.stdout:
-                rich.print(line)
-
-            process.stdout.close()
-            return_code = process.wait(timeout=10)  # 10 sec
-
-        if return_code != 0:
-            raise RuntimeError(
-                f"Error while generating random traffic:\n{process.stderr.read()}"
-            )
+    def get_seed(self) -> int:
+        if self.config.seed is not None:
+            return self.config.seed
 
-        rich.print("Successfully generated random traffic")
-        return None
-
-    def build_duarouter_command(self) -> str:
-        command: str = (
-            f"duarouter -n {self.scenario_path / self.config.net_path} "
-            f"-t {self.scenario_path / self.config.trip_file_path} "
-            f"-o {self.scenario_path / self.config.route_file_path} "
-            f"--additional-files {self.scenario_path / self.config.vehicle_type_path} "
-            "--routing-threads 20 "
-            f"--ignore-errors "
-            f"--verbose"
+        # logged so an unseeded scenario can still be reproduced
+        seed = int(np.random.SeedSequence().generate_state(1)[0])
+        self.logger.info(f"Generating trips with seed {seed}")
+        return seed
+
+    def generate_random_trips(self, periods: list[float], seed: int) -> None:
+        network = TripNetwork(
+            net_file=self.net_file, vehicle_class=self.config.trip_vehicle_class
         )
-        return command
-
-    def convert_trips_to_routes(self, command: str) -> None:
-        with subprocess.Popen(
-            args=command,
-            shell=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            universal_newlines=True,
-        ) as process:
-            if process.stdout is None:
-                raise ValueError("stdout is None")
-            if process.stderr is None:
-                raise ValueError("sdterr is None")
-
-            for line in process.stdout:
-                self.logger.info(line)
-
-            process.stdout.close()
-            return_code = process.wait(timeout=10)  # 10 sec
-
-        if return_code != 0:
-            raise RuntimeError(
-                f"Error while generating random traffic:\n{process.stderr.read()}"
-            )
+        generator = TripGenerator(
+            network=network,
+            min_trip_distance_m=self.config.min_trip_distance_m,
+            max_trip_distance_m=self.config.max_trip_distance_m,
+            weight_by_length=self.config.weight_trips_by_length,
+            seed=seed,
+            logger=self.logger,
+        )
+        generator.generate(
+            trip_file=self.scenario_path / self.config.trip_file_path,
+            periods=periods,
+            start_time_sec=self.start_time_sec,
+            prefix=self.config.prefix,
+            vehicle_type=self.config.vehicle_type_name,
+        )
+        rich.print("Successfully generated random traffic")
 
+    def convert_trips_to_routes(self) -> None:
+        router = ShardedDuarouter(
+            net_file=self.scenario_path / self.config.net_path,
+            vehicle_type_file=self.scenario_path / self.config.vehicle_type_path,
+            shard_window_sec=self.config.route_shard_window_sec,
+            workers=self.config.route_workers,
+            retries=self.config.route_retries,
+            timeout_sec=self.config.route_timeout_sec,
+            logger=self.logger,
+        )
+        router.route(
+            trip_file=self.scenario_path / self.config.trip_file_path,
+            route_file=self.scenario_path / self.config.route_file_path,
+        )
         rich.print("Successfully convert trips to routes")
-        return None
 
     def compute_periods(self) -> list[float]:
         periods: list[float] = []
@@ -155,18 +121,105 @@ class ScenarioGeneratorService(Service):
             dst=self.scenario_path / self.config.charging_stations_path,
         )
 
+    def get_cached_files(self) -> dict[str, Path]:
+        return {
+            self.config.trip_file_path: self.scenario_path / self.config.trip_file_path,
+            self.config.route_file_path: self.scenario_path
+            / self.config.route_file_path,
+        }
+
+    def get_cache_key(self, cache: ArtifactCache, seed: int) -> str:
+        # only the inputs that change the trips and the routes are part of the key
+        return cache.get_key(
+            kind="scenario",
+            files=[
+                self.net_file,
+                self.config.template_path / self.config.vehicle_type_path,
+            ],
+            parameters={
+                "total_vehicles": self.total_vehicle,
+                "seed": seed,
+                "start_time_sec": self.start_time_sec,
+                **self.config.model_dump(
+                    include={
+                        "volume_profile",
+                        "min_trip_distance_m",
+                        "max_trip_distance_m",
+                        "prefix",
+                        "trip_vehicle_class",
+                        "weight_trips_by_length",
+                        "vehicle_type_name",
+                    }
+                ),
+            },
+        )
+
+    def get_scenario_inputs(self, cache: ArtifactCache, cache_key: str) -> dict:
+        template_files = sorted(
+            file for file in self.config.template_path.rglob("*") if file.is_file()
+        )
+        return {
+            "cache_key": cache_key,
+            "template": dict(
+                zip(
+                    [str(file) for file in template_files],
+                    cache.hash_files(template_files),
+                    strict=True,
+                )
+            ),
+            "charging_stations": cache.hash_files([self.charging_station_file])[0],
+        }
+
+    def is_up_to_date(self, scenario_inputs: dict) -> bool:
+        inputs_file = self.scenario_path / self.config.scenario_inputs_file
+        if not inputs_file.exists():
+            return False
+        if not all(file.exists() for file in self.get_cached_files().values()):
+            return False
+
+        return json.loads(inputs_file.read_text()) == scenario_inputs
+
+    def save_scenario_inputs(self, scenario_inputs: dict) -> None:
+        inputs_file = self.scenario_path / self.config.scenario_inputs_file
+        inputs_file.write_text(json.dumps(scenario_inputs, indent=2))
+
     def generate_scenario(self) -> None:
-        self.logger.info("Generating trips")
+        seed = self.get_seed()
+        cache_key: str | None = None
+        scenario_inputs: dict | None = None
+        entry: Path | None = None
+        if self.cache is not None and self.config.seed is None:
+            # a drawn seed would make every run a new entry that is never hit
+            self.logger.info("Unseeded scenarios are not cached, pass --seed")
+        elif self.cache is not None:
+            cache_key = self.get_cache_key(cache=self.cache, seed=seed)
+            scenario_inputs = self.get_scenario_inputs(
+                cache=self.cache, cache_key=cache_key
+            )
+            # looked up before the directory is rebuilt, a scenario generated
+            # from the same inputs is left as it is
+            if self.is_up_to_date(scenario_inputs=scenario_inputs):
+                rich.print(f"{self.scenario_path} is up to date")
+                return
+            entry = self.cache.get(cache_key)
+
         self.build_scenario_directory()
-        periods: list[float] = self.compute_periods()
-        trip_command: str = self.build_random_trip_command(period=periods)
-        self.logger.info(f"trip command: {trip_command}")
-        self.generate_random_trips(command=trip_command)
+        if self.cache is not None and entry is not None:
+            self.cache.restore(entry=entry, files=self.get_cached_files())
+            rich.print("Reused cached trips and routes")
+        else:
+            self.logger.info("Generating trips")
+            periods: list[float] = self.compute_periods()
+            self.generate_random_trips(periods=periods, seed=seed)
+
+            self.logger.info("Generating routes")
+            self.convert_trips_to_routes()
+
+            if self.cache is not None and cache_key is not None:
+                self.cache.put(key=cache_key, files=self.get_cached_files())
 
-        self.logger.info("Generating routes")
-        duarouter_command: str = self.build_duarouter_command()
-        self.logger.info(f"duarouter command: {duarouter_command}")
-        self.convert_trips_to_routes(command=duarouter_command)
+        if scenario_inputs is not None:
+            self.save_scenario_inputs(scenario_inputs=scenario_inputs)
 
 
 def get_scenario_generator_service(
@@ -176,6 +229,7 @@ def get_scenario_generator_service(
     net_file: Path,
     total_vehicle_volume: int,
     logger: Logger,
+    cache: ArtifactCache | None = None,
 ) -> Service:
     return ScenarioGeneratorService(
         charging_station_file=charging_station_file,
@@ -184,4 +238,5 @@ def get_scenario_generator_service(
         net_file=net_file,
         total_vehicle_volume=total_vehicle_volume,
         logger=logger,
+        cache=cache,
     )
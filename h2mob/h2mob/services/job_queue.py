@@ -0,0 +1,555 @@
+import json
+import os
+import signal
+import socket
+import sqlite3
+import threading
+import time
+
+from abc import ABC, abstractmethod
+from collections.abc import Iterator
+from contextlib import contextmanager
+from enum import Enum
+from logging import Logger
+from pathlib import Path
+
+from h2mob.services.artifact_cache import ArtifactCache
+from h2mob.services.sweep import (
+    SweepJob,
+    SweepJobs,
+    prepare_station_indexes,
+    run_sweep_job,
+)
+from h2mob.settings.job_queue import JobQueueConfig
+from h2mob.settings.simulation import SimulationConfig
+
+import rich
+
+from pydantic import BaseModel
+from rich.table import Table
+
+
+class JobStatus(Enum):
+    queued = "queued"
+    running = "running"
+    done = "done"
+    failed = "failed"
+
+
+class QueuedJob(BaseModel):
+    id: int
+    scenario_path: Path
+    job: SweepJob
+    output_folder: Path
+    status: JobStatus
+    attempts: int
+    worker: str | None = None
+    started_at: float | None = None
+    error: str | None = None
+
+
+class QueueStatus(BaseModel):
+    jobs: dict[JobStatus, int]
+    running: list[QueuedJob]
+    failed: list[QueuedJob]
+    jobs_per_hour: float
+    eta_sec: float | None
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    scenario_path TEXT NOT NULL,
+    percent_of_hydrogen_cars REAL NOT NULL,
+    hydrogen_stations TEXT NOT NULL,
+    seed INTEGER,
+    output_folder TEXT,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_until REAL,
+    submitted_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    error TEXT
+)
+"""
+COLUMNS = (
+    "id, scenario_path, percent_of_hydrogen_cars, hydrogen_stations, seed, "
+    "output_folder, status, attempts, worker, started_at, error"
+)
+
+
+def get_job_output_folder(job_id: int, scenario_path: Path, job: SweepJob) -> Path:
+    stations = "_".join(sorted(job.hydrogen_stations))
+    name = (
+        f"out_job_{job_id}_hydrogen_cars_{job.percent_of_hydrogen_cars}"
+        f"_hydrogen_stations_{stations}"
+    )
+    if job.seed is not None:
+        name += f"_seed_{job.seed}"
+    return scenario_path / name
+
+
+class JobQueue:
+    # The broker is a single SQLite file on a filesystem shared by all hosts.
+    # The journal stays in its default rollback mode, WAL needs shared memory
+    # that network filesystems do not provide, and every change is a short
+    # BEGIN IMMEDIATE transaction, so claiming a job is atomic across hosts.
+    # Leases compare wall clock times of different hosts, their clocks have to
+    # be in sync well within job_lease_sec.
+    def __init__(self, queue_file: Path, config: JobQueueConfig) -> None:
+        self.config: JobQueueConfig = config
+        # autocommit, transactions are opened explicitly
+        self.connection: sqlite3.Connection = sqlite3.connect(
+            queue_file, timeout=config.job_queue_timeout_sec, isolation_level=None
+        )
+        self.connection.execute(SCHEMA)
+
+    def close(self) -> None:
+        self.connection.close()
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield self.connection
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+        self.connection.execute("COMMIT")
+
+    @staticmethod
+    def to_queued_job(row: tuple) -> QueuedJob:
+        (
+            job_id,
+            scenario_path,
+            percent_of_hydrogen_cars,
+            hydrogen_stations,
+            seed,
+            output_folder,
+            status,
+            attempts,
+            worker,
+            started_at,
+            error,
+        ) = row
+        return QueuedJob(
+            id=job_id,
+            scenario_path=Path(scenario_path),
+            job=SweepJob(
+                percent_of_hydrogen_cars=percent_of_hydrogen_cars,
+                hydrogen_stations=set(json.loads(hydrogen_stations)),
+                seed=seed,
+            ),
+            output_folder=Path(output_folder),
+            status=JobStatus(status),
+            attempts=attempts,
+            worker=worker,
+            started_at=started_at,
+            error=error,
+        )
+
+    def submit(self, scenario_path: Path, jobs: SweepJobs) -> list[int]:
+        # paths have to resolve the same way on every host
+        scenario_path = scenario_path.resolve()
+        job_ids: list[int] = []
+        with self.transaction() as connection:
+            for job in jobs:
+                cursor = connection.execute(
+                    "INSERT INTO jobs (scenario_path, percent_of_hydrogen_cars, "
+                    "hydrogen_stations, seed, status, submitted_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (
+                        str(scenario_path),
+                        job.percent_of_hydrogen_cars,
+                        json.dumps(sorted(job.hydrogen_stations)),
+                        job.seed,
+                        JobStatus.queued.value,
+                        time.time(),
+                    ),
+                )
+                job_id = cursor.lastrowid
+                assert job_id is not None
+                connection.execute(
+                    "UPDATE jobs SET output_folder = ? WHERE id = ?",
+                    (str(get_job_output_folder(job_id, scenario_path, job)), job_id),
+                )
+                job_ids.append(job_id)
+
+        return job_ids
+
+    def requeue_expired(self, connection: sqlite3.Connection, now: float) -> None:
+        connection.execute(
+            "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, "
+            "error = 'lease of ' || worker || ' expired', lease_until = NULL "
+            "WHERE status = ? AND lease_until < ?",
+            (
+                self.config.job_max_attempts,
+                JobStatus.failed.value,
+                JobStatus.queued.value,
+                JobStatus.running.value,
+                now,
+            ),
+        )
+
+    def claim(self, worker: str) -> QueuedJob | None:
+        now = time.time()
+        with self.transaction() as connection:
+            self.requeue_expired(connection, now)
+            row = connection.execute(
+                f"SELECT {COLUMNS} FROM jobs WHERE status = ? ORDER BY id LIMIT 1",
+                (JobStatus.queued.value,),
+            ).fetchone()
+            if row is None:
+                return None
+
+            job_id = row[0]
+            connection.execute(
+                "UPDATE jobs SET status = ?, worker = ?, attempts = attempts + 1, "
+                "lease_until = ?, started_at = ? WHERE id = ?",
+                (
+                    JobStatus.running.value,
+                    worker,
+                    now + self.config.job_lease_sec,
+                    now,
+                    job_id,
+                ),
+            )
+            row = connection.execute(
+                f"SELECT {COLUMNS} FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+
+        return self.to_queued_job(row)
+
+    def heartbeat(self, job_id: int, worker: str) -> bool:
+        # False once the lease expired and the job went to another worker
+        with self.transaction() as connection:
+            cursor = connection.execute(
+                "UPDATE jobs SET lease_until = ? "
+                "WHERE id = ? AND worker = ? AND status = ?",
+                (
+                    time.time() + self.config.job_lease_sec,
+                    job_id,
+                    worker,
+                    JobStatus.running.value,
+                ),
+            )
+        return cursor.rowcount == 1
+
+    def finish(self, job_id: int, worker: str, error: str | None = None) -> bool:
+        # failed jobs are queued again until they ran job_max_attempts times
+        with self.transaction() as connection:
+            cursor = connection.execute(
+                "UPDATE jobs SET status = CASE WHEN ? IS NULL THEN ? "
+                "WHEN attempts >= ? THEN ? ELSE ? END, "
+                "finished_at = ?, lease_until = NULL, error = ? "
+                "WHERE id = ? AND worker = ? AND status = ?",
+                (
+                    error,
+                    JobStatus.done.value,
+                    self.config.job_max_attempts,
+                    JobStatus.failed.value,
+                    JobStatus.queued.value,
+                    time.time(),
+                    error,
+                    job_id,
+                    worker,
+                    JobStatus.running.value,
+                ),
+            )
+        return cursor.rowcount == 1
+
+    def get_status(self) -> QueueStatus:
+        now = time.time()
+        with self.transaction() as connection:
+            self.requeue_expired(connection, now)
+            jobs = dict.fromkeys(JobStatus, 0)
+            for status, count in connection.execute(
+                "SELECT status, COUNT(*) FROM jobs GROUP BY status"
+            ):
+                jobs[JobStatus(status)] = count
+            running, failed = (
+                [
+                    self.to_queued_job(row)
+                    for row in connection.execute(
+                        f"SELECT {COLUMNS} FROM jobs WHERE status = ? ORDER BY id",
+                        (status.value,),
+                    )
+                ]
+                for status in (JobStatus.running, JobStatus.failed)
+            )
+            window_start = now - self.config.job_throughput_window_sec
+            finished, first_started_at = connection.execute(
+                "SELECT COUNT(*), MIN(started_at) FROM jobs "
+                "WHERE status = ? AND finished_at >= ?",
+                (JobStatus.done.value, window_start),
+            ).fetchone()
+
+        # a queue younger than the window is measured since its first job
+        elapsed_sec = now - max(first_started_at or now, window_start)
+        jobs_per_hour = finished / elapsed_sec * 3600 if elapsed_sec > 0 else 0.0
+        remaining = jobs[JobStatus.queued] + jobs[JobStatus.running]
+        return QueueStatus(
+            jobs=jobs,
+            running=running,
+            failed=failed,
+            jobs_per_hour=jobs_per_hour,
+            eta_sec=remaining / jobs_per_hour * 3600 if jobs_per_hour > 0 else None,
+        )
+
+
+class Service(ABC):
+    @abstractmethod
+    def run(self) -> None: ...
+
+
+class JobSubmitService(Service):
+    def __init__(
+        self,
+        logger: Logger,
+        queue_file: Path,
+        queue_config: JobQueueConfig,
+        simulation_config: SimulationConfig,
+        scenario_path: Path,
+        jobs: SweepJobs,
+        cache: ArtifactCache | None = None,
+    ) -> None:
+        self.logger: Logger = logger
+        self.queue_file: Path = queue_file
+        self.queue_config: JobQueueConfig = queue_config
+        self.simulation_config: SimulationConfig = simulation_config
+        self.scenario_path: Path = scenario_path
+        self.jobs: SweepJobs = jobs
+        self.cache: ArtifactCache | None = cache
+
+    def run(self) -> None:
+        # built before any worker can take a job, workers on several hosts
+        # would otherwise write the same index files at once
+        prepare_station_indexes(
+            logger=self.logger,
+            simulation_config=self.simulation_config,
+            scenario_path=self.scenario_path,
+            jobs=self.jobs,
+            cache=self.cache,
+        )
+        queue = JobQueue(queue_file=self.queue_file, config=self.queue_config)
+        try:
+            job_ids = queue.submit(scenario_path=self.scenario_path, jobs=self.jobs)
+        finally:
+            queue.close()
+        self.logger.info(
+            f"Queued {len(job_ids)} jobs ({job_ids[0]}-{job_ids[-1]}) "
+            f"in {self.queue_file}"
+        )
+
+
+class JobWorker(Service):
+    def __init__(
+        self,
+        logger: Logger,
+        queue_file: Path,
+        queue_config: JobQueueConfig,
+        simulation_config: SimulationConfig,
+        port: int | None,
+        exit_when_empty: bool,
+    ) -> None:
+        self.logger: Logger = logger
+        self.queue_file: Path = queue_file
+        self.queue_config: JobQueueConfig = queue_config
+        self.simulation_config: SimulationConfig = simulation_config
+        self.port: int | None = port
+        self.exit_when_empty: bool = exit_when_empty
+        self.worker: str = f"{socket.gethostname()}:{os.getpid()}"
+        self.interrupted: bool = False
+
+    def interrupt(self, signum: int, frame: object) -> None:
+        # the simulation catches KeyboardInterrupt and returns, the flag keeps
+        # an interrupted job from being reported as done
+        self.interrupted = True
+        raise KeyboardInterrupt
+
+    def renew_lease(self, queued_job: QueuedJob, stop: threading.Event) -> None:
+        # sqlite connections can not be shared between threads
+        queue = JobQueue(queue_file=self.queue_file, config=self.queue_config)
+        try:
+            while not stop.wait(self.queue_config.job_heartbeat_sec):
+                if not queue.heartbeat(job_id=queued_job.id, worker=self.worker):
+                    # another worker may already run the job in the same
+                    # output folder, the simulation has to stop right away
+                    self.logger.warning(
+                        f"Lost the lease of job {queued_job.id}, stopping the worker"
+                    )
+                    self.interrupted = True
+                    signal.raise_signal(signal.SIGINT)
+                    return
+        finally:
+            queue.close()
+
+    def run_job(self, queued_job: QueuedJob) -> None:
+        output_folder = queued_job.output_folder
+        if output_folder.exists():
+            # left behind by a failed or abandoned attempt
+            attempt_folder = output_folder.with_name(
+                f"{output_folder.name}.attempt_{queued_job.attempts - 1}"
+            )
+            self.logger.warning(f"Moving {output_folder} to {attempt_folder}")
+            output_folder.rename(attempt_folder)
+
+        run_sweep_job(
+            job=queued_job.job,
+            scenario_path=queued_job.scenario_path,
+            simulation_config=self.simulation_config,
+            port=self.port,
+            label=f"job_{queued_job.id}",
+            output_folder=output_folder,
+        )
+
+    def run(self) -> None:
+        queue = JobQueue(queue_file=self.queue_file, config=self.queue_config)
+        signal.signal(signal.SIGINT, self.interrupt)
+        self.logger.info(f"Worker {self.worker} is taking jobs of {self.queue_file}")
+        try:
+            while not self.interrupted:
+                queued_job = queue.claim(worker=self.worker)
+                if queued_job is None:
+                    if self.exit_when_empty:
+                        break
+                    time.sleep(self.queue_config.worker_poll_sec)
+                    continue
+
+                self.logger.info(
+                    f"Running job {queued_job.id} {queued_job.job} "
+                    f"(attempt {queued_job.attempts})"
+                )
+                stop = threading.Event()
+                heartbeat = threading.Thread(
+                    target=self.renew_lease, args=(queued_job, stop), daemon=True
+                )
+                heartbeat.start()
+                error: str | None = None
+                try:
+                    self.run_job(queued_job)
+                except Exception as exception:  # noqa
+                    self.logger.exception(f"Job {queued_job.id} failed")
+                    error = repr(exception)
+                finally:
+                    stop.set()
+                    heartbeat.join()
+                if self.interrupted:
+                    error = "interrupted"
+
+                if not queue.finish(
+                    job_id=queued_job.id, worker=self.worker, error=error
+                ):
+                    self.logger.warning(f"Job {queued_job.id} went to another worker")
+                    continue
+                self.logger.info(
+                    f"Job {queued_job.id} {'failed' if error else 'done'}, "
+                    f"output in {queued_job.output_folder}"
+                )
+        except KeyboardInterrupt:
+            self.logger.warning(f"Worker {self.worker} interrupted")
+        finally:
+            queue.close()
+
+
+class JobStatusService(Service):
+    def __init__(self, queue_file: Path, queue_config: JobQueueConfig) -> None:
+        self.queue_file: Path = queue_file
+        self.queue_config: JobQueueConfig = queue_config
+
+    def run(self) -> None:
+        queue = JobQueue(queue_file=self.queue_file, config=self.queue_config)
+        try:
+            status = queue.get_status()
+        finally:
+            queue.close()
+
+        table = Table(title=f"Jobs of {self.queue_file}")
+        table.add_column("queued", justify="right")
+        table.add_column("running", justify="right")
+        table.add_column("done", justify="right")
+        table.add_column("failed", justify="right")
+        table.add_column("jobs/h", justify="right")
+        table.add_column("ETA", justify="right")
+        eta = (
+            "-"
+            if status.eta_sec is None
+            else time.strftime("%H:%M", time.localtime(time.time() + status.eta_sec))
+            + f" ({status.eta_sec / 3600:.1f}h)"
+        )
+        table.add_row(
+            *(str(status.jobs[job_status]) for job_status in JobStatus),
+            f"{status.jobs_per_hour:.1f}",
+            eta,
+        )
+        rich.print(table)
+
+        if status.running or status.failed:
+            jobs_table = Table()
+            jobs_table.add_column("job", justify="right")
+            jobs_table.add_column("status")
+            jobs_table.add_column("configuration")
+            jobs_table.add_column("worker")
+            jobs_table.add_column("attempts", justify="right")
+            jobs_table.add_column("running since / error")
+            for queued_job in [*status.running, *status.failed]:
+                jobs_table.add_row(
+                    str(queued_job.id),
+                    queued_job.status.value,
+                    f"{queued_job.job.percent_of_hydrogen_cars} "
+                    f"{','.join(sorted(queued_job.job.hydrogen_stations)) or '-'} "
+                    f"seed={queued_job.job.seed}",
+                    queued_job.worker or "-",
+                    str(queued_job.attempts),
+                    queued_job.error
+                    if queued_job.status == JobStatus.failed
+                    else time.strftime(
+                        "%Y-%m-%d %H:%M",
+                        time.localtime(queued_job.started_at or 0),
+                    ),
+                )
+            rich.print(jobs_table)
+
+
+def get_job_submit_service(
+    logger: Logger,
+    queue_file: Path,
+    queue_config: JobQueueConfig,
+    simulation_config: SimulationConfig,
+    scenario_path: Path,
+    jobs: SweepJobs,
+    cache: ArtifactCache | None = None,
+) -> Service:
+    return JobSubmitService(
+        logger=logger,
+        queue_file=queue_file,
+        queue_config=queue_config,
+        simulation_config=simulation_config,
+        scenario_path=scenario_path,
+        jobs=jobs,
+        cache=cache,
+    )
+
+
+def get_job_worker(
+    logger: Logger,
+    queue_file: Path,
+    queue_config: JobQueueConfig,
+    simulation_config: SimulationConfig,
+    port: int | None = None,
+    exit_when_empty: bool = False,
+) -> Service:
+    return JobWorker(
+        logger=logger,
+        queue_file=queue_file,
+        queue_config=queue_config,
+        simulation_config=simulation_config,
+        port=port,
+        exit_when_empty=exit_when_empty,
+    )
+
+
+def get_job_status_service(queue_file: Path, queue_config: JobQueueConfig) -> Service:
+    return JobStatusService(queue_file=queue_file, queue_config=queue_config)
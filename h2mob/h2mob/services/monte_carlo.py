@@ -0,0 +1,338 @@
+import math
+import statistics
+
+from collections.abc import Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from logging import Logger
+from pathlib import Path
+
+from h2mob.services.analysis import AnalysisService, RunReport
+from h2mob.services.artifact_cache import ArtifactCache
+from h2mob.services.sweep import Service, SweepJob, SweepService, run_sweep_job
+from h2mob.settings.monte_carlo import MonteCarloConfig
+from h2mob.settings.outputs import OutputConfig
+from h2mob.settings.simulation import SimulationConfig
+
+import rich
+
+from loguru import logger as worker_logger
+from pydantic import BaseModel
+from rich.table import Table
+
+
+class KpiEstimate(BaseModel):
+    mean: float
+    std: float
+    half_width: float
+    converged: bool
+
+
+class MonteCarloReport(BaseModel):
+    job: SweepJob
+    seeds: list[int]
+    confidence: float
+    converged: bool
+    kpis: dict[str, KpiEstimate]
+    # seed -> snapshot time of the replicas whose KPIs start there
+    resumed_from_sec: dict[int, float] = {}
+
+
+def get_t_coverage(t: float, degrees_of_freedom: int) -> float:
+    # exact P(|T| < t) of the Student t distribution for integer degrees of
+    # freedom, the finite series of Abramowitz and Stegun 26.7.3 and 26.7.4
+    df = degrees_of_freedom
+    theta = math.atan(t / math.sqrt(df))
+    cos_squared = math.cos(theta) ** 2
+    term = total = 1.0
+    if df % 2:
+        for k in range(1, (df - 1) // 2):
+            term *= 2 * k / (2 * k + 1) * cos_squared
+            total += term
+        series = math.sin(theta) * math.cos(theta) * total if df > 1 else 0.0
+        return 2 / math.pi * (theta + series)
+    for k in range(1, df // 2):
+        term *= (2 * k - 1) / (2 * k) * cos_squared
+        total += term
+    return math.sin(theta) * total
+
+
+def get_t_quantile(confidence: float, degrees_of_freedom: int) -> float:
+    # two-sided Student t quantile, bisected on the exact coverage since the
+    # normal approximations are off by percents at the few replicas we run
+    low, high = 0.0, 1.0
+    while get_t_coverage(high, degrees_of_freedom) < confidence:
+        low, high = high, high * 2
+    for _ in range(100):
+        middle = (low + high) / 2
+        if get_t_coverage(middle, degrees_of_freedom) < confidence:
+            low = middle
+        else:
+            high = middle
+        if high - low < 1e-12:
+            break
+    return (low + high) / 2
+
+
+def get_kpis(report: RunReport) -> dict[str, float]:
+    kpis: dict[str, float] = {}
+    for station in report.stations:
+        kpis[f"{station.station}.refuels"] = station.refuels
+        kpis[f"{station.station}.waiting_time_sec_mean"] = station.waiting_time_sec_mean
+        kpis[f"{station.station}.charged_liters"] = station.charged_liters
+    for fuel_type, refuels in report.refuels.items():
+        kpis[f"{fuel_type}.refuels"] = refuels
+        kpis[f"{fuel_type}.stranded_vehicles"] = report.stranded_vehicles[fuel_type]
+
+    return kpis
+
+
+def run_replica(
+    job: SweepJob,
+    scenario_path: Path,
+    simulation_config: SimulationConfig,
+    output_config: OutputConfig,
+    port: int,
+    label: str,
+    output_folder: Path,
+) -> RunReport:
+    run_sweep_job(
+        job=job,
+        scenario_path=scenario_path,
+        simulation_config=simulation_config,
+        port=port,
+        label=label,
+        output_folder=output_folder,
+    )
+    # analysed in the worker, only the small report goes back to the parent
+    analysis = AnalysisService(
+        output_folders=[output_folder],
+        config=output_config,
+        logger=worker_logger.bind(label=label),  # type: ignore
+    )
+    report = analysis.analyze(output_folder)
+    (output_folder / output_config.report_file).write_text(
+        report.model_dump_json(indent=2)
+    )
+    return report
+
+
+class MonteCarloService(SweepService):
+    def __init__(
+        self,
+        logger: Logger,
+        simulation_config: SimulationConfig,
+        output_config: OutputConfig,
+        monte_carlo_config: MonteCarloConfig,
+        scenario_path: Path,
+        job: SweepJob,
+        workers: int | None,
+        base_port: int,
+        cache: ArtifactCache | None = None,
+    ) -> None:
+        super().__init__(
+            logger=logger,
+            simulation_config=simulation_config,
+            scenario_path=scenario_path,
+            jobs=[
+                job.model_copy(
+                    update={"seed": monte_carlo_config.replica_base_seed + i}
+                )
+                for i in range(monte_carlo_config.max_replicas)
+            ],
+            workers=workers,
+            base_port=base_port,
+            cache=cache,
+        )
+        self.output_config: OutputConfig = output_config
+        self.monte_carlo_config: MonteCarloConfig = monte_carlo_config
+        self.job: SweepJob = job
+        stations = "_".join(sorted(job.hydrogen_stations))
+        name = (
+            f"hydrogen_cars_{job.percent_of_hydrogen_cars}_hydrogen_stations_{stations}"
+        )
+        self.monte_carlo_path: Path = (
+            scenario_path / monte_carlo_config.monte_carlo_path / name
+        )
+        self.reports: dict[int, RunReport] = {}  # seed -> report
+
+    def estimate(self, reports: dict[int, RunReport]) -> MonteCarloReport:
+        config = self.monte_carlo_config
+        kpis = [get_kpis(report) for report in reports.values()]
+        estimates: dict[str, KpiEstimate] = {}
+        for name in kpis[0]:
+            values = [replica[name] for replica in kpis]
+            mean = statistics.fmean(values)
+            std = math.inf
+            half_width = math.inf
+            if len(values) > 1:
+                std = statistics.stdev(values)
+                t = get_t_quantile(config.replica_confidence, len(values) - 1)
+                half_width = t * std / math.sqrt(len(values))
+            tolerance = max(
+                config.replica_relative_tolerance * abs(mean),
+                config.replica_absolute_tolerance,
+            )
+            estimates[name] = KpiEstimate(
+                mean=mean,
+                std=std,
+                half_width=half_width,
+                converged=half_width <= tolerance,
+            )
+
+        return MonteCarloReport(
+            job=self.job,
+            seeds=sorted(reports),
+            confidence=config.replica_confidence,
+            converged=len(reports) >= config.min_replicas
+            and all(estimate.converged for estimate in estimates.values()),
+            kpis=estimates,
+            resumed_from_sec={
+                seed: report.resumed_from_sec
+                for seed, report in reports.items()
+                if report.resumed_from_sec is not None
+            },
+        )
+
+    def print_report(self, report: MonteCarloReport) -> None:
+        table = Table(
+            title=f"{len(report.seeds)} replicas, "
+            f"{report.confidence:.0%} confidence intervals"
+        )
+        table.add_column("KPI")
+        table.add_column("mean", justify="right")
+        table.add_column("±", justify="right")
+        table.add_column("converged", justify="right")
+        for name, estimate in report.kpis.items():
+            table.add_row(
+                name,
+                f"{estimate.mean:.2f}",
+                f"{estimate.half_width:.2f}",
+                "yes" if estimate.converged else "no",
+            )
+
+        rich.print(table)
+        if report.resumed_from_sec:
+            self.logger.warning(
+                f"{len(report.resumed_from_sec)} replicas resumed from snapshots, "
+                "their KPIs start at the snapshot time"
+            )
+
+    def submit_next(
+        self,
+        executor: ProcessPoolExecutor,
+        pending: dict[Future, SweepJob],
+        jobs: Iterator[tuple[int, SweepJob]],
+        simulation_config: SimulationConfig,
+    ) -> bool:
+        for index, job in jobs:
+            output_folder = self.monte_carlo_path / f"seed_{job.seed}"
+            report_file = output_folder / self.output_config.report_file
+            # replicas of an earlier, interrupted run are reused
+            if report_file.exists():
+                self.reports[job.seed] = RunReport.model_validate_json(  # type: ignore
+                    report_file.read_text()
+                )
+                continue
+            if output_folder.exists():
+                self.logger.warning(f"{output_folder} has no report, skipping it")
+                continue
+
+            future = executor.submit(
+                run_replica,
+                job=job,
+                scenario_path=self.scenario_path,
+                simulation_config=simulation_config,
+                output_config=self.output_config,
+                port=self.base_port + index,
+                label=f"replica_{job.seed}",
+                output_folder=output_folder,
+            )
+            pending[future] = job
+            return True
+
+        return False
+
+    def run(self) -> None:
+        self.prepare_station_indexes()
+        workers, threads = self.plan_workers()
+        simulation_config = self.simulation_config.model_copy(
+            update={"sumo_threads": threads}
+        )
+        self.monte_carlo_path.mkdir(parents=True, exist_ok=True)
+        self.logger.info(
+            f"Running up to {len(self.jobs)} replicas of {self.job} "
+            f"on {workers} workers with {threads} SUMO threads each"
+        )
+
+        report: MonteCarloReport | None = None
+        jobs = iter(enumerate(self.jobs))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending: dict[Future, SweepJob] = {}
+            while True:
+                if self.reports:
+                    report = self.estimate(self.reports)
+                    open_kpis = [
+                        name
+                        for name, estimate in report.kpis.items()
+                        if not estimate.converged
+                    ]
+                    self.logger.info(
+                        f"{len(self.reports)} replicas done, "
+                        f"{len(open_kpis)} KPIs outside the tolerance"
+                    )
+                # once converged no replica is started, running ones are
+                # still collected
+                if report is None or not report.converged:
+                    while len(pending) < workers and self.submit_next(
+                        executor, pending, jobs, simulation_config
+                    ):
+                        pass
+                if not pending:
+                    break
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job = pending.pop(future)
+                    try:
+                        self.reports[job.seed] = future.result()  # type: ignore
+                    except Exception as error:  # noqa
+                        self.logger.error(f"Replica {job.seed} failed: {error}")
+
+        if report is None:
+            self.logger.error("No replica has finished")
+            return
+
+        report_file = (
+            self.monte_carlo_path / self.monte_carlo_config.monte_carlo_report_file
+        )
+        report_file.write_text(report.model_dump_json(indent=2))
+        self.print_report(report)
+        self.logger.info(
+            f"{len(report.seeds)} replicas, "
+            f"{'converged' if report.converged else 'not converged'}, "
+            f"report written to {report_file}"
+        )
+
+
+def get_monte_carlo_service(
+    logger: Logger,
+    simulation_config: SimulationConfig,
+    output_config: OutputConfig,
+    monte_carlo_config: MonteCarloConfig,
+    scenario_path: Path,
+    job: SweepJob,
+    workers: int | None,
+    base_port: int,
+    cache: ArtifactCache | None = None,
+) -> Service:
+    return MonteCarloService(
+        logger=logger,
+        simulation_config=simulation_config,
+        output_config=output_config,
+        monte_carlo_config=monte_carlo_config,
+        scenario_path=scenario_path,
+        job=job,
+        workers=workers,
+        base_port=base_port,
+        cache=cache,
+    )
@@ -0,0 +1,370 @@
+import json
+import math
+import shutil
+
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from logging import Logger
+from pathlib import Path
+from xml.etree import ElementTree
+
+from h2mob.services.fleet import FUEL_TYPES, Fleet
+from h2mob.settings import outputs
+from h2mob.settings.outputs import OutputConfig
+
+import numpy as np
+
+from pydantic import BaseModel
+
+
+VEHICLE_COLUMN = "vehicle"
+FUEL_TYPE_COLUMN = "fuel_type"
+TIME_COLUMN = "time"
+
+
+class Column(BaseModel):
+    name: str
+    source: str  # "<tag>.<attribute>" of the row element or one of its parents
+    dtype: str  # numpy dtype, "str" columns are interned to int32
+
+
+class OutputTable(BaseModel):
+    name: str
+    file_name: str
+    row_tag: str
+    columns: list[Column]
+
+
+def attribute_columns(tag: str, attributes: list[str], dtype: str) -> list[Column]:
+    return [Column(name=a, source=f"{tag}.{a}", dtype=dtype) for a in attributes]
+
+
+OUTPUT_TABLES: tuple[OutputTable, ...] = (
+    OutputTable(
+        name="fcd",
+        file_name=outputs.FCD_OUTPUT,
+        row_tag="vehicle",
+        columns=[
+            Column(name=TIME_COLUMN, source="timestep.time", dtype="float64"),
+            Column(name=VEHICLE_COLUMN, source="vehicle.id", dtype="str"),
+            Column(name="type", source="vehicle.type", dtype="str"),
+            Column(name="lane", source="vehicle.lane", dtype="str"),
+            *attribute_columns(
+                "vehicle",
+                ["x", "y", "angle", "speed", "pos", "slope", "acceleration"],
+                "float32",
+            ),
+        ],
+    ),
+    OutputTable(
+        name="battery",
+        file_name=outputs.BATTERY_OUTPUT,
+        row_tag="vehicle",
+        columns=[
+            Column(name=TIME_COLUMN, source="timestep.time", dtype="float64"),
+            Column(name=VEHICLE_COLUMN, source="vehicle.id", dtype="str"),
+            Column(name="station", source="vehicle.chargingStationId", dtype="str"),
+            Column(name="lane", source="vehicle.lane", dtype="str"),
+            *attribute_columns(
+                "vehicle",
+                [
+                    "energyConsumed",
+                    "totalEnergyConsumed",
+                    "totalEnergyRegenerated",
+                    "actualBatteryCapacity",
+                    "maximumBatteryCapacity",
+                    "energyCharged",
+                    "energyChargedInTransit",
+                    "energyChargedStopped",
+                ],
+                "float64",
+            ),
+            *attribute_columns(
+                "vehicle",
+                ["speed", "acceleration", "x", "y", "posOnLane", "timeStopped"],
+                "float32",
+            ),
+        ],
+    ),
+    OutputTable(
+        name="summary",
+        file_name=outputs.SUMMARY_OUTPUT,
+        row_tag="step",
+        columns=[
+            Column(name=TIME_COLUMN, source="step.time", dtype="float64"),
+            *attribute_columns(
+                "step",
+                [
+                    "loaded",
+                    "inserted",
+                    "running",
+                    "waiting",
+                    "ending",
+                    "arrived",
+                    "collisions",
+                    "teleports",
+                    "halting",
+                    "stopped",
+                ],
+                "int32",
+            ),
+            *attribute_columns(
+                "step",
+                [
+                    "meanWaitingTime",
+                    "meanTravelTime",
+                    "meanSpeed",
+                    "meanSpeedRelative",
+                    "duration",
+                ],
+                "float32",
+            ),
+        ],
+    ),
+    OutputTable(
+        name="charging_stations",
+        file_name=outputs.CHARGING_STATIONS_OUTPUT,
+        row_tag="step",
+        columns=[
+            Column(name=TIME_COLUMN, source="step.time", dtype="float64"),
+            Column(name="station", source="chargingStation.id", dtype="str"),
+            Column(name=VEHICLE_COLUMN, source="vehicle.id", dtype="str"),
+            Column(name="charging_status", source="step.chargingStatus", dtype="str"),
+            *attribute_columns(
+                "step",
+                [
+                    "energyCharged",
+                    "partialCharge",
+                    "power",
+                    "efficiency",
+                    "actualBatteryCapacity",
+                    "maximumBatteryCapacity",
+                ],
+                "float64",
+            ),
+        ],
+    ),
+)
+
+
+class Vocabulary:
+    def __init__(self) -> None:
+        self.values: list[str] = []
+        self.ids: dict[str, int] = {}
+
+    def intern(self, value: str) -> int:
+        value_id = self.ids.get(value)
+        if value_id is None:
+            value_id = len(self.values)
+            self.ids[value] = value_id
+            self.values.append(value)
+
+        return value_id
+
+
+class TableWriter:
+    def __init__(
+        self,
+        table: OutputTable,
+        table_path: Path,
+        vocabularies: dict[str, Vocabulary],
+        vehicle_fuel_types: list[int],
+        config: OutputConfig,
+    ) -> None:
+        self.table: OutputTable = table
+        self.table_path: Path = table_path
+        self.vocabularies: dict[str, Vocabulary] = vocabularies
+        self.vehicle_fuel_types: list[int] = vehicle_fuel_types
+        self.config: OutputConfig = config
+        # rows are buffered per time window, the charging station output is
+        # grouped by station and not ordered by time
+        self.buffers: dict[int, dict[str, list]] = {}
+        self.buffered_rows: int = 0
+        self.parts: dict[int, int] = defaultdict(int)
+        self.rows: int = 0
+
+    def parse_value(self, column: Column, value: str | None) -> float | int:
+        if column.dtype == "str":
+            return -1 if value is None else self.vocabularies[column.name].intern(value)
+        if value is None:
+            return math.nan if column.dtype.startswith("float") else -1
+        if column.dtype.startswith("int"):
+            return int(float(value))
+
+        return float(value)
+
+    def add_row(self, values: dict[str, str | None]) -> None:
+        row = {
+            column.name: self.parse_value(column, values[column.name])
+            for column in self.table.columns
+        }
+        window = int(row[TIME_COLUMN] // self.config.time_window_sec)
+        buffer = self.buffers.setdefault(window, defaultdict(list))
+        for name, value in row.items():
+            buffer[name].append(value)
+
+        self.buffered_rows += 1
+        self.rows += 1
+        if self.buffered_rows >= self.config.chunk_rows:
+            self.flush()
+
+    def flush(self) -> None:
+        fuel_types = np.asarray(self.vehicle_fuel_types, dtype=np.int8)
+
+        for window, buffer in self.buffers.items():
+            columns: dict[str, np.ndarray] = {
+                column.name: np.asarray(
+                    buffer[column.name],
+                    dtype=np.int32 if column.dtype == "str" else column.dtype,
+                )
+                for column in self.table.columns
+            }
+            if VEHICLE_COLUMN in columns:
+                vehicles = columns[VEHICLE_COLUMN]
+                known = (vehicles >= 0) & (vehicles < len(fuel_types))
+                columns[FUEL_TYPE_COLUMN] = np.where(
+                    known, fuel_types[np.where(known, vehicles, 0)], -1
+                ).astype(np.int8)
+
+            window_path = self.table_path / f"window_{window:05d}"
+            window_path.mkdir(parents=True, exist_ok=True)
+            np.savez(window_path / f"part_{self.parts[window]:05d}.npz", **columns)
+            self.parts[window] += 1
+
+        self.buffers = {}
+        self.buffered_rows = 0
+
+
+class Service(ABC):
+    @abstractmethod
+    def run(self) -> None: ...
+
+
+class OutputConverterService(Service):
+    tables: tuple[OutputTable, ...] = OUTPUT_TABLES
+
+    def __init__(
+        self, output_folder: Path, config: OutputConfig, logger: Logger
+    ) -> None:
+        self.output_folder: Path = output_folder
+        self.columnar_path: Path = output_folder / config.columnar_path
+        self.config: OutputConfig = config
+        self.logger: Logger = logger
+        self.vocabularies: dict[str, Vocabulary] = defaultdict(Vocabulary)
+        self.vehicle_fuel_types: list[int] = []
+
+    def load_vehicle_fuel_types(self) -> None:
+        fleet_file = self.output_folder / outputs.FLEET_OUTPUT
+        if not fleet_file.exists():
+            self.logger.warning(f"{fleet_file} not found, no fuel types")
+            return
+
+        fleet = Fleet.load(fleet_file)
+        # vehicles are interned in fleet order, so the vehicle id is also
+        # the index into the fuel type column
+        vehicle_vocabulary = self.vocabularies[VEHICLE_COLUMN]
+        for vehicle_id in fleet:
+            vehicle_vocabulary.intern(vehicle_id)
+        self.vehicle_fuel_types = fleet.get_fuel_type_ids().tolist()
+
+    def convert_table(self, table: OutputTable) -> None:
+        output_file = self.output_folder / table.file_name
+        if not output_file.exists():
+            self.logger.warning(f"{output_file} not found, skipping {table.name}")
+            return
+
+        writer = TableWriter(
+            table=table,
+            table_path=self.columnar_path / table.name,
+            vocabularies=self.vocabularies,
+            vehicle_fuel_types=self.vehicle_fuel_types,
+            config=self.config,
+        )
+        sources = [column.source.split(".", 1) for column in table.columns]
+        parents: dict[str, ElementTree.Element] = {}
+        root: ElementTree.Element | None = None
+
+        for event, element in ElementTree.iterparse(
+            output_file, events=("start", "end")
+        ):
+            if event == "start":
+                if root is None:
+                    root = element
+                parents[element.tag] = element
+                continue
+
+            if element.tag != table.row_tag:
+                if element is not root and element.tag in parents:
+                    # a finished parent element is not needed anymore
+                    element.clear()
+                continue
+
+            writer.add_row(
+                {
+                    column.name: parents[tag].get(attribute)
+                    for column, (tag, attribute) in zip(table.columns, sources)
+                }
+            )
+            element.clear()
+            root.clear()  # type: ignore
+
+        writer.flush()
+        self.logger.info(f"Converted {writer.rows} rows of {output_file}")
+
+    def write_vocabularies(self) -> None:
+        vocabularies = {
+            name: vocabulary.values for name, vocabulary in self.vocabularies.items()
+        }
+        vocabularies[FUEL_TYPE_COLUMN] = [fuel_type.value for fuel_type in FUEL_TYPES]
+        with (self.columnar_path / self.config.vocabulary_file).open(mode="w") as f:
+            json.dump(vocabularies, f)
+
+    def run(self) -> None:
+        if self.columnar_path.exists():
+            shutil.rmtree(self.columnar_path)
+
+        self.columnar_path.mkdir()
+        self.load_vehicle_fuel_types()
+        for table in self.tables:
+            self.convert_table(table=table)
+        self.write_vocabularies()
+
+
+def list_windows(columnar_path: Path, table_name: str) -> list[int]:
+    return sorted(
+        int(window_path.name.split("_")[1])
+        for window_path in (columnar_path / table_name).glob("window_*")
+    )
+
+
+def read_table(
+    columnar_path: Path,
+    table_name: str,
+    windows: list[int] | None = None,
+    columns: list[str] | None = None,
+) -> dict[str, np.ndarray]:
+    parts: dict[str, list[np.ndarray]] = defaultdict(list)
+    for window in list_windows(columnar_path, table_name):
+        if windows is not None and window not in windows:
+            continue
+        window_path = columnar_path / table_name / f"window_{window:05d}"
+        for part_file in sorted(window_path.glob("part_*.npz")):
+            # npz members are only read when accessed
+            with np.load(part_file) as part:
+                for name in part.files if columns is None else columns:
+                    parts[name].append(part[name])
+
+    return {name: np.concatenate(arrays) for name, arrays in parts.items()}
+
+
+def read_vocabularies(columnar_path: Path, config: OutputConfig) -> dict[str, list]:
+    with (columnar_path / config.vocabulary_file).open() as f:
+        return json.load(f)
+
+
+def get_output_converter_service(
+    output_folder: Path, config: OutputConfig, logger: Logger
+) -> Service:
+    return OutputConverterService(
+        output_folder=output_folder, config=config, logger=logger
+    )
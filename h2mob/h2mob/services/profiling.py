@@ -0,0 +1,130 @@
+import bisect
+import time
+
+from collections import defaultdict
+from collections.abc import Callable
+from functools import wraps
+from logging import Logger
+from pathlib import Path
+
+from pydantic import BaseModel
+
+
+# upper bounds of the latency histogram buckets, the last bucket is open
+HISTOGRAM_BOUNDS_SEC: tuple[float, ...] = (1e-5, 1e-4, 1e-3, 1e-2, 1e-1, 1.0)
+
+
+class CallStats(BaseModel):
+    calls: int = 0
+    total_sec: float = 0.0
+    max_sec: float = 0.0
+    histogram: list[int] = [0] * (len(HISTOGRAM_BOUNDS_SEC) + 1)
+
+    def add(self, duration_sec: float) -> None:
+        self.calls += 1
+        self.total_sec += duration_sec
+        self.max_sec = max(self.max_sec, duration_sec)
+        self.histogram[bisect.bisect_left(HISTOGRAM_BOUNDS_SEC, duration_sec)] += 1
+
+
+class HourStats(BaseModel):
+    steps: int = 0
+    vehicles_mean: float = 0.0
+    vehicles_max: int = 0
+    wall_sec: float = 0.0
+
+
+class ProfileReport(BaseModel):
+    histogram_bounds_sec: list[float]
+    wall_sec: float
+    simulated_sec: float
+    steps: CallStats
+    calls: dict[str, CallStats]
+    hours: dict[int, HourStats]
+
+
+class SimulationProfiler:
+    def __init__(self, logger: Logger, log_interval_sec: float) -> None:
+        self.logger: Logger = logger
+        self.log_interval_sec: float = log_interval_sec
+        self.steps: CallStats = CallStats()
+        self.calls: dict[str, CallStats] = defaultdict(CallStats)
+        self.hours: dict[int, HourStats] = defaultdict(HourStats)
+        self.started: float = time.perf_counter()
+        self.step_started: float = self.started
+        self.last_log: float = self.started
+        self.last_log_simulated_sec: float = 0.0
+        self.first_simulated_sec: float | None = None
+        self.simulated_sec: float = 0.0
+
+    def timed(self, name: str, method: Callable) -> Callable:
+        stats = self.calls[name]
+
+        @wraps(method)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                stats.add(time.perf_counter() - started)
+
+        return wrapper
+
+    def instrument(self, target: object, prefix: str) -> None:
+        # the bound methods are replaced on the instance only, objects that
+        # are not profiled keep calling the class methods directly
+        for name, attribute in vars(type(target)).items():
+            if name.startswith("_") or not callable(attribute):
+                continue
+            setattr(
+                target,
+                name,
+                self.timed(name=f"{prefix}.{name}", method=getattr(target, name)),
+            )
+
+    def start_step(self) -> None:
+        self.step_started = time.perf_counter()
+
+    def end_step(self, simulated_sec: float, vehicles: int) -> None:
+        now = time.perf_counter()
+        duration_sec = now - self.step_started
+        self.steps.add(duration_sec)
+        if self.first_simulated_sec is None:
+            self.first_simulated_sec = simulated_sec
+            self.last_log_simulated_sec = simulated_sec
+        self.simulated_sec = simulated_sec
+
+        hour = self.hours[int(simulated_sec // 3600)]
+        hour.steps += 1
+        hour.vehicles_mean += (vehicles - hour.vehicles_mean) / hour.steps
+        hour.vehicles_max = max(hour.vehicles_max, vehicles)
+        hour.wall_sec += duration_sec
+
+        if now - self.last_log >= self.log_interval_sec:
+            throughput = (simulated_sec - self.last_log_simulated_sec) / (
+                now - self.last_log
+            )
+            self.logger.info(
+                f"t={simulated_sec:.0f}s {vehicles} vehicles, "
+                f"{throughput:.1f} simulated s per wall s"
+            )
+            self.last_log = now
+            self.last_log_simulated_sec = simulated_sec
+
+    def report(self) -> ProfileReport:
+        return ProfileReport(
+            histogram_bounds_sec=list(HISTOGRAM_BOUNDS_SEC),
+            wall_sec=time.perf_counter() - self.started,
+            simulated_sec=self.simulated_sec - (self.first_simulated_sec or 0.0),
+            steps=self.steps,
+            calls={
+                name: stats
+                for name, stats in sorted(self.calls.items())
+                if stats.calls > 0
+            },
+            hours=dict(sorted(self.hours.items())),
+        )
+
+    def dump(self, profile_file: Path) -> None:
+        profile_file.write_text(self.report().model_dump_json(indent=2))
+        self.logger.info(f"Profile written to {profile_file}")
@@ -0,0 +1,65 @@
+import heapq
+
+
+class RefuelScheduler:
+    def __init__(
+        self, threshold_liters: float, safety_margin: float, max_interval_sec: float
+    ) -> None:
+        self.threshold_liters: float = threshold_liters
+        # share of the predicted time to the threshold that is not waited
+        self.safety_margin: float = safety_margin
+        self.max_interval_sec: float = max_interval_sec
+        self.queue: list[tuple[float, str]] = []
+        self.due_sec: dict[str, float] = {}
+        self.readings: dict[str, tuple[float, float]] = {}  # time, tank liters
+        # highest consumption seen, stops at traffic lights and stretches of
+        # low consumption would otherwise delay the check past the threshold
+        self.peak_rates: dict[str, float] = {}
+
+    def __len__(self) -> int:
+        return len(self.due_sec)
+
+    def schedule(self, vehicle_id: str, due_sec: float) -> None:
+        self.due_sec[vehicle_id] = due_sec
+        heapq.heappush(self.queue, (due_sec, vehicle_id))
+
+    def remove(self, vehicle_id: str) -> None:
+        self.due_sec.pop(vehicle_id, None)
+        self.readings.pop(vehicle_id, None)
+        self.peak_rates.pop(vehicle_id, None)
+
+    def pop_due(self, time_sec: float) -> list[str]:
+        due: list[str] = []
+        while self.queue and self.queue[0][0] <= time_sec:
+            due_sec, vehicle_id = heapq.heappop(self.queue)
+            # entries of removed or rescheduled vehicles are left in the queue
+            if self.due_sec.get(vehicle_id) == due_sec:
+                del self.due_sec[vehicle_id]
+                due.append(vehicle_id)
+
+        return due
+
+    def get_next_check(
+        self, vehicle_id: str, time_sec: float, tank_liters: float
+    ) -> float:
+        previous = self.readings.get(vehicle_id)
+        self.readings[vehicle_id] = (time_sec, tank_liters)
+        if previous is None:
+            # the next step gives the first consumption estimate
+            return time_sec
+
+        previous_sec, previous_liters = previous
+        rate = self.peak_rates.get(vehicle_id, 0.0)
+        if time_sec > previous_sec:
+            rate = max(
+                rate, (previous_liters - tank_liters) / (time_sec - previous_sec)
+            )
+            self.peak_rates[vehicle_id] = rate
+
+        wait_sec = self.max_interval_sec
+        if rate > 0:
+            remaining_sec = (tank_liters - self.threshold_liters) / rate
+            wait_sec = min(wait_sec, remaining_sec * (1 - self.safety_margin))
+
+        # a due time before the next step means the vehicle is checked then
+        return time_sec + wait_sec
@@ -0,0 +1,91 @@
+import math
+import os
+
+from logging import Logger
+from pathlib import Path
+from xml.parsers import expat
+
+from h2mob.settings.simulation import SimulationConfig
+
+from pydantic import BaseModel
+
+
+class RouteIndex(BaseModel):
+    # the route file the index was built from, cached route files are linked
+    # with their original mtime, so a newer index is not necessarily current
+    route_file_size: int
+    route_file_mtime_ns: int
+    vehicle_ids: list[str]
+    # None for departures SUMO decides at runtime, e.g. "triggered"
+    departures_sec: list[float | None]
+
+
+def parse_departure(depart: str | None) -> float | None:
+    try:
+        departure = float(depart)  # type: ignore
+    except (TypeError, ValueError):
+        return None
+
+    return departure if math.isfinite(departure) else None
+
+
+class RouteScanner:
+    # expat callbacks instead of iterparse, no elements are built for the
+    # route edges, which are most of the file
+    def __init__(self) -> None:
+        self.depth: int = 0
+        self.vehicle_ids: list[str] = []
+        self.departures_sec: list[float | None] = []
+
+    def start_element(self, tag: str, attributes: dict[str, str]) -> None:
+        self.depth += 1
+        if self.depth == 2 and tag == "vehicle":
+            self.vehicle_ids.append(attributes["id"])
+            self.departures_sec.append(parse_departure(attributes.get("depart")))
+
+    def end_element(self, tag: str) -> None:
+        self.depth -= 1
+
+    def scan(self, route_file: Path) -> RouteIndex:
+        stat = route_file.stat()
+        parser = expat.ParserCreate()
+        parser.StartElementHandler = self.start_element
+        parser.EndElementHandler = self.end_element
+        with route_file.open(mode="rb") as f:
+            parser.ParseFile(f)
+
+        return RouteIndex(
+            route_file_size=stat.st_size,
+            route_file_mtime_ns=stat.st_mtime_ns,
+            vehicle_ids=self.vehicle_ids,
+            departures_sec=self.departures_sec,
+        )
+
+
+def get_route_index(
+    scenario_path: Path,
+    simulation_config: SimulationConfig,
+    logger: Logger,
+) -> RouteIndex:
+    route_file = scenario_path / simulation_config.route_file_path
+    index_file = scenario_path / simulation_config.route_index_path
+
+    if index_file.exists():
+        index = RouteIndex.model_validate_json(index_file.read_text())
+        stat = route_file.stat()
+        if (index.route_file_size, index.route_file_mtime_ns) == (
+            stat.st_size,
+            stat.st_mtime_ns,
+        ):
+            logger.info(f"Loaded route index {index_file}")
+            return index
+
+    logger.info(f"Scanning vehicles of {route_file}")
+    index = RouteScanner().scan(route_file)
+    # written next to the route file, parallel runs may build it at once
+    tmp_index_file = index_file.with_name(f".{index_file.name}_{os.getpid()}")
+    tmp_index_file.write_text(index.model_dump_json())
+    os.replace(tmp_index_file, index_file)
+    logger.info(f"Route index covers {len(index.vehicle_ids)} vehicles")
+
+    return index
@@ -1,4 +1,5 @@
-import random
+import json
+import time
 
 from abc import ABC, abstractmethod
 from logging import Logger
@@ -6,33 +7,76 @@ from pathlib import Path
 from typing import cast
 from xml.etree import ElementTree
 
+from h2mob.services.artifact_cache import ArtifactCache
+from h2mob.services.backend import load_sumo_backend
+from h2mob.services.fleet import Fleet
+from h2mob.services.profiling import SimulationProfiler
+from h2mob.services.refuel_scheduler import RefuelScheduler
+from h2mob.services.route_index import get_route_index
+from h2mob.services.snapshots import Snapshot, SnapshotStore, StationChoice
+from h2mob.services.station_index import StationIndex, get_station_index
+from h2mob.services.station_routes import RoadNetwork, StationRouter
+from h2mob.services.telemetry import (
+    SimulationTelemetry,
+    StepSample,
+    get_simulation_telemetry,
+)
+from h2mob.services.traci_trace import TraceRecorder, TraceReplay
+from h2mob.services.vehicle_registry import VehicleFlag, VehicleRegistry
+from h2mob.services.vehicle_routes import VehicleRouteWriter
+from h2mob.settings import outputs
 from h2mob.settings.simulation import (
+    MG_IN_LITERS,
+    TANK_PARAMETER,
+    VEHICLE_CLASS,
+    FuelStations,
     FuelType,
+    GasStation,
+    HydrogenStations,
     SimulationConfig,
+    SumoBackend,
     Vehicle,
-    get_murai_vehicle_properties,
-    get_petrol_vehicle_properties,
+    get_murai_vehicle_profile,
+    get_petrol_vehicle_profile,
 )
 
-import traci  # type: ignore
+import numpy as np
+import traci.constants as tc  # type: ignore
 
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, Field
 
 
-class GasStation(BaseModel):
-    id: str
-    lane: str
-    fuel_type: FuelType
+class ScenarioConfig(BaseModel):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
 
+    fuel_stations: FuelStations
+    hydrogen_stations: HydrogenStations
+    # stored next to the scenario config in its own binary file
+    vehicles: Fleet = Field(exclude=True)
+    # the outputs of a run resumed from a snapshot start at this time
+    resumed_from_sec: float | None = None
 
-FuelStations = list[GasStation]
-HydrogenStations = list[GasStation]
 
+def save_scenario_config(scenario_config: ScenarioConfig, output_folder: Path) -> None:
+    with (output_folder / outputs.SCENARIO_CONFIG_OUTPUT).open(mode="w") as f:
+        f.write(scenario_config.model_dump_json())
+    scenario_config.vehicles.save(output_folder / outputs.FLEET_OUTPUT)
 
-class ScenarioConfig(BaseModel):
-    fuel_stations: FuelStations
-    hydrogen_stations: HydrogenStations
-    vehicles: dict[str, Vehicle]
+
+def load_scenario_config(output_folder: Path) -> ScenarioConfig:
+    with (output_folder / outputs.SCENARIO_CONFIG_OUTPUT).open() as f:
+        stations = json.load(f)
+
+    return ScenarioConfig(
+        **stations, vehicles=Fleet.load(output_folder / outputs.FLEET_OUTPUT)
+    )
+
+
+class RefuelRequest(BaseModel):
+    vehicle_id: str
+    fuel_type: FuelType
+    gas_stations: list[GasStation]
+    stop_duration_sec: int
 
 
 class Service(ABC):
@@ -40,21 +84,178 @@ class Service(ABC):
     def run(self) -> None: ...
 
 
+class TraciCallCounter:
+    def __init__(self) -> None:
+        self.steps: int = 0
+        self.total_calls: int = 0
+        self.max_step_calls: int = 0
+        self.step_calls: int = 0
+        self.subscription_reads: int = 0
+
+    def add(self, calls: int = 1) -> None:
+        self.step_calls += calls
+
+    def add_subscription_read(self) -> None:
+        self.subscription_reads += 1
+
+    def next_step(self) -> None:
+        self.steps += 1
+        self.total_calls += self.step_calls
+        self.max_step_calls = max(self.max_step_calls, self.step_calls)
+        self.step_calls = 0
+
+    def report(self) -> str:
+        steps = max(self.steps, 1)
+        return (
+            f"TraCI calls per step: mean={self.total_calls / steps:.1f} "
+            f"max={self.max_step_calls}, "
+            # every subscription read used to be a getParameter round trip
+            f"subscription reads per step: mean={self.subscription_reads / steps:.1f}"
+        )
+
+
 class SumoClient:
-    mg_in_liters: int = 748_900
-    configured_vehicles: set[str] = set()
+    mg_in_liters: int = MG_IN_LITERS
+    tank_parameter: str = TANK_PARAMETER
+    simulation_variables: tuple[int, ...] = (
+        tc.VAR_TIME,
+        tc.VAR_MIN_EXPECTED_VEHICLES,
+        tc.VAR_LOADED_VEHICLES_IDS,
+        tc.VAR_DEPARTED_VEHICLES_IDS,
+        tc.VAR_ARRIVED_VEHICLES_IDS,
+    )
+    vehicle_variables: tuple[int, ...] = (
+        tc.VAR_ROAD_ID,
+        tc.VAR_PARAMETER_WITH_KEY,
+    )
+    # a context subscription around any edge with this range covers the net
+    travel_times_range_m: float = 1e9
 
-    def __init__(self, logger: Logger) -> None:
+    def __init__(
+        self,
+        logger: Logger,
+        station_index: StationIndex | None = None,
+        backend: SumoBackend = SumoBackend.traci,
+        record_trace: Path | None = None,
+        replay_trace: Path | None = None,
+        vehicles: VehicleRegistry | None = None,
+        net_file: Path | None = None,
+        station_route_refresh_sec: float | None = None,
+    ) -> None:
         self.logger: Logger = logger
+        self.backend: SumoBackend = backend
+        self.vehicles: VehicleRegistry = vehicles or VehicleRegistry()
+        if replay_trace is not None:
+            # answers the calls of a recorded run, SUMO is not started at all
+            self.sumo = TraceReplay(trace_file=replay_trace)
+        else:
+            self.sumo = load_sumo_backend(backend=backend)
+        if record_trace is not None:
+            self.sumo = TraceRecorder(sumo=self.sumo, trace_file=record_trace)
+        self.station_index: StationIndex | None = station_index
+        self.traci_calls: TraciCallCounter = TraciCallCounter()
+        self.simulation_state: dict[int, object] = {}
+        self.vehicles_tank_mg: dict[str, float] = {}
+        self.vehicles_edge: dict[str, str] = {}
+        self.routed_stations: dict[str, FuelType] = {}
+        self.station_choices: dict[str, StationChoice] = {}
+        self.reroutes: dict[FuelType, int] = dict.fromkeys(FuelType, 0)
+        # refuel routes are taken from station route trees if a net is given
+        self.net_file: Path | None = net_file
+        self.station_router: StationRouter | None = None
+        self.station_route_refresh_sec: float | None = station_route_refresh_sec
+        self.travel_times_time_sec: float | None = None
+        # edge of the travel times subscription waiting for its results
+        self.travel_times_anchor: str | None = None
 
-    def route_to_nearest_gas_station(
-        self, vehicle_id: str, gas_stations: list[GasStation], stop_duration_sec: int
-    ) -> None:
-        vehicle_lane: str = cast(str, traci.vehicle.getLaneID(vehID=vehicle_id))
-        vehicle_edge: str = cast(str, traci.lane.getEdgeID(laneID=vehicle_lane))
+    def start(self, command: list, port: int | None, label: str) -> None:
+        command = [str(argument) for argument in command]
+        if self.backend == SumoBackend.libsumo:
+            # libsumo runs in process, there is no port or connection label
+            self.sumo.start(command)
+        else:
+            self.sumo.start(cmd=command, port=port, label=label)
+
+    def close(self) -> None:
+        self.sumo.close()
+
+    def save_state(self, state_file: Path) -> None:
+        self.sumo.simulation.saveState(str(state_file))
+        self.traci_calls.add()
+
+    def load_state(self, state_file: Path) -> list[str]:
+        self.sumo.simulation.loadState(str(state_file))
+        # vehicle subscriptions do not survive loading a state
+        vehicle_ids: list[str] = self.sumo.vehicle.getIDList()  # type: ignore
+        for vehicle_id in vehicle_ids:
+            self.subscribe_vehicle(vehicle_id=vehicle_id)
+        self.traci_calls.add(2)
+
+        return vehicle_ids
+
+    def set_tank_levels(self, vehicles_tank_mg: dict[str, float]) -> None:
+        for vehicle_id, tank_mg in vehicles_tank_mg.items():
+            self.sumo.vehicle.setParameter(
+                vehicle_id, self.tank_parameter, str(tank_mg)
+            )
+            self.vehicles_tank_mg[vehicle_id] = tank_mg
+        self.traci_calls.add(len(vehicles_tank_mg))
+
+    def subscribe_simulation(self) -> None:
+        self.sumo.simulation.subscribe(self.simulation_variables)
+        self.traci_calls.add()
+        self.simulation_state = self.sumo.simulation.getSubscriptionResults()
+
+    def subscribe_vehicle(self, vehicle_id: str) -> None:
+        # positional arguments, the keyword names differ between traci and libsumo
+        self.sumo.vehicle.subscribe(
+            vehicle_id,
+            self.vehicle_variables,
+            tc.INVALID_DOUBLE_VALUE,
+            tc.INVALID_DOUBLE_VALUE,
+            {tc.VAR_PARAMETER_WITH_KEY: ("s", self.tank_parameter)},
+        )
+        self.traci_calls.add()
+
+    def update_vehicle_states(self) -> None:
+        # subscription results arrive with the simulationStep response, so
+        # reading them back does not cost any additional round trip
+        self.simulation_state = self.sumo.simulation.getSubscriptionResults()
+
+        # SUMO drops the subscriptions of arrived vehicles on its own
+        arrived_vehicles: list[str] = self.get_arrived_vehicles_ids()
+        for vehicle_id in arrived_vehicles:
+            self.vehicles_tank_mg.pop(vehicle_id, None)
+            self.vehicles_edge.pop(vehicle_id, None)
+        self.vehicles.evict(vehicle_ids=arrived_vehicles)
+
+        for vehicle_id in self.simulation_state[tc.VAR_DEPARTED_VEHICLES_IDS]:
+            self.subscribe_vehicle(vehicle_id=vehicle_id)
 
+        vehicles_state = self.sumo.vehicle.getAllSubscriptionResults()
+        for vehicle_id, variables in vehicles_state.items():
+            _, tank_mg = variables[tc.VAR_PARAMETER_WITH_KEY]
+            self.vehicles_tank_mg[vehicle_id] = float(tank_mg)
+            self.vehicles_edge[vehicle_id] = variables[tc.VAR_ROAD_ID]
+
+        if self.travel_times_anchor is not None:
+            self.read_travel_times()
+
+    def simulation_step(self) -> None:
+        self.traci_calls.add()
+        self.sumo.simulationStep()
+
+    def get_min_expected_number(self) -> int:
+        return cast(int, self.simulation_state[tc.VAR_MIN_EXPECTED_VEHICLES])
+
+    def get_time(self) -> float:
+        return cast(float, self.simulation_state[tc.VAR_TIME])
+
+    def get_nearest_gas_station_by_distance(
+        self, vehicle_edge: str, gas_stations: list[GasStation]
+    ) -> GasStation:
         def distance_to_station(gas_station: GasStation) -> GasStation:
-            return traci.simulation.getDistanceRoad(  # type: ignore
+            return self.sumo.simulation.getDistanceRoad(  # type: ignore
                 edgeID1=vehicle_edge,
                 pos1=0,
                 edgeID2=gas_station.lane,
@@ -62,72 +263,212 @@ class SumoClient:
                 isDriving=True,
             )
 
-        nearest_gas_station: GasStation = min(gas_stations, key=distance_to_station)  # type: ignore
+        self.traci_calls.add(len(gas_stations))
+        return min(gas_stations, key=distance_to_station)  # type: ignore
+
+    def get_nearest_gas_station(
+        self, vehicle_edge: str, fuel_type: FuelType, gas_stations: list[GasStation]
+    ) -> GasStation:
+        nearest_gas_station: GasStation | None = None
+
+        if self.station_index is not None:
+            nearest_gas_station = self.station_index.get_nearest_station(
+                edge=vehicle_edge, fuel_type=fuel_type
+            )
+        # internal junction edges and edges without a path to a station are
+        # not part of the index
+        if nearest_gas_station is None:
+            nearest_gas_station = self.get_nearest_gas_station_by_distance(
+                vehicle_edge=vehicle_edge, gas_stations=gas_stations
+            )
+
+        return nearest_gas_station
+
+    def get_station_router(self) -> StationRouter | None:
+        if self.net_file is None:
+            return None
+
+        if self.station_router is None:
+            self.logger.info(f"Reading station routes network {self.net_file}")
+            self.station_router = StationRouter(
+                network=RoadNetwork.read(self.net_file, vehicle_class=VEHICLE_CLASS),
+                logger=self.logger,
+            )
+        return self.station_router
+
+    def refresh_travel_times(self, station_router: StationRouter) -> None:
+        if self.station_route_refresh_sec is None:
+            return
+
+        time_sec = self.get_time()
+        if (
+            self.travel_times_time_sec is not None
+            and time_sec - self.travel_times_time_sec < self.station_route_refresh_sec
+        ):
+            return
+
+        # One context subscription returns the travel times of all edges with
+        # the response of the next step, instead of a round trip per edge.
+        # Until then the routes keep the previous travel times.
+        if self.travel_times_anchor is None:
+            self.travel_times_anchor = next(iter(station_router.network.travel_times))
+            self.sumo.edge.subscribeContext(
+                self.travel_times_anchor,
+                tc.CMD_GET_EDGE_VARIABLE,
+                self.travel_times_range_m,
+                [tc.VAR_CURRENT_TRAVELTIME],
+            )
+            self.traci_calls.add()
+        self.travel_times_time_sec = time_sec
+
+    def read_travel_times(self) -> None:
+        assert self.travel_times_anchor is not None
+        results = self.sumo.edge.getContextSubscriptionResults(self.travel_times_anchor)
+        # read once, a kept subscription would send every edge with every step
+        self.sumo.edge.unsubscribeContext(
+            self.travel_times_anchor,
+            tc.CMD_GET_EDGE_VARIABLE,
+            self.travel_times_range_m,
+        )
+        self.traci_calls.add()
+        self.traci_calls.add_subscription_read()
+        self.travel_times_anchor = None
+
+        # the subscription was made for the station router in use
+        station_router = self.station_router
+        if station_router is None or not results:
+            return
+        station_router.update_travel_times(
+            {
+                edge: variables[tc.VAR_CURRENT_TRAVELTIME]
+                for edge, variables in results.items()
+                if edge in station_router.network.travel_times
+            }
+        )
 
-        traci.vehicle.setVia(vehID=vehicle_id, edgeList=nearest_gas_station.lane)
-        traci.vehicle.rerouteTraveltime(vehID=vehicle_id)
-        traci.vehicle.setChargingStationStop(
+    def set_route_via_station(
+        self, vehicle_id: str, vehicle_edge: str, gas_station: GasStation
+    ) -> bool:
+        station_router = self.get_station_router()
+        # a route has to start on the current edge, junctions have no trees
+        if station_router is None or vehicle_edge.startswith(":"):
+            return False
+
+        route: list[str] = self.sumo.vehicle.getRoute(vehicle_id)  # type: ignore
+        self.traci_calls.add()
+        new_route = station_router.get_route(
+            edge=vehicle_edge, station_edge=gas_station.lane, destination_edge=route[-1]
+        )
+        if new_route is None:
+            return False
+
+        self.sumo.vehicle.setRoute(vehicle_id, new_route)
+        self.traci_calls.add()
+        return True
+
+    def route_to_nearest_gas_station(
+        self,
+        vehicle_id: str,
+        fuel_type: FuelType,
+        gas_stations: list[GasStation],
+        stop_duration_sec: int,
+    ) -> None:
+        vehicle_edge: str = self.vehicles_edge[vehicle_id]
+        nearest_gas_station = self.get_nearest_gas_station(
+            vehicle_edge=vehicle_edge, fuel_type=fuel_type, gas_stations=gas_stations
+        )
+
+        if not self.set_route_via_station(
+            vehicle_id=vehicle_id,
+            vehicle_edge=vehicle_edge,
+            gas_station=nearest_gas_station,
+        ):
+            self.sumo.vehicle.setVia(
+                vehID=vehicle_id, edgeList=nearest_gas_station.lane
+            )
+            self.sumo.vehicle.rerouteTraveltime(vehID=vehicle_id)
+            self.traci_calls.add(2)
+        self.sumo.vehicle.setChargingStationStop(
             vehID=vehicle_id,
             stopID=nearest_gas_station.id,
             duration=stop_duration_sec,
         )
+        self.traci_calls.add()
+        self.routed_stations[nearest_gas_station.id] = nearest_gas_station.fuel_type
+        self.station_choices[vehicle_id] = StationChoice(
+            edge=vehicle_edge, fuel_type=fuel_type, station=nearest_gas_station.id
+        )
+        self.reroutes[fuel_type] += 1
         self.logger.info(f"Routing {vehicle_id=} to {nearest_gas_station=}")
 
+    def route_to_nearest_gas_stations(self, requests: list[RefuelRequest]) -> None:
+        # the travel times are refreshed once for all vehicles of a step
+        station_router = self.get_station_router() if requests else None
+        if station_router is not None:
+            self.refresh_travel_times(station_router=station_router)
+
+        for request in requests:
+            self.route_to_nearest_gas_station(
+                vehicle_id=request.vehicle_id,
+                fuel_type=request.fuel_type,
+                gas_stations=request.gas_stations,
+                stop_duration_sec=request.stop_duration_sec,
+            )
+
     def get_loaded_vehicles_ids(self) -> list[str]:
-        return traci.simulation.getLoadedIDList()  # type: ignore
+        return cast(list[str], self.simulation_state[tc.VAR_LOADED_VEHICLES_IDS])
+
+    def get_departed_vehicles_ids(self) -> list[str]:
+        return cast(list[str], self.simulation_state[tc.VAR_DEPARTED_VEHICLES_IDS])
+
+    def get_arrived_vehicles_ids(self) -> list[str]:
+        return cast(list[str], self.simulation_state[tc.VAR_ARRIVED_VEHICLES_IDS])
 
     def get_vehicles_ids_in_simulation(self) -> list[str]:
-        return traci.vehicle.getIDList()
+        return list(self.vehicles_tank_mg)
+
+    def has_tank_level(self, vehicle_id: str) -> bool:
+        return vehicle_id in self.vehicles_tank_mg
 
     def get_tank_level_liters(self, vehicle_id: str) -> float:
-        tank_mg_response: str = cast(
-            str,
-            traci.vehicle.getParameter(
-                objectID=vehicle_id, key="device.battery.actualBatteryCapacity"
-            ),
-        )
-        tank_mg = float(tank_mg_response)
+        self.traci_calls.add_subscription_read()
+        tank_mg = self.vehicles_tank_mg[vehicle_id]
         return tank_mg / self.mg_in_liters  # mg in liter
 
     def set_vehicle_type(self, vehicle_id: str, vehicle_type: Vehicle) -> None:
         vehicle_parameters: dict = {
-            "device.battery.actualBatteryCapacity": vehicle_type.tank_liters
-            * self.mg_in_liters,
-            "vehicleMass": vehicle_type.mass_kg,
-            "frontSurfaceArea": vehicle_type.front_surface_area,
-            "airDragCoefficient": vehicle_type.air_drag_coefficient,
-            "constantPowerIntake": vehicle_type.constant_power_intake,
-            "internalMomentOfInertia": vehicle_type.internal_moment_of_inertia,
-            "rollDragCoefficient": vehicle_type.roll_drag_coefficient,
-            "propulsionEfficiency": vehicle_type.propulsion_efficiency,
-            "recuperationEfficiency": vehicle_type.recuperatoin_efficiency,
-            "vehicleFuelType": vehicle_type.fuel_type.name,
-            "wheelRadius": vehicle_type.wheel_radius,
-            "gearRatio": vehicle_type.gear_ratio,
-            "maximumTorque": vehicle_type.maximum_torque,
-            "maximumPower": vehicle_type.maximum_power,
-            "maximumRecuperationTorque": vehicle_type.maximum_recuperation_torque,
-            "maximumRecuperationPower": vehicle_type.maximum_recuperation_power,
-            "internalBatteryResistance": vehicle_type.internal_battery_resistance,
-            "nominalBatteryVoltage": vehicle_type.nominal_battery_voltage,
+            **vehicle_type.tank_parameters(),
+            **vehicle_type.physics_parameters(),
         }
 
         for key, value in vehicle_parameters.items():
-            traci.vehicle.setParameter(vehicle_id, key, value)
+            self.sumo.vehicle.setParameter(vehicle_id, key, str(value))
 
-        traci.vehicle.setColor(vehicle_id, vehicle_type.colour)
-        self.configured_vehicles.add(vehicle_id)
+        self.sumo.vehicle.setColor(vehicle_id, vehicle_type.colour)
+        self.traci_calls.add(len(vehicle_parameters) + 1)
+        self.vehicles.set_flag(vehicle_id=vehicle_id, flag=VehicleFlag.configured)
 
     def set_vehicle_class_to_custom1(self) -> None:
-        vehicle_types: list[str] = traci.vehicletype.getIDList()  # type: ignore
+        vehicle_types: list[str] = self.sumo.vehicletype.getIDList()  # type: ignore
         for vehicle_type in vehicle_types:
-            traci.vehicletype.setVehicleClass(typeID=vehicle_type, clazz="custom1")
+            self.sumo.vehicletype.setVehicleClass(
+                typeID=vehicle_type, clazz=VEHICLE_CLASS
+            )
+        self.traci_calls.add(len(vehicle_types) + 1)
 
-    def get_configured_vehicles(self) -> set[str]:
-        return self.configured_vehicles
+    def is_configured(self, vehicle_id: str) -> bool:
+        return self.vehicles.has_flag(
+            vehicle_id=vehicle_id, flag=VehicleFlag.configured
+        )
+
+    def is_routed(self, vehicle_id: str) -> bool:
+        return self.vehicles.has_flag(vehicle_id=vehicle_id, flag=VehicleFlag.routed)
+
+    def set_routed(self, vehicle_id: str) -> None:
+        self.vehicles.set_flag(vehicle_id=vehicle_id, flag=VehicleFlag.routed)
 
 
-class Step(traci.StepListener):
+class Step(ABC):
     def __init__(
         self,
         client: SumoClient,
@@ -140,13 +481,26 @@ class Step(traci.StepListener):
         self.scenario_config: ScenarioConfig = scenario_config
         self.client: SumoClient = client
 
+    # called by SimulationService after every simulation step, traci step
+    # listeners are not used because libsumo does not support them the same way
+    @abstractmethod
+    def step(self, t: int = 0) -> bool: ...
+
+
+class MonitorVehicles(Step):
+    def step(self, t: int = 0) -> bool:
+        self.client.update_vehicle_states()
+        return True
+
 
 class ConfigureVehicle(Step):
-    def step(self, t: int = 0) -> bool:  # type: ignore
+    def step(self, t: int = 0) -> bool:
         loaded_vehicle_ids: list[str] = self.client.get_loaded_vehicles_ids()
 
         for vehicle_id in loaded_vehicle_ids:
-            vehicle_type: Vehicle = self.scenario_config.vehicles[vehicle_id]
+            vehicle_type: Vehicle = self.scenario_config.vehicles.get_vehicle(
+                vehicle_id
+            )
             self.client.set_vehicle_type(
                 vehicle_id=vehicle_id,
                 vehicle_type=vehicle_type,
@@ -156,45 +510,95 @@ class ConfigureVehicle(Step):
 
 
 class VehicleRouter(Step):
-    routed_vehicles: set = set()
-
-    def step(self, t: int = 0) -> bool:  # type: ignore
-        vehicles: set[str] = set(self.client.get_vehicles_ids_in_simulation())
-        configured_vehicles: set[str] = self.client.get_configured_vehicles()
-        configured_vehicles_in_simulation: set[str] = configured_vehicles & vehicles
-        vehicles_to_check: set[str] = (
-            configured_vehicles_in_simulation - self.routed_vehicles
+    def __init__(
+        self,
+        client: SumoClient,
+        logger: Logger,
+        simulation_config: SimulationConfig,
+        scenario_config: ScenarioConfig,
+    ) -> None:
+        super().__init__(
+            client=client,
+            logger=logger,
+            simulation_config=simulation_config,
+            scenario_config=scenario_config,
         )
-        vehicles_tank_level: dict[str, float] = {
-            vehicle_id: self.client.get_tank_level_liters(vehicle_id=vehicle_id)
-            for vehicle_id in vehicles_to_check
-        }
-        vehicles_to_reroute: list[str] = [
-            vehicle_id
-            for vehicle_id, tank_level_l in vehicles_tank_level.items()
-            if tank_level_l < self.simulation_config.fuel_threshold_liters
-        ]
+        self.scheduler: RefuelScheduler = RefuelScheduler(
+            threshold_liters=simulation_config.fuel_threshold_liters,
+            safety_margin=simulation_config.refuel_check_safety_margin,
+            max_interval_sec=simulation_config.refuel_check_max_interval_sec,
+        )
+        self.started: bool = False
+
+    def schedule_new_vehicles(self, time_sec: float) -> None:
+        new_vehicles: list[str] = self.client.get_departed_vehicles_ids()
+        if not self.started:
+            # vehicles restored from a snapshot did not depart in this run
+            new_vehicles = [
+                *self.client.get_vehicles_ids_in_simulation(),
+                *new_vehicles,
+            ]
+            self.started = True
+        for vehicle_id in new_vehicles:
+            if not self.client.is_routed(vehicle_id=vehicle_id):
+                self.scheduler.schedule(vehicle_id=vehicle_id, due_sec=time_sec)
+        for vehicle_id in self.client.get_arrived_vehicles_ids():
+            self.scheduler.remove(vehicle_id=vehicle_id)
+
+    def step(self, t: int = 0) -> bool:
+        time_sec: float = self.client.get_time()
+        self.schedule_new_vehicles(time_sec=time_sec)
+        vehicles_to_reroute: list[str] = []
 
+        for vehicle_id in self.scheduler.pop_due(time_sec=time_sec):
+            is_ready: bool = self.client.is_configured(
+                vehicle_id=vehicle_id
+            ) and self.client.has_tank_level(vehicle_id=vehicle_id)
+            # not configured or without a tank reading yet, retried next step
+            if not is_ready:
+                self.scheduler.schedule(vehicle_id=vehicle_id, due_sec=time_sec)
+                continue
+
+            tank_level_l = self.client.get_tank_level_liters(vehicle_id=vehicle_id)
+            if tank_level_l < self.simulation_config.fuel_threshold_liters:
+                vehicles_to_reroute.append(vehicle_id)
+                self.scheduler.remove(vehicle_id=vehicle_id)
+                continue
+
+            next_check_sec = self.scheduler.get_next_check(
+                vehicle_id=vehicle_id, time_sec=time_sec, tank_liters=tank_level_l
+            )
+            self.scheduler.schedule(vehicle_id=vehicle_id, due_sec=next_check_sec)
+
+        vehicles: Fleet = self.scenario_config.vehicles
+        requests: list[RefuelRequest] = []
         for vehicle_id in vehicles_to_reroute:
-            vehicle_type: Vehicle = self.scenario_config.vehicles[vehicle_id]
-            if vehicle_type.fuel_type == FuelType.petrol:
+            fuel_type: FuelType = vehicles.get_fuel_type(vehicle_id)
+            if fuel_type == FuelType.petrol:
                 charging_station = self.scenario_config.fuel_stations
             else:
                 charging_station = self.scenario_config.hydrogen_stations
 
-            self.client.route_to_nearest_gas_station(
-                vehicle_id=vehicle_id,
-                gas_stations=charging_station,
-                stop_duration_sec=vehicle_type.charging_duration_seconds,
+            requests.append(
+                RefuelRequest(
+                    vehicle_id=vehicle_id,
+                    fuel_type=fuel_type,
+                    gas_stations=charging_station,
+                    stop_duration_sec=vehicles.get_charging_duration(vehicle_id),
+                )
             )
 
-        self.routed_vehicles.update(vehicles_to_reroute)
+        self.client.route_to_nearest_gas_stations(requests=requests)
+        for request in requests:
+            self.client.set_routed(vehicle_id=request.vehicle_id)
 
         return True
 
 
 class SimulationService(Service):
+    # MonitorVehicles has to go first, the other listeners read its snapshot
     listeners: tuple[type[Step], ...] = (
+        MonitorVehicles,
         VehicleRouter,
         ConfigureVehicle,
     )
@@ -206,13 +610,73 @@ class SimulationService(Service):
         scenario_config: ScenarioConfig,
         scenario_path: Path,
         output_folder: Path,
+        route_file: Path | None = None,
+        station_index: StationIndex | None = None,
+        port: int | None = None,
+        label: str = "default",
+        backend: SumoBackend = SumoBackend.traci,
+        snapshot_store: SnapshotStore | None = None,
+        snapshot: Snapshot | None = None,
+        replay_trace: Path | None = None,
     ) -> None:
         self.simulation_config: SimulationConfig = simulation_config
         self.scenario_config: ScenarioConfig = scenario_config
         self.scenario_path: Path = scenario_path
         self.output_folder = output_folder
+        self.route_file: Path | None = route_file
+        self.port: int | None = port
+        self.label: str = label
         self.logger: Logger = logger
-        self.client = SumoClient(logger=logger)
+        self.client = SumoClient(
+            logger=logger,
+            station_index=station_index,
+            backend=backend,
+            record_trace=output_folder / outputs.TRACI_TRACE_OUTPUT
+            if simulation_config.record_traci_trace
+            else None,
+            replay_trace=replay_trace,
+            net_file=scenario_path / simulation_config.net_path
+            if simulation_config.station_route_trees
+            else None,
+            station_route_refresh_sec=simulation_config.station_route_refresh_sec,
+            # vehicles of a baked route file are loaded fully configured
+            vehicles=VehicleRegistry(
+                default_flags=VehicleFlag.configured
+                if route_file is not None
+                else VehicleFlag(0)
+            ),
+        )
+        self.step_listeners: list[Step] = []
+        self.steps_per_second: float = 0.0
+        self.snapshot_store: SnapshotStore | None = snapshot_store
+        self.snapshot: Snapshot | None = snapshot
+        self.snapshot_times_sec: list[int] = sorted(
+            time_sec
+            for time_sec in simulation_config.snapshot_times_sec
+            if snapshot is None or time_sec > snapshot.time_sec
+        )
+        self.profiler: SimulationProfiler | None = None
+        if simulation_config.profile:
+            self.profiler = SimulationProfiler(
+                logger=logger, log_interval_sec=simulation_config.profile_interval_sec
+            )
+        self.telemetry: SimulationTelemetry | None = None
+        if simulation_config.telemetry_port is not None:
+            self.telemetry = get_simulation_telemetry(
+                logger=logger,
+                host=simulation_config.telemetry_host,
+                port=simulation_config.telemetry_port,
+                label=label,
+                rate_window_sec=simulation_config.telemetry_rate_window_sec,
+            )
+
+        if self.route_file is not None:
+            # vehicles are loaded fully configured from the baked route file
+            self.listeners = tuple(
+                listener
+                for listener in self.listeners
+                if listener is not ConfigureVehicle
+            )
 
     def run(self) -> None:
         try:
@@ -221,7 +685,11 @@ class SimulationService(Service):
             self.logger.warning("Simulation inerrupted by user")
         finally:
             self.logger.info("Simulation has been completed")
-            traci.close()
+            self.client.close()
+            if self.telemetry is not None:
+                self.telemetry.stop()
+            if self.profiler is not None:
+                self.profiler.dump(self.output_folder / outputs.PROFILE_OUTPUT)
 
     def add_simulation_listeners(self) -> None:
         for listener_type in self.listeners:
@@ -231,37 +699,178 @@ class SimulationService(Service):
                 client=self.client,
                 logger=self.logger,
             )
-            traci.addStepListener(listener=listener)
+            self.step_listeners.append(listener)
 
-    def simulation_loop(self) -> None:
+    def notify_simulation_listeners(self) -> None:
+        for listener in self.step_listeners:
+            listener.step()
+
+    def push_telemetry(self, step_latency_sec: float) -> None:
+        if self.telemetry is None:
+            return
+
+        self.telemetry.push(
+            StepSample(
+                wall_time=time.time(),
+                simulated_sec=self.client.get_time(),
+                loaded=len(self.client.get_loaded_vehicles_ids()),
+                running=len(self.client.vehicles_tank_mg),
+                arrived=len(self.client.get_arrived_vehicles_ids()),
+                traci_calls=self.client.traci_calls.step_calls,
+                step_latency_sec=step_latency_sec,
+                reroutes=dict(self.client.reroutes),
+            )
+        )
+
+    def build_sumo_command(self) -> list:
         sumocfg_file: Path = self.scenario_path.joinpath(
             self.simulation_config.sumocfg_file_path
         )
-        traci.start(
-            cmd=[
-                "sumo",
-                "-c",
-                sumocfg_file,
-                "--fcd-output",
-                self.output_folder / "fcd.out.xml",
-                "--fcd-output.acceleration",
-                "--statistic-output",
-                self.output_folder / "statistics.out.xml",
-                "--chargingstations-output",
-                self.output_folder / "chargingstations.out.xml",
-                "--summary-output",
-                self.output_folder / "summary.out.xml",
-                "--battery-output.precision",
-                "4",
-                "--battery-output",
-                self.output_folder / "battery.out.xml",
-            ]
+        command: list = [
+            "sumo",
+            "-c",
+            sumocfg_file,
+            "--fcd-output",
+            self.output_folder / outputs.FCD_OUTPUT,
+            "--fcd-output.acceleration",
+            "--statistic-output",
+            self.output_folder / outputs.STATISTICS_OUTPUT,
+            "--chargingstations-output",
+            self.output_folder / outputs.CHARGING_STATIONS_OUTPUT,
+            "--summary-output",
+            self.output_folder / outputs.SUMMARY_OUTPUT,
+            "--battery-output.precision",
+            "4",
+            "--battery-output",
+            self.output_folder / outputs.BATTERY_OUTPUT,
+        ]
+        if self.route_file is not None:
+            command.extend(["--route-files", self.route_file])
+        if self.simulation_config.sumo_threads is not None:
+            command.extend(["--threads", str(self.simulation_config.sumo_threads)])
+        if self.simulation_config.seed is not None:
+            command.extend(["--seed", str(self.simulation_config.seed)])
+
+        return command
+
+    def is_running(self) -> bool:
+        end_time_sec = self.simulation_config.end_time_sec
+        if end_time_sec is not None and self.client.get_time() >= end_time_sec:
+            return False
+
+        return self.client.get_min_expected_number() > 0
+
+    def restore_snapshot(self, snapshot: Snapshot) -> None:
+        if self.snapshot_store is None:
+            return
+
+        vehicle_ids = self.client.load_state(
+            state_file=self.snapshot_store.get_state_file(snapshot)
         )
+        if self.route_file is None:
+            for vehicle_id in vehicle_ids:
+                self.client.set_vehicle_type(
+                    vehicle_id=vehicle_id,
+                    vehicle_type=self.scenario_config.vehicles.get_vehicle(vehicle_id),
+                )
+        self.client.set_tank_levels(
+            vehicles_tank_mg={
+                vehicle_id: snapshot.vehicles_tank_mg[vehicle_id]
+                for vehicle_id in vehicle_ids
+                if vehicle_id in snapshot.vehicles_tank_mg
+            }
+        )
+        for vehicle_id in snapshot.configured_vehicles:
+            self.client.vehicles.set_flag(
+                vehicle_id=vehicle_id, flag=VehicleFlag.configured
+            )
+        for vehicle_id in snapshot.routed_vehicles:
+            self.client.set_routed(vehicle_id=vehicle_id)
+        self.client.routed_stations.update(snapshot.routed_stations)
+        self.client.station_choices.update(snapshot.station_choices)
+        self.logger.warning(
+            f"Resumed from the snapshot at {snapshot.time_sec}s, "
+            "the outputs start at that time"
+        )
+
+    def save_snapshot(self) -> None:
+        time_sec = self.client.get_time()
+        if self.snapshot_store is None or not self.snapshot_times_sec:
+            return
+        if time_sec < self.snapshot_times_sec[0]:
+            return
+
+        self.snapshot_times_sec.pop(0)
+        tmp_state_file = self.snapshot_store.get_tmp_state_file(time_sec)
+        self.client.save_state(state_file=tmp_state_file)
+        snapshot = Snapshot(
+            time_sec=time_sec,
+            state_file=tmp_state_file.name,
+            fleet_file="",
+            configured_vehicles=sorted(
+                self.client.vehicles.get_vehicle_ids(flag=VehicleFlag.configured)
+            ),
+            routed_vehicles=sorted(
+                self.client.vehicles.get_vehicle_ids(flag=VehicleFlag.routed)
+            ),
+            routed_stations=self.client.routed_stations,
+            station_choices=self.client.station_choices,
+            hydrogen_stations=sorted(
+                station.id for station in self.scenario_config.hydrogen_stations
+            ),
+            vehicles_tank_mg=self.client.vehicles_tank_mg,
+        )
+        self.snapshot_store.save(
+            snapshot=snapshot,
+            tmp_state_file=tmp_state_file,
+            fleet=self.scenario_config.vehicles,
+        )
+
+    def simulation_loop(self) -> None:
+        if self.profiler is not None:
+            self.profiler.instrument(target=self.client, prefix="client")
+        self.client.start(
+            command=self.build_sumo_command(), port=self.port, label=self.label
+        )
+        if self.snapshot is not None:
+            self.restore_snapshot(snapshot=self.snapshot)
         self.client.set_vehicle_class_to_custom1()
+        self.client.subscribe_simulation()
         self.add_simulation_listeners()
+        if self.profiler is not None:
+            for listener in self.step_listeners:
+                self.profiler.instrument(
+                    target=listener, prefix=f"listener.{type(listener).__name__}"
+                )
+
+        if self.telemetry is not None:
+            self.telemetry.start()
 
-        while traci.simulation.getMinExpectedNumber() > 0:  # type: ignore
-            traci.simulationStep()
+        started = time.perf_counter()
+        while self.is_running():
+            if self.profiler is not None:
+                self.profiler.start_step()
+            step_started = time.perf_counter()
+            self.client.simulation_step()
+            step_latency_sec = time.perf_counter() - step_started
+            self.notify_simulation_listeners()
+            self.save_snapshot()
+            self.push_telemetry(step_latency_sec=step_latency_sec)
+            self.client.traci_calls.next_step()
+            if self.profiler is not None:
+                self.profiler.end_step(
+                    simulated_sec=self.client.get_time(),
+                    vehicles=len(self.client.vehicles_tank_mg),
+                )
+
+        elapsed = time.perf_counter() - started
+        steps = self.client.traci_calls.steps
+        self.steps_per_second = steps / elapsed if elapsed > 0 else 0.0
+        self.logger.info(
+            f"{steps} steps in {elapsed:.1f}s ({self.steps_per_second:.1f} steps/s) "
+            f"with the {self.client.backend.value} backend"
+        )
+        self.logger.info(self.client.traci_calls.report())
 
 
 class ScenarioParser:
@@ -277,8 +886,8 @@ class ScenarioParser:
         self.simulation_config = simulation_config
         self.hydrogen_stations = hydrogen_stations
 
-    def get_scenario_config(self) -> ScenarioConfig:
-        vehicle_ids = self.get_vehicle_ids()
+    def get_scenario_config(self, logger: Logger) -> ScenarioConfig:
+        vehicle_ids = self.get_vehicle_ids(logger)
         vehicles = self.generate_vehicle_configs(vehicle_ids)
         fuel_stations, hydrogen_stations = self.get_fuel_stations()
         return ScenarioConfig(
@@ -287,21 +896,24 @@ class ScenarioParser:
             vehicles=vehicles,
         )
 
-    def get_vehicle_ids(self) -> list[str]:
-        routes = self.scenario_path / self.simulation_config.route_file_path
-        routers_root = ElementTree.parse(routes)
-        return [vehicle.attrib["id"] for vehicle in routers_root.findall("vehicle")]  # type: ignore
-
-    def generate_vehicle_configs(self, vehicle_ids: list[str]) -> dict[str, Vehicle]:
-        vehicles_configs: dict[str, Vehicle] = {}
-
-        for vehicle_id in vehicle_ids:
-            if random.random() < self.percent_of_hydrogen_cars:
-                vehicles_configs[vehicle_id] = get_murai_vehicle_properties()
-            else:
-                vehicles_configs[vehicle_id] = get_petrol_vehicle_properties()
+    def get_vehicle_ids(self, logger: Logger) -> list[str]:
+        route_index = get_route_index(
+            scenario_path=self.scenario_path,
+            simulation_config=self.simulation_config,
+            logger=logger,
+        )
+        return route_index.vehicle_ids
 
-        return vehicles_configs
+    def generate_vehicle_configs(self, vehicle_ids: list[str]) -> Fleet:
+        return Fleet.generate(
+            vehicle_ids=vehicle_ids,
+            profiles=[get_murai_vehicle_profile(), get_petrol_vehicle_profile()],
+            shares=[
+                self.percent_of_hydrogen_cars,
+                1 - self.percent_of_hydrogen_cars,
+            ],
+            rng=np.random.default_rng(self.simulation_config.seed),
+        )
 
     def get_fuel_stations(self) -> tuple[FuelStations, HydrogenStations]:
         gas_stations_path = (
@@ -338,6 +950,10 @@ def get_simulation_service(
     hydrogen_stations: set[str],
     scenario_path: Path,
     percent_of_hydrogen_cars: float,
+    port: int | None = None,
+    label: str = "default",
+    output_folder: Path | None = None,
+    cache: ArtifactCache | None = None,
 ) -> Service:
     scenario_parser = ScenarioParser(
         simulation_config=simulation_config,
@@ -346,13 +962,57 @@ def get_simulation_service(
         percent_of_hydrogen_cars=percent_of_hydrogen_cars,
     )
 
-    scenario_config: ScenarioConfig = scenario_parser.get_scenario_config()
-    out_folder_name = f"out_hydrogen_cars_{percent_of_hydrogen_cars}_hydrogen_stations_{'_'.join(hydrogen_stations)}"  # noqa
-    output_folder = scenario_path / out_folder_name
+    scenario_config: ScenarioConfig = scenario_parser.get_scenario_config(logger)
+
+    station_index: StationIndex = get_station_index(
+        scenario_path=scenario_path,
+        simulation_config=simulation_config,
+        fuel_stations=scenario_config.fuel_stations,
+        hydrogen_stations=scenario_config.hydrogen_stations,
+        logger=logger,
+        cache=cache,
+    )
+
+    snapshot_store: SnapshotStore | None = None
+    snapshot: Snapshot | None = None
+    if simulation_config.snapshot_times_sec or simulation_config.resume_from_snapshot:
+        snapshot_store = SnapshotStore(
+            scenario_path=scenario_path,
+            simulation_config=simulation_config,
+            percent_of_hydrogen_cars=percent_of_hydrogen_cars,
+            logger=logger,
+        )
+    if snapshot_store is not None and simulation_config.resume_from_snapshot:
+        snapshot = snapshot_store.find_latest(
+            hydrogen_stations=scenario_config.hydrogen_stations,
+            station_index=station_index,
+            before_sec=simulation_config.end_time_sec,
+        )
+    if snapshot_store is not None and snapshot is not None:
+        # the vehicles of the snapshot keep their fuel type in every branch
+        scenario_config.vehicles = snapshot_store.load_fleet(snapshot)
+        scenario_config.resumed_from_sec = snapshot.time_sec
+
+    if output_folder is None:
+        out_folder_name = f"out_hydrogen_cars_{percent_of_hydrogen_cars}_hydrogen_stations_{'_'.join(hydrogen_stations)}"  # noqa
+        if simulation_config.seed is not None:
+            out_folder_name += f"_seed_{simulation_config.seed}"
+        output_folder = scenario_path / out_folder_name
     output_folder.mkdir(exist_ok=False)
 
-    with (output_folder / "scenario_config.json").open(mode="w") as f:
-        f.write(scenario_config.model_dump_json())
+    save_scenario_config(scenario_config=scenario_config, output_folder=output_folder)
+
+    route_file: Path | None = None
+    if simulation_config.bake_vehicle_parameters:
+        route_file = output_folder / simulation_config.vehicle_route_file_path
+        route_writer = VehicleRouteWriter(
+            vehicles=scenario_config.vehicles,
+            source_route_file=scenario_path / simulation_config.route_file_path,
+            vehicle_type_file=scenario_path / simulation_config.vehicle_type_path,
+            vehicle_type_name=simulation_config.vehicle_type_name,
+            logger=logger,
+        )
+        route_writer.write(route_file=route_file)
 
     return SimulationService(
         logger=logger,
@@ -360,4 +1020,11 @@ def get_simulation_service(
         output_folder=output_folder,
         scenario_config=scenario_config,
         scenario_path=scenario_path,
+        route_file=route_file,
+        station_index=station_index,
+        port=port,
+        label=label,
+        backend=simulation_config.sumo_backend,
+        snapshot_store=snapshot_store,
+        snapshot=snapshot,
     )
@@ -0,0 +1,156 @@
+import hashlib
+import json
+import os
+
+from logging import Logger
+from pathlib import Path
+
+from h2mob.services.fleet import Fleet
+from h2mob.services.station_index import StationIndex
+from h2mob.settings.simulation import FuelType, GasStation, SimulationConfig
+
+from pydantic import BaseModel, ValidationError
+
+
+class StationChoice(BaseModel):
+    # where a vehicle was routed from and the station it was sent to
+    edge: str
+    fuel_type: FuelType
+    station: str
+
+
+class Snapshot(BaseModel):
+    time_sec: float
+    state_file: str
+    fleet_file: str
+    configured_vehicles: list[str]
+    routed_vehicles: list[str]
+    routed_stations: dict[str, FuelType]
+    # a run with another station set can only branch off if it had sent every
+    # vehicle routed before the snapshot to the same station
+    station_choices: dict[str, StationChoice]
+    hydrogen_stations: list[str]
+    vehicles_tank_mg: dict[str, float]
+
+    def is_compatible(
+        self, hydrogen_stations: list[GasStation], station_index: StationIndex
+    ) -> bool:
+        if sorted(station.id for station in hydrogen_stations) == sorted(
+            self.hydrogen_stations
+        ):
+            return True
+
+        # choices from edges outside the index were measured by SUMO, they can
+        # not be checked and keep the snapshot to its own station set
+        for choice in self.station_choices.values():
+            nearest = station_index.get_nearest_station(
+                edge=choice.edge, fuel_type=choice.fuel_type
+            )
+            if nearest is None or nearest.id != choice.station:
+                return False
+        return True
+
+
+class SnapshotStore:
+    def __init__(
+        self,
+        scenario_path: Path,
+        simulation_config: SimulationConfig,
+        percent_of_hydrogen_cars: float,
+        logger: Logger,
+    ) -> None:
+        self.scenario_path: Path = scenario_path
+        self.simulation_config: SimulationConfig = simulation_config
+        self.percent_of_hydrogen_cars: float = percent_of_hydrogen_cars
+        self.logger: Logger = logger
+        self.snapshot_path: Path = (
+            scenario_path / simulation_config.snapshot_path / self.get_inputs_key()
+        )
+
+    def get_inputs_key(self) -> str:
+        # snapshots of changed scenario inputs end up under another key
+        digest = hashlib.sha256()
+        for file_path in (
+            self.simulation_config.sumocfg_file_path,
+            self.simulation_config.net_path,
+            self.simulation_config.route_file_path,
+            self.simulation_config.vehicle_type_path,
+            self.simulation_config.charging_stations_path,
+        ):
+            with (self.scenario_path / file_path).open(mode="rb") as f:
+                digest.update(hashlib.file_digest(f, "sha256").digest())
+
+        parameters = {
+            "percent_of_hydrogen_cars": self.percent_of_hydrogen_cars,
+            **self.simulation_config.model_dump(
+                mode="json",
+                include={"fuel_threshold_liters", "bake_vehicle_parameters", "seed"},
+            ),
+        }
+        digest.update(json.dumps(parameters, sort_keys=True).encode())
+        return digest.hexdigest()[:16]
+
+    def get_snapshot_name(self, time_sec: float, snapshot: Snapshot) -> str:
+        branch_inputs = json.dumps(
+            [snapshot.hydrogen_stations, snapshot.routed_stations],
+            sort_keys=True,
+            default=str,
+        )
+        branch = hashlib.sha256(branch_inputs.encode()).hexdigest()[:8]
+        return f"{int(time_sec):06d}_{branch}"
+
+    def load_snapshots(self) -> list[Snapshot]:
+        snapshots: list[Snapshot] = []
+        for snapshot_file in self.snapshot_path.glob("*.json"):
+            try:
+                snapshots.append(
+                    Snapshot.model_validate_json(snapshot_file.read_text())
+                )
+            except ValidationError:
+                # written by an older version without the station choices
+                self.logger.warning(f"Skipping the outdated snapshot {snapshot_file}")
+        return snapshots
+
+    def find_latest(
+        self,
+        hydrogen_stations: list[GasStation],
+        station_index: StationIndex,
+        before_sec: float | None,
+    ) -> Snapshot | None:
+        snapshots = [
+            snapshot
+            for snapshot in self.load_snapshots()
+            if snapshot.is_compatible(hydrogen_stations, station_index)
+            and (before_sec is None or snapshot.time_sec < before_sec)
+            and (self.snapshot_path / snapshot.state_file).exists()
+            and (self.snapshot_path / snapshot.fleet_file).exists()
+        ]
+        if not snapshots:
+            return None
+
+        return max(snapshots, key=lambda snapshot: snapshot.time_sec)
+
+    def get_state_file(self, snapshot: Snapshot) -> Path:
+        return self.snapshot_path / snapshot.state_file
+
+    def load_fleet(self, snapshot: Snapshot) -> Fleet:
+        return Fleet.load(self.snapshot_path / snapshot.fleet_file)
+
+    def get_tmp_state_file(self, time_sec: float) -> Path:
+        self.snapshot_path.mkdir(parents=True, exist_ok=True)
+        return self.snapshot_path / f".{int(time_sec):06d}_{os.getpid()}.xml.gz"
+
+    def save(self, snapshot: Snapshot, tmp_state_file: Path, fleet: Fleet) -> None:
+        name = self.get_snapshot_name(time_sec=snapshot.time_sec, snapshot=snapshot)
+        snapshot.state_file = f"{name}.xml.gz"
+        snapshot.fleet_file = f"{name}.fleet.npz"
+        # the metadata is written last, a snapshot without it is incomplete,
+        # and renames keep parallel sweep runs from reading half written files
+        os.replace(tmp_state_file, self.snapshot_path / snapshot.state_file)
+        tmp_fleet_file = self.snapshot_path / f".{name}_{os.getpid()}.fleet.npz"
+        fleet.save(tmp_fleet_file)
+        os.replace(tmp_fleet_file, self.snapshot_path / snapshot.fleet_file)
+        tmp_snapshot_file = self.snapshot_path / f".{name}_{os.getpid()}.json"
+        tmp_snapshot_file.write_text(snapshot.model_dump_json())
+        os.replace(tmp_snapshot_file, self.snapshot_path / f"{name}.json")
+        self.logger.info(f"Saved snapshot {name} at {snapshot.time_sec}s")
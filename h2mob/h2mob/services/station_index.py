@@ -0,0 +1,274 @@
+import heapq
+import os
+import tempfile
+
+from logging import Logger
+from pathlib import Path
+
+from h2mob.services.artifact_cache import ArtifactCache
+from h2mob.services.station_routes import RoadNetwork
+from h2mob.settings.simulation import (
+    FuelStations,
+    FuelType,
+    GasStation,
+    HydrogenStations,
+    SimulationConfig,
+)
+
+import numpy as np
+
+from pydantic import BaseModel
+
+
+NearestStation = tuple[str, float]  # station id, distance in meters
+
+
+class StationIndex(BaseModel):
+    stations: dict[str, GasStation]
+    nearest: dict[FuelType, dict[str, NearestStation]]
+
+    def get_nearest_station(self, edge: str, fuel_type: FuelType) -> GasStation | None:
+        nearest = self.nearest[fuel_type].get(edge)
+        if nearest is None:
+            return None
+
+        station_id, _ = nearest
+        return self.stations[station_id]
+
+
+class StationIndexBuilder:
+    def __init__(
+        self,
+        net_file: Path,
+        fuel_stations: FuelStations,
+        hydrogen_stations: HydrogenStations,
+        logger: Logger,
+    ) -> None:
+        self.net_file: Path = net_file
+        self.fuel_stations: FuelStations = fuel_stations
+        self.hydrogen_stations: HydrogenStations = hydrogen_stations
+        self.logger: Logger = logger
+
+    def read_network(self) -> tuple[dict[str, float], dict[str, set[str]]]:
+        network = RoadNetwork.read(self.net_file)
+        return network.lengths, network.predecessors
+
+    @staticmethod
+    def sweep(
+        stations: list[GasStation],
+        edge_lengths: dict[str, float],
+        predecessors: dict[str, set[str]],
+    ) -> dict[str, NearestStation]:
+        # Multi source Dijkstra on the reversed graph, the distance of an edge
+        # is measured from its start to the start of the station edge, the same
+        # way traci.simulation.getDistanceRoad is called at runtime.
+        nearest: dict[str, NearestStation] = {}
+        queue: list[tuple[float, str, str]] = [
+            (0.0, station.lane, station.id) for station in stations
+        ]
+        heapq.heapify(queue)
+
+        while queue:
+            distance, edge, station_id = heapq.heappop(queue)
+            if edge in nearest:
+                continue
+
+            nearest[edge] = (station_id, distance)
+            for predecessor in predecessors.get(edge, ()):
+                if predecessor not in nearest and predecessor in edge_lengths:
+                    heapq.heappush(
+                        queue,
+                        (distance + edge_lengths[predecessor], predecessor, station_id),
+                    )
+
+        return nearest
+
+    def build(self) -> StationIndex:
+        self.logger.info(f"Building station index from {self.net_file}")
+        edge_lengths, predecessors = self.read_network()
+        stations = [*self.fuel_stations, *self.hydrogen_stations]
+
+        index = StationIndex(
+            stations={station.id: station for station in stations},
+            nearest={
+                FuelType.petrol: self.sweep(
+                    self.fuel_stations, edge_lengths, predecessors
+                ),
+                FuelType.hydrogen: self.sweep(
+                    self.hydrogen_stations, edge_lengths, predecessors
+                ),
+            },
+        )
+        self.logger.info(
+            f"Station index covers {len(index.nearest[FuelType.petrol])} edges "
+            f"for petrol and {len(index.nearest[FuelType.hydrogen])} for hydrogen"
+        )
+        return index
+
+
+class StationDistances:
+    def __init__(
+        self, station_ids: list[str], edge_ids: list[str], distances: np.ndarray
+    ) -> None:
+        self.station_ids: list[str] = station_ids
+        self.edge_ids: list[str] = edge_ids
+        # meters from every edge to every station, measured like the station
+        # index, inf for edges without a path to the station
+        self.distances: np.ndarray = distances
+
+    @classmethod
+    def build(
+        cls, net_file: Path, stations: FuelStations, logger: Logger
+    ) -> "StationDistances":
+        logger.info(f"Measuring distances to {len(stations)} stations in {net_file}")
+        network = RoadNetwork.read(net_file)
+        edge_ids = list(network.lengths)
+        edge_index = {edge_id: i for i, edge_id in enumerate(edge_ids)}
+        distances = np.full((len(edge_ids), len(stations)), np.inf, dtype=np.float32)
+        for i, station in enumerate(stations):
+            nearest = StationIndexBuilder.sweep(
+                [station], network.lengths, network.predecessors
+            )
+            for edge, (_, distance) in nearest.items():
+                if edge in edge_index:
+                    distances[edge_index[edge], i] = distance
+
+        return cls(
+            station_ids=[station.id for station in stations],
+            edge_ids=edge_ids,
+            distances=distances,
+        )
+
+    def save(self, distances_file: Path) -> None:
+        with distances_file.open(mode="wb") as f:
+            np.savez(
+                f,
+                station_ids=np.asarray(self.station_ids, dtype=str),
+                edge_ids=np.asarray(self.edge_ids, dtype=str),
+                distances=self.distances,
+            )
+
+    @classmethod
+    def load(cls, distances_file: Path) -> "StationDistances":
+        with np.load(distances_file) as distances:
+            return cls(
+                station_ids=distances["station_ids"].tolist(),
+                edge_ids=distances["edge_ids"].tolist(),
+                distances=distances["distances"],
+            )
+
+
+def get_station_distances(
+    scenario_path: Path,
+    simulation_config: SimulationConfig,
+    stations: FuelStations,
+    file_name: str,
+    logger: Logger,
+) -> StationDistances:
+    distances_file = scenario_path / simulation_config.station_index_path / file_name
+    net_file = scenario_path / simulation_config.net_path
+    charging_stations_file = scenario_path / simulation_config.charging_stations_path
+    inputs_mtime = max(net_file.stat().st_mtime, charging_stations_file.stat().st_mtime)
+
+    if distances_file.exists() and distances_file.stat().st_mtime >= inputs_mtime:
+        distances = StationDistances.load(distances_file)
+        if distances.station_ids == [station.id for station in stations]:
+            logger.info(f"Loaded station distances {distances_file}")
+            return distances
+
+    distances = StationDistances.build(
+        net_file=net_file, stations=stations, logger=logger
+    )
+    distances_file.parent.mkdir(parents=True, exist_ok=True)
+    distances.save(distances_file)
+
+    return distances
+
+
+def get_station_index_file(
+    scenario_path: Path,
+    simulation_config: SimulationConfig,
+    hydrogen_stations: HydrogenStations,
+) -> Path:
+    station_ids = sorted(station.id for station in hydrogen_stations)
+    file_name = f"hydrogen_stations_{'_'.join(station_ids) or 'none'}.json"
+    return scenario_path / simulation_config.station_index_path / file_name
+
+
+def write_index_file(index_file: Path, content: bytes) -> None:
+    # runs of other processes or hosts may read or write the same index, they
+    # only ever see a complete file
+    index_file.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_file = tempfile.mkstemp(
+        dir=index_file.parent, prefix=f".{index_file.name}.", suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, mode="wb") as f:
+            f.write(content)
+        os.replace(tmp_file, index_file)
+    except BaseException:
+        os.unlink(tmp_file)
+        raise
+
+
+def get_station_index(
+    scenario_path: Path,
+    simulation_config: SimulationConfig,
+    fuel_stations: FuelStations,
+    hydrogen_stations: HydrogenStations,
+    logger: Logger,
+    rebuild: bool = False,
+    cache: ArtifactCache | None = None,
+) -> StationIndex:
+    index_file = get_station_index_file(
+        scenario_path=scenario_path,
+        simulation_config=simulation_config,
+        hydrogen_stations=hydrogen_stations,
+    )
+    net_file = scenario_path / simulation_config.net_path
+    charging_stations_file = scenario_path / simulation_config.charging_stations_path
+    inputs_mtime = max(net_file.stat().st_mtime, charging_stations_file.stat().st_mtime)
+
+    if (
+        not rebuild
+        and index_file.exists()
+        and index_file.stat().st_mtime >= inputs_mtime
+    ):
+        logger.info(f"Loading station index {index_file}")
+        return StationIndex.model_validate_json(index_file.read_text())
+
+    cache_key: str | None = None
+    if cache is not None:
+        # the index only depends on the net and the station sets, so scenarios
+        # generated from the same net share it
+        cache_key = cache.get_key(
+            kind="station_index",
+            files=[net_file, charging_stations_file],
+            parameters={
+                "fuel_stations": sorted(station.id for station in fuel_stations),
+                "hydrogen_stations": sorted(
+                    station.id for station in hydrogen_stations
+                ),
+            },
+        )
+        entry = None if rebuild else cache.get(cache_key)
+        if entry is not None:
+            # copied rather than linked, the index mtime has to be newer than
+            # the scenario inputs
+            write_index_file(
+                index_file=index_file, content=(entry / index_file.name).read_bytes()
+            )
+            return StationIndex.model_validate_json(index_file.read_text())
+
+    builder = StationIndexBuilder(
+        net_file=net_file,
+        fuel_stations=fuel_stations,
+        hydrogen_stations=hydrogen_stations,
+        logger=logger,
+    )
+    index = builder.build()
+    write_index_file(index_file=index_file, content=index.model_dump_json().encode())
+    if cache is not None and cache_key is not None:
+        cache.put(key=cache_key, files={index_file.name: index_file})
+
+    return index
@@ -0,0 +1,154 @@
+import heapq
+
+from collections import defaultdict
+from logging import Logger
+from pathlib import Path
+from xml.etree import ElementTree
+
+
+RouteTree = dict[str, str]  # edge -> next edge on the way to or from the root
+
+
+def allows(lane: ElementTree.Element, vehicle_class: str) -> bool:
+    allow = lane.get("allow")
+    if allow is not None:
+        return vehicle_class in allow.split() or allow == "all"
+
+    disallow = lane.get("disallow", "").split()
+    return vehicle_class not in disallow and "all" not in disallow
+
+
+class RoadNetwork:
+    def __init__(
+        self,
+        lengths: dict[str, float],
+        travel_times: dict[str, float],
+        successors: dict[str, set[str]],
+        predecessors: dict[str, set[str]],
+    ) -> None:
+        self.lengths: dict[str, float] = lengths
+        self.travel_times: dict[str, float] = travel_times
+        self.successors: dict[str, set[str]] = successors
+        self.predecessors: dict[str, set[str]] = predecessors
+
+    @classmethod
+    def read(cls, net_file: Path, vehicle_class: str | None = None) -> "RoadNetwork":
+        # without a vehicle class every lane and connection is used
+        lengths: dict[str, float] = {}
+        travel_times: dict[str, float] = {}
+        allowed_lanes: set[str] = set()
+        successors: dict[str, set[str]] = defaultdict(set)
+        predecessors: dict[str, set[str]] = defaultdict(set)
+
+        for _, element in ElementTree.iterparse(net_file):
+            if element.tag == "edge":
+                lanes = [
+                    lane
+                    for lane in element.findall("lane")
+                    if vehicle_class is None or allows(lane, vehicle_class)
+                ]
+                if element.get("function") != "internal" and lanes:
+                    edge_id = element.attrib["id"]
+                    length = float(lanes[0].attrib["length"])
+                    speed = max(float(lane.get("speed", "13.89")) for lane in lanes)
+                    lengths[edge_id] = length
+                    travel_times[edge_id] = length / speed
+                    allowed_lanes.update(lane.attrib["id"] for lane in lanes)
+                element.clear()
+            elif element.tag == "connection":
+                from_edge, to_edge = element.attrib["from"], element.attrib["to"]
+                if not from_edge.startswith(":") and (
+                    vehicle_class is None
+                    or (
+                        f"{from_edge}_{element.get('fromLane')}" in allowed_lanes
+                        and f"{to_edge}_{element.get('toLane')}" in allowed_lanes
+                    )
+                ):
+                    successors[from_edge].add(to_edge)
+                    predecessors[to_edge].add(from_edge)
+                element.clear()
+
+        return cls(
+            lengths=lengths,
+            travel_times=travel_times,
+            successors=successors,
+            predecessors=predecessors,
+        )
+
+
+class StationRouter:
+    def __init__(self, network: RoadNetwork, logger: Logger) -> None:
+        self.network: RoadNetwork = network
+        self.logger: Logger = logger
+        self.travel_times: dict[str, float] = dict(network.travel_times)
+        # built on first use per station edge and dropped with the travel times
+        self.to_station: dict[str, RouteTree] = {}
+        self.from_station: dict[str, RouteTree] = {}
+
+    def update_travel_times(self, travel_times: dict[str, float]) -> None:
+        # the trees stay valid as long as no travel time changed
+        if all(self.travel_times.get(e) == t for e, t in travel_times.items()):
+            return
+        self.travel_times.update(travel_times)
+        self.to_station.clear()
+        self.from_station.clear()
+
+    def build_tree(self, root: str, neighbours: dict[str, set[str]]) -> RouteTree:
+        # Dijkstra from the root, the cost of a step is the travel time of the
+        # edge that is entered, predecessors give the tree towards the root
+        tree: RouteTree = {}
+        costs: dict[str, float] = {root: 0.0}
+        queue: list[tuple[float, str]] = [(0.0, root)]
+
+        while queue:
+            cost, edge = heapq.heappop(queue)
+            if cost > costs[edge]:
+                continue
+
+            for neighbour in neighbours.get(edge, ()):
+                travel_time = self.travel_times.get(neighbour)
+                if travel_time is None:
+                    continue
+                neighbour_cost = cost + travel_time
+                if neighbour_cost < costs.get(neighbour, float("inf")):
+                    costs[neighbour] = neighbour_cost
+                    tree[neighbour] = edge
+                    heapq.heappush(queue, (neighbour_cost, neighbour))
+
+        return tree
+
+    def get_to_station_tree(self, station_edge: str) -> RouteTree:
+        if station_edge not in self.to_station:
+            self.to_station[station_edge] = self.build_tree(
+                root=station_edge, neighbours=self.network.predecessors
+            )
+        return self.to_station[station_edge]
+
+    def get_from_station_tree(self, station_edge: str) -> RouteTree:
+        if station_edge not in self.from_station:
+            self.from_station[station_edge] = self.build_tree(
+                root=station_edge, neighbours=self.network.successors
+            )
+        return self.from_station[station_edge]
+
+    def get_route(
+        self, edge: str, station_edge: str, destination_edge: str
+    ) -> list[str] | None:
+        to_station = self.get_to_station_tree(station_edge)
+        from_station = self.get_from_station_tree(station_edge)
+        if edge != station_edge and edge not in to_station:
+            return None
+        if destination_edge != station_edge and destination_edge not in from_station:
+            return None
+
+        route: list[str] = [edge]
+        while route[-1] != station_edge:
+            route.append(to_station[route[-1]])
+
+        after_station: list[str] = []
+        while destination_edge != station_edge:
+            after_station.append(destination_edge)
+            destination_edge = from_station[destination_edge]
+        route.extend(reversed(after_station))
+
+        return route
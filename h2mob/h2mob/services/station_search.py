@@ -0,0 +1,442 @@
+import hashlib
+import json
+import math
+import os
+
+from abc import ABC, abstractmethod
+from collections.abc import Iterable
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from logging import Logger
+from pathlib import Path
+
+from h2mob.services.analysis import HOURS
+from h2mob.services.simulation import ScenarioParser
+from h2mob.services.surrogate import (
+    SurrogateEstimate,
+    SurrogateModel,
+    get_mean_parameters,
+    get_surrogate_model,
+    get_surrogate_parameters,
+    get_vehicle_profiles,
+)
+from h2mob.services.sweep import SweepJob
+from h2mob.settings.choices import SearchStrategy
+from h2mob.settings.simulation import FuelType, SimulationConfig
+from h2mob.settings.station_search import StationSearchConfig
+from h2mob.settings.surrogate import SurrogateConfig
+
+import numpy as np
+import rich
+
+from loguru import logger as worker_logger
+from pydantic import BaseModel
+from rich.table import Table
+
+
+StationSet = frozenset[str]
+
+
+class StationSetScore(BaseModel):
+    stations: list[str]
+    refuels: float
+    unserved_refuels: float
+    detour_m: float
+    queue_sec: float
+    # seconds per hydrogen refuel, lower is better
+    score: float
+
+
+class StationSearchReport(BaseModel):
+    percent_of_hydrogen_cars: float
+    stations_count: int
+    strategy: SearchStrategy
+    evaluated_sets: int
+    best: list[StationSetScore]
+
+
+def get_queue_time_sec(
+    refuels_per_hour: np.ndarray, service_sec: float, servers: int
+) -> np.ndarray:
+    # total waiting seconds per station, an M/D/1 queue with the servers
+    # pooled for the hours a station keeps up, and the backlog of overloaded
+    # hours carried over as a fluid queue
+    capacity = servers * 3600 / service_sec
+    backlog = np.zeros(len(refuels_per_hour))
+    waiting_sec = np.zeros(len(refuels_per_hour))
+    for hour in range(HOURS):
+        arrivals = refuels_per_hour[:, hour]
+        load = np.minimum(arrivals / capacity, 0.95)
+        waiting_sec += arrivals * load * service_sec / servers / (2 * (1 - load))
+        next_backlog = np.maximum(backlog + arrivals - capacity, 0.0)
+        waiting_sec += (backlog + next_backlog) / 2 * 3600
+        backlog = next_backlog
+
+    return waiting_sec
+
+
+def score_estimate(
+    estimate: SurrogateEstimate, search_config: StationSearchConfig, service_sec: float
+) -> StationSetScore:
+    hydrogen = FuelType.hydrogen.value
+    refuels = estimate.refuels[hydrogen]
+    unserved = estimate.unserved_refuels[hydrogen]
+    # hydrogen stations only serve hydrogen cars
+    refuels_per_hour = np.asarray(
+        [
+            estimate.refuels_per_hour.get(station, [0.0] * HOURS)
+            for station in sorted(estimate.job.hydrogen_stations)
+        ]
+    ).reshape(-1, HOURS)
+    queue_sec = float(
+        get_queue_time_sec(
+            refuels_per_hour,
+            service_sec=service_sec,
+            servers=search_config.search_station_servers,
+        ).sum()
+    ) / max(refuels, 1e-9)
+    detour_m = estimate.distance_to_station_m[hydrogen]
+    unserved_share = unserved / (refuels + unserved) if refuels + unserved > 0 else 0.0
+
+    return StationSetScore(
+        stations=sorted(estimate.job.hydrogen_stations),
+        refuels=refuels,
+        unserved_refuels=unserved,
+        detour_m=detour_m,
+        queue_sec=queue_sec,
+        score=(1 - unserved_share)
+        * (detour_m / search_config.search_detour_speed + queue_sec)
+        + unserved_share * search_config.search_unserved_penalty_sec,
+    )
+
+
+@lru_cache(maxsize=1)
+def get_worker_model(
+    scenario_path: Path, simulation_config_json: str, surrogate_config_json: str
+) -> SurrogateModel:
+    # built once per worker process, configs are passed as JSON to be hashable
+    return get_surrogate_model(
+        scenario_path=scenario_path,
+        simulation_config=SimulationConfig.model_validate_json(simulation_config_json),
+        surrogate_config=SurrogateConfig.model_validate_json(surrogate_config_json),
+        logger=worker_logger,  # type: ignore
+    )
+
+
+def score_station_sets(
+    scenario_path: Path,
+    simulation_config_json: str,
+    surrogate_config_json: str,
+    search_config: StationSearchConfig,
+    percent_of_hydrogen_cars: float,
+    station_sets: list[StationSet],
+) -> list[StationSetScore]:
+    model = get_worker_model(
+        scenario_path, simulation_config_json, surrogate_config_json
+    )
+    service_sec = get_mean_parameters(get_vehicle_profiles()[FuelType.hydrogen])[
+        "charging_duration_seconds"
+    ]
+    estimates = model.evaluate(
+        [
+            SweepJob(
+                percent_of_hydrogen_cars=percent_of_hydrogen_cars,
+                hydrogen_stations=set(station_set),
+            )
+            for station_set in station_sets
+        ]
+    )
+    return [
+        score_estimate(estimate, search_config=search_config, service_sec=service_sec)
+        for estimate in estimates
+    ]
+
+
+class Service(ABC):
+    @abstractmethod
+    def run(self) -> None: ...
+
+
+class StationSearchService(Service):
+    def __init__(
+        self,
+        logger: Logger,
+        simulation_config: SimulationConfig,
+        surrogate_config: SurrogateConfig,
+        search_config: StationSearchConfig,
+        scenario_path: Path,
+        percent_of_hydrogen_cars: float,
+        stations_count: int,
+        strategy: SearchStrategy,
+        workers: int | None,
+        top: int,
+    ) -> None:
+        self.logger: Logger = logger
+        self.simulation_config: SimulationConfig = simulation_config
+        self.surrogate_config: SurrogateConfig = surrogate_config
+        self.search_config: StationSearchConfig = search_config
+        self.scenario_path: Path = scenario_path
+        self.percent_of_hydrogen_cars: float = percent_of_hydrogen_cars
+        self.stations_count: int = stations_count
+        self.strategy: SearchStrategy = strategy
+        self.workers: int = workers or os.cpu_count() or 1
+        self.top: int = top
+        self.rng: np.random.Generator = np.random.default_rng(search_config.search_seed)
+        self.scores: dict[StationSet, StationSetScore] = {}
+        self.cache_file: Path = (
+            scenario_path
+            / search_config.station_search_path
+            / f"{self.get_inputs_key()}.jsonl"
+        )
+        self.executor: ProcessPoolExecutor | None = None
+
+    def get_inputs_key(self) -> str:
+        # scores of changed inputs or objectives end up under another key
+        digest = hashlib.sha256()
+        for file_path in (
+            self.simulation_config.net_path,
+            self.simulation_config.route_file_path,
+            self.simulation_config.charging_stations_path,
+        ):
+            with (self.scenario_path / file_path).open(mode="rb") as f:
+                digest.update(hashlib.file_digest(f, "sha256").digest())
+
+        parameters = {
+            "percent_of_hydrogen_cars": self.percent_of_hydrogen_cars,
+            "surrogate_parameters": get_surrogate_parameters(
+                scenario_path=self.scenario_path,
+                surrogate_config=self.surrogate_config,
+            ).model_dump(mode="json"),
+            **self.simulation_config.model_dump(
+                mode="json", include={"fuel_threshold_liters"}
+            ),
+            **self.surrogate_config.model_dump(
+                mode="json",
+                include={
+                    "petrol_liters_per_100km",
+                    "hydrogen_liters_per_100km",
+                    "surrogate_reference_speed",
+                    "surrogate_seed",
+                },
+            ),
+            **self.search_config.model_dump(
+                mode="json",
+                include={
+                    "search_detour_speed",
+                    "search_station_servers",
+                    "search_unserved_penalty_sec",
+                },
+            ),
+        }
+        digest.update(json.dumps(parameters, sort_keys=True).encode())
+        return digest.hexdigest()[:16]
+
+    def load_cache(self) -> None:
+        if not self.cache_file.exists():
+            return
+
+        with self.cache_file.open() as f:
+            for line in f:
+                score = StationSetScore.model_validate_json(line)
+                self.scores[frozenset(score.stations)] = score
+        self.logger.info(f"Loaded {len(self.scores)} scored sets of {self.cache_file}")
+
+    def evaluate(self, station_sets: Iterable[StationSet]) -> list[StationSetScore]:
+        station_sets = list(station_sets)
+        missing = list(dict.fromkeys(s for s in station_sets if s not in self.scores))
+        if missing and self.executor is not None:
+            chunk_size = math.ceil(len(missing) / self.workers)
+            futures = [
+                self.executor.submit(
+                    score_station_sets,
+                    scenario_path=self.scenario_path,
+                    simulation_config_json=self.simulation_config.model_dump_json(),
+                    surrogate_config_json=self.surrogate_config.model_dump_json(),
+                    search_config=self.search_config,
+                    percent_of_hydrogen_cars=self.percent_of_hydrogen_cars,
+                    station_sets=missing[start : start + chunk_size],
+                )
+                for start in range(0, len(missing), chunk_size)
+            ]
+            with self.cache_file.open(mode="a") as f:
+                for future in futures:
+                    for score in future.result():
+                        self.scores[frozenset(score.stations)] = score
+                        f.write(score.model_dump_json() + "\n")
+
+        return [self.scores[station_set] for station_set in station_sets]
+
+    def get_best(self, station_sets: Iterable[StationSet]) -> StationSet:
+        station_sets = list(station_sets)
+        scores = self.evaluate(station_sets)
+        return station_sets[int(np.argmin([score.score for score in scores]))]
+
+    def log_best(self, label: str, station_set: StationSet) -> None:
+        score = self.scores[station_set]
+        self.logger.info(
+            f"{label}: {','.join(score.stations)} {score.score:.1f}s per refuel, "
+            f"{score.detour_m:.0f}m detour, {score.queue_sec:.1f}s queue"
+        )
+
+    def greedy(self, candidates: list[str]) -> StationSet:
+        current: StationSet = frozenset()
+        for step in range(self.stations_count):
+            current = self.get_best(
+                current | {station} for station in candidates if station not in current
+            )
+            self.log_best(f"greedy step {step + 1}", current)
+
+        return current
+
+    def local_search(self, candidates: list[str]) -> StationSet:
+        current = self.greedy(candidates)
+        for iteration in range(self.search_config.local_search_max_iterations):
+            # every set with one station swapped for one outside of it
+            neighbours = [
+                (current - {removed}) | {added}
+                for removed in current
+                for added in candidates
+                if added not in current
+            ]
+            if not neighbours:
+                break
+            best = self.get_best([current, *neighbours])
+            if best == current:
+                break
+            current = best
+            self.log_best(f"local search iteration {iteration + 1}", current)
+
+        return current
+
+    def genetic(self, candidates: list[str]) -> StationSet:
+        config = self.search_config
+
+        def sample(stations: list[str]) -> StationSet:
+            return frozenset(
+                self.rng.choice(
+                    stations, size=self.stations_count, replace=False
+                ).tolist()
+            )
+
+        population = [sample(candidates) for _ in range(config.genetic_population)]
+        for generation in range(config.genetic_generations):
+            scores = self.evaluate(population)
+            ranked = [population[i] for i in np.argsort([s.score for s in scores])]
+            self.log_best(f"generation {generation + 1}", ranked[0])
+
+            # the two best sets survive, the others are bred from winners of
+            # tournaments of three
+            children = ranked[:2]
+            while len(children) < config.genetic_population:
+                parents = [
+                    ranked[min(self.rng.choice(len(ranked), size=3))] for _ in range(2)
+                ]
+                child = set(sample(sorted(parents[0] | parents[1])))
+                if self.rng.random() < config.genetic_mutation_rate:
+                    outside = [
+                        station for station in candidates if station not in child
+                    ]
+                    if outside:
+                        child.remove(str(self.rng.choice(sorted(child))))
+                        child.add(str(self.rng.choice(outside)))
+                children.append(frozenset(child))
+            population = children
+
+        return self.get_best(population)
+
+    def print_report(self, report: StationSearchReport) -> None:
+        table = Table(
+            title=f"Best {len(report.best)} of {report.evaluated_sets} sets "
+            f"of {report.stations_count} stations"
+        )
+        table.add_column("hydrogen stations")
+        table.add_column("s per refuel", justify="right")
+        table.add_column("detour m", justify="right")
+        table.add_column("queue s", justify="right")
+        table.add_column("refuels", justify="right")
+        table.add_column("unserved", justify="right")
+        for score in report.best:
+            table.add_row(
+                ",".join(score.stations),
+                f"{score.score:.1f}",
+                f"{score.detour_m:.0f}",
+                f"{score.queue_sec:.1f}",
+                f"{score.refuels:.1f}",
+                f"{score.unserved_refuels:.1f}",
+            )
+
+        rich.print(table)
+
+    def run(self) -> None:
+        scenario_parser = ScenarioParser(
+            simulation_config=self.simulation_config,
+            scenario_path=self.scenario_path,
+            hydrogen_stations=set(),
+            percent_of_hydrogen_cars=self.percent_of_hydrogen_cars,
+        )
+        stations, _ = scenario_parser.get_fuel_stations()
+        candidates = [station.id for station in stations]
+        if not 0 < self.stations_count <= len(candidates):
+            raise ValueError(
+                f"can not pick {self.stations_count} of {len(candidates)} stations"
+            )
+
+        self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+        self.load_cache()
+        strategies = {
+            SearchStrategy.greedy: self.greedy,
+            SearchStrategy.local: self.local_search,
+            SearchStrategy.genetic: self.genetic,
+        }
+        self.logger.info(
+            f"Searching {self.stations_count} of {len(candidates)} stations with "
+            f"{self.strategy.value} on {self.workers} workers"
+        )
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            self.executor = executor
+            strategies[self.strategy](candidates)
+        self.executor = None
+
+        # every set of the requested size scored so far, cached ones included
+        complete = [
+            score
+            for score in self.scores.values()
+            if len(score.stations) == self.stations_count
+        ]
+        report = StationSearchReport(
+            percent_of_hydrogen_cars=self.percent_of_hydrogen_cars,
+            stations_count=self.stations_count,
+            strategy=self.strategy,
+            evaluated_sets=len(complete),
+            best=sorted(complete, key=lambda score: score.score)[: self.top],
+        )
+        report_file = self.scenario_path / self.search_config.station_search_report_file
+        report_file.write_text(report.model_dump_json(indent=2))
+        self.print_report(report)
+        self.logger.info(f"Search report written to {report_file}")
+
+
+def get_station_search_service(
+    logger: Logger,
+    simulation_config: SimulationConfig,
+    surrogate_config: SurrogateConfig,
+    search_config: StationSearchConfig,
+    scenario_path: Path,
+    percent_of_hydrogen_cars: float,
+    stations_count: int,
+    strategy: SearchStrategy,
+    workers: int | None,
+    top: int = 10,
+) -> Service:
+    return StationSearchService(
+        logger=logger,
+        simulation_config=simulation_config,
+        surrogate_config=surrogate_config,
+        search_config=search_config,
+        scenario_path=scenario_path,
+        percent_of_hydrogen_cars=percent_of_hydrogen_cars,
+        stations_count=stations_count,
+        strategy=strategy,
+        workers=workers,
+        top=top,
+    )
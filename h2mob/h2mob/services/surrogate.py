@@ -0,0 +1,866 @@
+import itertools
+import json
+import time
+
+from abc import ABC, abstractmethod
+from collections.abc import Mapping
+from logging import Logger
+from pathlib import Path
+from xml.parsers import expat
+
+from h2mob.services.analysis import HOURS, AnalysisService, RunReport, Stations
+from h2mob.services.fleet import COLUMN_DTYPES, FUEL_TYPES, Fleet
+from h2mob.services.output_conversion import (
+    list_windows,
+    read_table,
+    read_vocabularies,
+)
+from h2mob.services.route_index import parse_departure
+from h2mob.services.simulation import ScenarioParser
+from h2mob.services.station_index import StationDistances, get_station_distances
+from h2mob.services.station_routes import RoadNetwork
+from h2mob.services.sweep import SweepJob, SweepJobs
+from h2mob.settings import outputs
+from h2mob.settings.outputs import OutputConfig
+from h2mob.settings.simulation import (
+    MG_IN_LITERS,
+    FuelType,
+    SimulationConfig,
+    UniformRange,
+    VehicleProfile,
+    get_murai_vehicle_profile,
+    get_petrol_vehicle_profile,
+)
+from h2mob.settings.surrogate import SurrogateConfig
+
+import numpy as np
+import rich
+
+from pydantic import BaseModel
+from rich.table import Table
+
+
+AIR_DENSITY: float = 1.2  # kg/m3
+GRAVITY: float = 9.81  # m/s2
+
+
+class SurrogateParameters(BaseModel):
+    # consumption of a vehicle with the mean parameters of its profile
+    liters_per_100km: dict[FuelType, float]
+    # simulated travel time over the free flow travel time of the route
+    travel_time_factor: float = 1.0
+    calibrated_from: list[str] = []
+
+
+class SurrogateEstimate(BaseModel):
+    job: SweepJob
+    # expected values over the fuel types the fleet may draw
+    refuels: dict[str, float]
+    # refuels of vehicles without a path to a station of their fuel type
+    unserved_refuels: dict[str, float]
+    distance_to_station_m: dict[str, float]
+    stations: dict[str, float]
+    # binned by the hour the vehicles cross the fuel threshold
+    refuels_per_hour: dict[str, list[float]]
+
+
+class SurrogateReport(BaseModel):
+    parameters: SurrogateParameters
+    estimates: list[SurrogateEstimate]
+
+
+def get_vehicle_profiles() -> dict[FuelType, VehicleProfile]:
+    return {
+        FuelType.hydrogen: get_murai_vehicle_profile(),
+        FuelType.petrol: get_petrol_vehicle_profile(),
+    }
+
+
+def get_mean_parameters(profile: VehicleProfile) -> dict[str, float]:
+    return {
+        name: (value.low + value.high) / 2 if isinstance(value, UniformRange) else value
+        for name, value in profile.parameters.items()
+    }
+
+
+def get_fleet_columns(fleet: Fleet) -> dict[str, np.ndarray]:
+    return {name: fleet.get_column(name) for name in COLUMN_DTYPES}
+
+
+def get_road_load(
+    parameters: Mapping[str, np.ndarray | float], speed: float
+) -> np.ndarray:
+    # rolling resistance and air drag at the reference speed over the
+    # propulsion efficiency in J/m, consumption is taken to scale with it
+    rolling = parameters["mass_kg"] * GRAVITY * parameters["roll_drag_coefficient"]
+    drag = (
+        0.5
+        * AIR_DENSITY
+        * parameters["air_drag_coefficient"]
+        * parameters["front_surface_area"]
+        * speed**2
+    )
+    return np.asarray((rolling + drag) / parameters["propulsion_efficiency"])
+
+
+def get_surrogate_parameters(
+    scenario_path: Path, surrogate_config: SurrogateConfig
+) -> SurrogateParameters:
+    parameters_file = scenario_path / surrogate_config.surrogate_parameters_file
+    if parameters_file.exists():
+        return SurrogateParameters.model_validate_json(parameters_file.read_text())
+
+    return SurrogateParameters(
+        liters_per_100km={
+            FuelType.petrol: surrogate_config.petrol_liters_per_100km,
+            FuelType.hydrogen: surrogate_config.hydrogen_liters_per_100km,
+        }
+    )
+
+
+class RouteTable:
+    def __init__(
+        self,
+        vehicle_ids: list[str],
+        departures_sec: np.ndarray,
+        offsets: np.ndarray,
+        edges: np.ndarray,
+    ) -> None:
+        self.vehicle_ids: list[str] = vehicle_ids
+        self.departures_sec: np.ndarray = departures_sec  # nan if not fixed
+        # the edges of vehicle i are edges[offsets[i]:offsets[i + 1]]
+        self.offsets: np.ndarray = offsets
+        self.edges: np.ndarray = edges
+
+    def __len__(self) -> int:
+        return len(self.vehicle_ids)
+
+
+class RouteTableScanner:
+    def __init__(self, edge_index: dict[str, int]) -> None:
+        self.edge_index: dict[str, int] = edge_index
+        self.depth: int = 0
+        self.in_vehicle: bool = False
+        self.named_routes: dict[str, list[int]] = {}
+        self.vehicle_ids: list[str] = []
+        self.departures_sec: list[float] = []
+        self.routes: list[list[int]] = []
+
+    def get_edges(self, edges: str) -> list[int]:
+        # junction edges and edges unknown to the net have no length
+        return [self.edge_index[e] for e in edges.split() if e in self.edge_index]
+
+    def start_element(self, tag: str, attributes: dict[str, str]) -> None:
+        self.depth += 1
+        if self.depth == 2 and tag == "route" and "id" in attributes:
+            self.named_routes[attributes["id"]] = self.get_edges(
+                attributes.get("edges", "")
+            )
+        elif self.depth == 2 and tag == "vehicle":
+            self.in_vehicle = True
+            self.vehicle_ids.append(attributes["id"])
+            departure = parse_departure(attributes.get("depart"))
+            self.departures_sec.append(np.nan if departure is None else departure)
+            self.routes.append(self.named_routes.get(attributes.get("route", ""), []))
+        elif self.depth == 3 and tag == "route" and self.in_vehicle:
+            self.routes[-1] = self.get_edges(attributes.get("edges", ""))
+
+    def end_element(self, tag: str) -> None:
+        if self.depth == 2 and tag == "vehicle":
+            self.in_vehicle = False
+        self.depth -= 1
+
+    def scan(self, route_file: Path) -> RouteTable:
+        parser = expat.ParserCreate()
+        parser.StartElementHandler = self.start_element
+        parser.EndElementHandler = self.end_element
+        with route_file.open(mode="rb") as f:
+            parser.ParseFile(f)
+
+        lengths = np.fromiter((len(route) for route in self.routes), dtype=np.int64)
+        offsets = np.concatenate(([0], np.cumsum(lengths)))
+        return RouteTable(
+            vehicle_ids=self.vehicle_ids,
+            departures_sec=np.asarray(self.departures_sec, dtype=np.float64),
+            offsets=offsets,
+            edges=np.fromiter(
+                itertools.chain.from_iterable(self.routes),
+                dtype=np.int32,
+                count=int(offsets[-1]),
+            ),
+        )
+
+
+class Crossings:
+    def __init__(self, edges: np.ndarray, times_sec: np.ndarray) -> None:
+        # per vehicle, the edge and time it gets below the fuel threshold,
+        # -1 and nan for vehicles that arrive before
+        self.edges: np.ndarray = edges
+        self.times_sec: np.ndarray = times_sec
+
+
+class Demand:
+    def __init__(self, edges: np.ndarray, refuels_per_hour: np.ndarray) -> None:
+        # refuels per threshold crossing edge and hour
+        self.edges: np.ndarray = edges
+        self.refuels_per_hour: np.ndarray = refuels_per_hour
+
+    @classmethod
+    def from_crossings(cls, crossings: Crossings, weights: np.ndarray) -> "Demand":
+        crossed = crossings.edges >= 0
+        edges, inverse = np.unique(crossings.edges[crossed], return_inverse=True)
+        hours = AnalysisService.get_hours(crossings.times_sec[crossed])
+        refuels_per_hour = np.zeros((len(edges), HOURS))
+        np.add.at(refuels_per_hour, (inverse, hours), weights[crossed])
+        return cls(edges=edges, refuels_per_hour=refuels_per_hour)
+
+
+class Assignment:
+    def __init__(
+        self,
+        refuels_per_hour: np.ndarray,
+        unserved_refuels: np.ndarray,
+        distance_m: np.ndarray,
+    ) -> None:
+        # per configuration, refuels per station and hour
+        self.refuels_per_hour: np.ndarray = refuels_per_hour
+        self.unserved_refuels: np.ndarray = unserved_refuels
+        # summed over the served refuels
+        self.distance_m: np.ndarray = distance_m
+
+
+class SurrogateModel:
+    def __init__(
+        self,
+        routes: RouteTable,
+        station_distances: StationDistances,
+        edge_lengths: np.ndarray,
+        edge_travel_times: np.ndarray,
+        parameters: SurrogateParameters,
+        simulation_config: SimulationConfig,
+        surrogate_config: SurrogateConfig,
+    ) -> None:
+        self.routes: RouteTable = routes
+        self.station_distances: StationDistances = station_distances
+        self.parameters: SurrogateParameters = parameters
+        self.simulation_config: SimulationConfig = simulation_config
+        self.surrogate_config: SurrogateConfig = surrogate_config
+        self.profiles: dict[FuelType, VehicleProfile] = get_vehicle_profiles()
+        self.reference_loads: dict[FuelType, float] = {
+            fuel_type: float(
+                get_road_load(
+                    get_mean_parameters(profile),
+                    speed=surrogate_config.surrogate_reference_speed,
+                )
+            )
+            for fuel_type, profile in self.profiles.items()
+        }
+        # lengths and free flow times along all routes, [i] is the sum of the
+        # route edges before edge i, so every route is a slice
+        self.route_edge_lengths: np.ndarray = edge_lengths[routes.edges]
+        self.route_edge_times: np.ndarray = edge_travel_times[routes.edges]
+        self.lengths_before: np.ndarray = np.concatenate(
+            ([0.0], np.cumsum(self.route_edge_lengths))
+        )
+        self.times_before: np.ndarray = np.concatenate(
+            ([0.0], np.cumsum(self.route_edge_times))
+        )
+        self.expected_crossings: dict[FuelType, Crossings] = {}
+        self.expected_demand: dict[FuelType, Demand] = {}
+
+    def get_route_totals(self) -> tuple[np.ndarray, np.ndarray]:
+        starts, ends = self.routes.offsets[:-1], self.routes.offsets[1:]
+        return (
+            self.lengths_before[ends] - self.lengths_before[starts],
+            self.times_before[ends] - self.times_before[starts],
+        )
+
+    def get_crossings(
+        self, columns: Mapping[str, np.ndarray], fuel_type: FuelType
+    ) -> Crossings:
+        liters_per_m = (
+            self.parameters.liters_per_100km[fuel_type]
+            / 100_000
+            * get_road_load(
+                columns, speed=self.surrogate_config.surrogate_reference_speed
+            )
+            / self.reference_loads[fuel_type]
+        )
+        # vehicles depart with a full tank and are routed to a station once
+        # the tank is below the threshold, a second refuel is not predicted
+        budget_liters = np.maximum(
+            columns["tank_liters"] - self.simulation_config.fuel_threshold_liters, 0.0
+        )
+        starts, ends = self.routes.offsets[:-1], self.routes.offsets[1:]
+        if not len(self.routes.edges):
+            return Crossings(
+                edges=np.full(len(starts), -1), times_sec=np.full(len(starts), np.nan)
+            )
+
+        crossing_m = self.lengths_before[starts] + np.divide(
+            budget_liters,
+            liters_per_m,
+            out=np.full(len(budget_liters), np.inf),
+            where=liters_per_m > 0,
+        )
+        position = np.searchsorted(self.lengths_before[1:], crossing_m, side="right")
+        crossed = (position < ends) & np.isfinite(self.routes.departures_sec)
+        position = np.where(crossed, position, 0)
+
+        edge_share = np.divide(
+            crossing_m - self.lengths_before[position],
+            self.route_edge_lengths[position],
+            out=np.zeros(len(position)),
+            where=self.route_edge_lengths[position] > 0,
+        )
+        travel_time_sec = (
+            self.times_before[position]
+            - self.times_before[starts]
+            + edge_share * self.route_edge_times[position]
+        ) * self.parameters.travel_time_factor
+
+        return Crossings(
+            edges=np.where(crossed, self.routes.edges[position], -1),
+            times_sec=np.where(
+                crossed, self.routes.departures_sec + travel_time_sec, np.nan
+            ),
+        )
+
+    def prepare_expected_demand(self) -> None:
+        # every vehicle draws the parameters of both fuel types, the share of
+        # hydrogen cars only weights the two
+        rng = np.random.default_rng(self.surrogate_config.surrogate_seed)
+        for fuel_type, profile in self.profiles.items():
+            fleet = Fleet.generate(
+                vehicle_ids=self.routes.vehicle_ids,
+                profiles=[profile],
+                shares=[1.0],
+                rng=rng,
+            )
+            crossings = self.get_crossings(fleet.columns, fuel_type=fuel_type)
+            self.expected_crossings[fuel_type] = crossings
+            self.expected_demand[fuel_type] = Demand.from_crossings(
+                crossings=crossings, weights=np.ones(len(fleet))
+            )
+
+    def get_hydrogen_masks(self, jobs: SweepJobs) -> np.ndarray:
+        station_ids = self.station_distances.station_ids
+        index = {station_id: i for i, station_id in enumerate(station_ids)}
+        masks = np.zeros((len(jobs), len(station_ids)), dtype=bool)
+        for i, job in enumerate(jobs):
+            unknown = job.hydrogen_stations - index.keys()
+            if unknown:
+                raise ValueError(f"unknown hydrogen stations {sorted(unknown)}")
+            masks[i, [index[station] for station in job.hydrogen_stations]] = True
+
+        return masks
+
+    def assign(self, demand: Demand, masks: np.ndarray) -> Assignment:
+        # every crossing edge goes to the nearest station the mask opens for
+        # the fuel type, like the station index does at runtime
+        distances = self.station_distances.distances[demand.edges]
+        configurations, stations = masks.shape
+        edges = len(demand.edges)
+        refuels = demand.refuels_per_hour.sum(axis=1)
+        assignment = Assignment(
+            refuels_per_hour=np.zeros((configurations, stations, HOURS)),
+            unserved_refuels=np.zeros(configurations),
+            distance_m=np.zeros(configurations),
+        )
+        # masked distances and the one hot nearest stations of a batch
+        bytes_per_configuration = max(edges * stations * 9, 1)
+        batch_size = max(
+            self.surrogate_config.surrogate_batch_mib
+            * 2**20
+            // bytes_per_configuration,
+            1,
+        )
+        refuels_per_hour = demand.refuels_per_hour.astype(np.float32)
+
+        for start in range(0, configurations, batch_size):
+            batch = masks[start : start + batch_size]
+            masked = np.where(batch[:, None, :], distances[None], np.inf)
+            nearest = masked.argmin(axis=2)
+            nearest_m = np.take_along_axis(masked, nearest[..., None], axis=2)[..., 0]
+            served = np.isfinite(nearest_m)
+
+            assignment.unserved_refuels[start : start + len(batch)] = (
+                ~served * refuels
+            ).sum(axis=1)
+            assignment.distance_m[start : start + len(batch)] = (
+                np.where(served, nearest_m, 0.0) @ refuels
+            )
+            nearest_station = (nearest[..., None] == np.arange(stations)) & served[
+                ..., None
+            ]
+            assignment.refuels_per_hour[start : start + len(batch)] = np.matmul(
+                nearest_station.transpose(0, 2, 1).astype(np.float32),
+                refuels_per_hour,
+            )
+
+        return assignment
+
+    def evaluate(self, jobs: SweepJobs) -> list[SurrogateEstimate]:
+        if not self.expected_demand:
+            self.prepare_expected_demand()
+
+        hydrogen_masks = self.get_hydrogen_masks(jobs)
+        open_stations = {
+            FuelType.hydrogen: hydrogen_masks,
+            FuelType.petrol: ~hydrogen_masks,
+        }
+        assignments = {
+            fuel_type: self.assign(
+                demand=self.expected_demand[fuel_type], masks=open_stations[fuel_type]
+            )
+            for fuel_type in FUEL_TYPES
+        }
+        totals = {
+            fuel_type: self.expected_demand[fuel_type].refuels_per_hour.sum()
+            for fuel_type in FUEL_TYPES
+        }
+
+        estimates: list[SurrogateEstimate] = []
+        for i, job in enumerate(jobs):
+            shares = {
+                FuelType.hydrogen: job.percent_of_hydrogen_cars,
+                FuelType.petrol: 1 - job.percent_of_hydrogen_cars,
+            }
+            station_refuels = sum(
+                shares[fuel_type] * assignments[fuel_type].refuels_per_hour[i]
+                for fuel_type in FUEL_TYPES
+            )
+            served = {
+                fuel_type: totals[fuel_type]
+                - assignments[fuel_type].unserved_refuels[i]
+                for fuel_type in FUEL_TYPES
+            }
+            estimates.append(
+                SurrogateEstimate(
+                    job=job,
+                    refuels={
+                        fuel_type.value: shares[fuel_type] * served[fuel_type]
+                        for fuel_type in FUEL_TYPES
+                    },
+                    unserved_refuels={
+                        fuel_type.value: shares[fuel_type]
+                        * assignments[fuel_type].unserved_refuels[i]
+                        for fuel_type in FUEL_TYPES
+                    },
+                    distance_to_station_m={
+                        fuel_type.value: assignments[fuel_type].distance_m[i]
+                        / served[fuel_type]
+                        if served[fuel_type] > 0
+                        else 0.0
+                        for fuel_type in FUEL_TYPES
+                    },
+                    stations={
+                        station_id: round(float(refuels.sum()), 2)
+                        for station_id, refuels in zip(
+                            self.station_distances.station_ids, station_refuels
+                        )
+                        if refuels.sum() > 0
+                    },
+                    refuels_per_hour={
+                        station_id: refuels.round(2).tolist()
+                        for station_id, refuels in zip(
+                            self.station_distances.station_ids, station_refuels
+                        )
+                        if refuels.sum() > 0
+                    },
+                )
+            )
+
+        return estimates
+
+    def save_crossings(self, crossings_file: Path) -> None:
+        edge_ids = np.asarray(self.station_distances.edge_ids, dtype=str)
+        arrays: dict[str, np.ndarray] = {
+            "vehicle_ids": np.asarray(self.routes.vehicle_ids, dtype=str)
+        }
+        for fuel_type, crossings in self.expected_crossings.items():
+            arrays[f"{fuel_type.value}_edges"] = np.where(
+                crossings.edges >= 0, edge_ids[crossings.edges], ""
+            )
+            arrays[f"{fuel_type.value}_times_sec"] = crossings.times_sec
+        with crossings_file.open(mode="wb") as f:
+            np.savez(f, **arrays)
+
+
+def get_surrogate_model(
+    scenario_path: Path,
+    simulation_config: SimulationConfig,
+    surrogate_config: SurrogateConfig,
+    logger: Logger,
+) -> SurrogateModel:
+    scenario_parser = ScenarioParser(
+        simulation_config=simulation_config,
+        scenario_path=scenario_path,
+        hydrogen_stations=set(),
+        percent_of_hydrogen_cars=0.0,
+    )
+    # every candidate station, hydrogen sets are masks over them
+    stations, _ = scenario_parser.get_fuel_stations()
+    station_distances = get_station_distances(
+        scenario_path=scenario_path,
+        simulation_config=simulation_config,
+        stations=stations,
+        file_name=surrogate_config.station_distances_file,
+        logger=logger,
+    )
+
+    network = RoadNetwork.read(scenario_path / simulation_config.net_path)
+    edge_ids = station_distances.edge_ids
+    route_file = scenario_path / simulation_config.route_file_path
+    logger.info(f"Reading routes of {route_file}")
+    routes = RouteTableScanner(
+        edge_index={edge_id: i for i, edge_id in enumerate(edge_ids)}
+    ).scan(route_file)
+    logger.info(f"Route table covers {len(routes)} vehicles")
+
+    return SurrogateModel(
+        routes=routes,
+        station_distances=station_distances,
+        edge_lengths=np.asarray([network.lengths[edge_id] for edge_id in edge_ids]),
+        edge_travel_times=np.asarray(
+            [network.travel_times[edge_id] for edge_id in edge_ids]
+        ),
+        parameters=get_surrogate_parameters(
+            scenario_path=scenario_path, surrogate_config=surrogate_config
+        ),
+        simulation_config=simulation_config,
+        surrogate_config=surrogate_config,
+    )
+
+
+class Service(ABC):
+    @abstractmethod
+    def run(self) -> None: ...
+
+
+class SurrogateService(Service):
+    def __init__(
+        self,
+        logger: Logger,
+        simulation_config: SimulationConfig,
+        surrogate_config: SurrogateConfig,
+        scenario_path: Path,
+        jobs: SweepJobs,
+        top: int,
+    ) -> None:
+        self.logger: Logger = logger
+        self.simulation_config: SimulationConfig = simulation_config
+        self.surrogate_config: SurrogateConfig = surrogate_config
+        self.scenario_path: Path = scenario_path
+        self.jobs: SweepJobs = jobs
+        self.top: int = top
+
+    def print_estimates(self, estimates: list[SurrogateEstimate]) -> None:
+        hydrogen = FuelType.hydrogen.value
+        # served hydrogen demand first, then the shortest detours
+        ranked = sorted(
+            estimates,
+            key=lambda estimate: (
+                estimate.unserved_refuels[hydrogen],
+                estimate.distance_to_station_m[hydrogen],
+            ),
+        )
+        table = Table(title=f"Top {min(self.top, len(ranked))} of {len(ranked)}")
+        table.add_column("hydrogen share", justify="right")
+        table.add_column("hydrogen stations")
+        table.add_column("hydrogen refuels", justify="right")
+        table.add_column("unserved", justify="right")
+        table.add_column("mean distance m", justify="right")
+        table.add_column("busiest station")
+        table.add_column("peak refuels/h", justify="right")
+        for estimate in ranked[: self.top]:
+            busiest, peak = max(
+                (
+                    (station, max(refuels))
+                    for station, refuels in estimate.refuels_per_hour.items()
+                ),
+                key=lambda station_peak: station_peak[1],
+                default=("-", 0.0),
+            )
+            table.add_row(
+                f"{estimate.job.percent_of_hydrogen_cars:g}",
+                ",".join(sorted(estimate.job.hydrogen_stations)) or "-",
+                f"{estimate.refuels[hydrogen]:.1f}",
+                f"{estimate.unserved_refuels[hydrogen]:.1f}",
+                f"{estimate.distance_to_station_m[hydrogen]:.0f}",
+                busiest,
+                f"{peak:.1f}",
+            )
+
+        rich.print(table)
+
+    def run(self) -> None:
+        model = get_surrogate_model(
+            scenario_path=self.scenario_path,
+            simulation_config=self.simulation_config,
+            surrogate_config=self.surrogate_config,
+            logger=self.logger,
+        )
+        started = time.perf_counter()
+        estimates = model.evaluate(self.jobs)
+        elapsed = time.perf_counter() - started
+        self.logger.info(f"Estimated {len(estimates)} configurations in {elapsed:.2f}s")
+
+        report_file = self.scenario_path / self.surrogate_config.surrogate_report_file
+        report = SurrogateReport(parameters=model.parameters, estimates=estimates)
+        report_file.write_text(report.model_dump_json())
+        model.save_crossings(
+            self.scenario_path / self.surrogate_config.surrogate_crossings_file
+        )
+        self.print_estimates(estimates)
+        self.logger.info(f"Estimates written to {report_file}")
+
+
+class SurrogateCalibrationService(Service):
+    def __init__(
+        self,
+        logger: Logger,
+        simulation_config: SimulationConfig,
+        surrogate_config: SurrogateConfig,
+        output_config: OutputConfig,
+        scenario_path: Path,
+        output_folders: list[Path],
+    ) -> None:
+        self.logger: Logger = logger
+        self.simulation_config: SimulationConfig = simulation_config
+        self.surrogate_config: SurrogateConfig = surrogate_config
+        self.output_config: OutputConfig = output_config
+        self.scenario_path: Path = scenario_path
+        self.output_folders: list[Path] = output_folders
+        self.analysis: AnalysisService = AnalysisService(
+            output_folders=output_folders, config=output_config, logger=logger
+        )
+
+    def measure_vehicles(
+        self, output_folder: Path, vehicles: int
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # consumed liters, driven meters and seconds on the road per vehicle
+        columnar_path = self.analysis.get_columnar_path(output_folder)
+        with (output_folder / outputs.SCENARIO_CONFIG_OUTPUT).open() as f:
+            stations = Stations(
+                json.load(f), read_vocabularies(columnar_path, self.output_config)
+            )
+        consumed_mg = np.zeros(vehicles)
+        driven_m = np.zeros(vehicles)
+        driving_sec = np.zeros(vehicles)
+        step_length: float | None = None
+
+        for window in list_windows(columnar_path, "battery"):
+            table = read_table(
+                columnar_path,
+                "battery",
+                windows=[window],
+                columns=["time", "vehicle", "station", "speed", "energyConsumed"],
+            )
+            if step_length is None:
+                times = np.unique(table["time"])
+                step_length = float(np.min(np.diff(times))) if len(times) > 1 else 1.0
+
+            vehicle = table["vehicle"]
+            known = (vehicle >= 0) & (vehicle < vehicles)
+            # steps at a station are neither driving nor consumption
+            driving = known & (stations.by_station_id[table["station"]] < 0)
+            consumed_mg += np.bincount(
+                vehicle[known],
+                weights=table["energyConsumed"][known],
+                minlength=vehicles,
+            )
+            driven_m += np.bincount(
+                vehicle[driving],
+                weights=table["speed"][driving] * step_length,
+                minlength=vehicles,
+            )
+            driving_sec += (
+                np.bincount(vehicle[driving], minlength=vehicles) * step_length
+            )
+
+        return consumed_mg / MG_IN_LITERS, driven_m, driving_sec
+
+    def get_run_report(self, output_folder: Path) -> RunReport:
+        report_file = output_folder / self.output_config.report_file
+        if report_file.exists():
+            return RunReport.model_validate_json(report_file.read_text())
+        return self.analysis.analyze(output_folder)
+
+    def fit(self, model: SurrogateModel, fleets: list[Fleet]) -> SurrogateParameters:
+        route_lengths, route_times = model.get_route_totals()
+        free_flow_sec_per_m = np.divide(
+            route_times,
+            route_lengths,
+            out=np.zeros(len(route_lengths)),
+            where=route_lengths > 0,
+        )
+        # least squares through the origin of the consumed liters over the
+        # road load share times the driven distance, per fuel type
+        products = dict.fromkeys(FUEL_TYPES, 0.0)
+        squares = dict.fromkeys(FUEL_TYPES, 0.0)
+        driving_sec = 0.0
+        free_flow_sec = 0.0
+
+        for output_folder, fleet in zip(self.output_folders, fleets):
+            consumed_liters, driven_m, on_road_sec = self.measure_vehicles(
+                output_folder, vehicles=len(fleet)
+            )
+            fuel_type_ids = fleet.get_fuel_type_ids()
+            loads = get_road_load(
+                get_fleet_columns(fleet),
+                speed=self.surrogate_config.surrogate_reference_speed,
+            )
+            driven = driven_m > 0
+            for i, fuel_type in enumerate(FUEL_TYPES):
+                selected = driven & (fuel_type_ids == i)
+                x = (
+                    loads[selected]
+                    / model.reference_loads[fuel_type]
+                    * driven_m[selected]
+                    / 100_000
+                )
+                products[fuel_type] += float(x @ consumed_liters[selected])
+                squares[fuel_type] += float(x @ x)
+            driving_sec += float(on_road_sec[driven].sum())
+            free_flow_sec += float(
+                (driven_m[driven] * free_flow_sec_per_m[driven]).sum()
+            )
+
+        return SurrogateParameters(
+            liters_per_100km={
+                fuel_type: products[fuel_type] / squares[fuel_type]
+                if squares[fuel_type] > 0
+                else model.parameters.liters_per_100km[fuel_type]
+                for fuel_type in FUEL_TYPES
+            },
+            travel_time_factor=driving_sec / free_flow_sec
+            if free_flow_sec > 0
+            else model.parameters.travel_time_factor,
+            calibrated_from=[str(folder) for folder in self.output_folders],
+        )
+
+    def validate(self, model: SurrogateModel, fleets: list[Fleet]) -> None:
+        station_ids = model.station_distances.station_ids
+        simulated = dict.fromkeys(station_ids, 0)
+        predicted = dict.fromkeys(station_ids, 0.0)
+
+        for output_folder, fleet in zip(self.output_folders, fleets):
+            for station in self.get_run_report(output_folder).stations:
+                simulated[station.station] = (
+                    simulated.get(station.station, 0) + station.refuels
+                )
+            with (output_folder / outputs.SCENARIO_CONFIG_OUTPUT).open() as f:
+                hydrogen_stations = {
+                    station["id"] for station in json.load(f)["hydrogen_stations"]
+                }
+            hydrogen_masks = model.get_hydrogen_masks(
+                [
+                    SweepJob(
+                        percent_of_hydrogen_cars=0.0,
+                        hydrogen_stations=hydrogen_stations,
+                    )
+                ]
+            )
+            open_stations = {
+                FuelType.hydrogen: hydrogen_masks,
+                FuelType.petrol: ~hydrogen_masks,
+            }
+            # the vehicles of the run with the fuel types they drew
+            fuel_type_ids = fleet.get_fuel_type_ids()
+            columns = get_fleet_columns(fleet)
+            for i, fuel_type in enumerate(FUEL_TYPES):
+                demand = Demand.from_crossings(
+                    crossings=model.get_crossings(columns, fuel_type=fuel_type),
+                    weights=(fuel_type_ids == i).astype(np.float64),
+                )
+                refuels = model.assign(
+                    demand=demand, masks=open_stations[fuel_type]
+                ).refuels_per_hour[0]
+                for station_id, station_refuels in zip(station_ids, refuels):
+                    predicted[station_id] += float(station_refuels.sum())
+
+        table = Table(title="Station refuels, simulated and surrogate")
+        table.add_column("station")
+        table.add_column("simulated", justify="right")
+        table.add_column("surrogate", justify="right")
+        for station_id in station_ids:
+            if simulated[station_id] or predicted[station_id] >= 0.5:
+                table.add_row(
+                    station_id,
+                    str(simulated[station_id]),
+                    f"{predicted[station_id]:.0f}",
+                )
+        table.add_row(
+            "total", str(sum(simulated.values())), f"{sum(predicted.values()):.0f}"
+        )
+        rich.print(table)
+
+    def run(self) -> None:
+        model = get_surrogate_model(
+            scenario_path=self.scenario_path,
+            simulation_config=self.simulation_config,
+            surrogate_config=self.surrogate_config,
+            logger=self.logger,
+        )
+        fleets = [
+            Fleet.load(output_folder / outputs.FLEET_OUTPUT)
+            for output_folder in self.output_folders
+        ]
+        for output_folder, fleet in zip(self.output_folders, fleets):
+            if fleet.vehicle_ids.tolist() != model.routes.vehicle_ids:
+                raise ValueError(
+                    f"the fleet of {output_folder} does not match the scenario routes"
+                )
+
+        parameters = self.fit(model=model, fleets=fleets)
+        model.parameters = parameters
+        parameters_file = (
+            self.scenario_path / self.surrogate_config.surrogate_parameters_file
+        )
+        parameters_file.write_text(parameters.model_dump_json(indent=2))
+        consumption = ", ".join(
+            f"{fuel_type.value} {liters:.2f} l/100km"
+            for fuel_type, liters in parameters.liters_per_100km.items()
+        )
+        self.logger.info(
+            f"Calibrated {consumption} and a travel time factor of "
+            f"{parameters.travel_time_factor:.2f}, written to {parameters_file}"
+        )
+        self.validate(model=model, fleets=fleets)
+
+
+def get_surrogate_service(
+    logger: Logger,
+    simulation_config: SimulationConfig,
+    surrogate_config: SurrogateConfig,
+    scenario_path: Path,
+    jobs: SweepJobs,
+    top: int = 10,
+) -> Service:
+    return SurrogateService(
+        logger=logger,
+        simulation_config=simulation_config,
+        surrogate_config=surrogate_config,
+        scenario_path=scenario_path,
+        jobs=jobs,
+        top=top,
+    )
+
+
+def get_surrogate_calibration_service(
+    logger: Logger,
+    simulation_config: SimulationConfig,
+    surrogate_config: SurrogateConfig,
+    output_config: OutputConfig,
+    scenario_path: Path,
+    output_folders: list[Path],
+) -> Service:
+    return SurrogateCalibrationService(
+        logger=logger,
+        simulation_config=simulation_config,
+        surrogate_config=surrogate_config,
+        output_config=output_config,
+        scenario_path=scenario_path,
+        output_folders=output_folders,
+    )
@@ -0,0 +1,196 @@
+import itertools
+import os
+
+from abc import ABC, abstractmethod
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from logging import Logger
+from pathlib import Path
+
+from h2mob.services.artifact_cache import ArtifactCache
+from h2mob.services.simulation import ScenarioParser, get_simulation_service
+from h2mob.services.station_index import get_station_index
+from h2mob.settings.simulation import SimulationConfig
+
+from loguru import logger as worker_logger
+from pydantic import BaseModel, TypeAdapter
+
+
+class SweepJob(BaseModel):
+    percent_of_hydrogen_cars: float
+    hydrogen_stations: set[str] = set()
+    seed: int | None = None
+
+
+SweepJobs = list[SweepJob]
+
+
+class Service(ABC):
+    @abstractmethod
+    def run(self) -> None: ...
+
+
+def build_sweep_grid(
+    hydrogen_shares: list[float], station_sets: list[set[str]]
+) -> SweepJobs:
+    return [
+        SweepJob(percent_of_hydrogen_cars=share, hydrogen_stations=stations)
+        for share, stations in itertools.product(hydrogen_shares, station_sets)
+    ]
+
+
+def load_sweep_jobs(combinations_file: Path) -> SweepJobs:
+    return TypeAdapter(SweepJobs).validate_json(combinations_file.read_text())
+
+
+def prepare_station_indexes(
+    logger: Logger,
+    simulation_config: SimulationConfig,
+    scenario_path: Path,
+    jobs: SweepJobs,
+    cache: ArtifactCache | None = None,
+) -> None:
+    # built once up front, otherwise workers sharing a station set would
+    # race on writing the same index file
+    station_sets = {frozenset(job.hydrogen_stations) for job in jobs}
+    for station_set in station_sets:
+        scenario_parser = ScenarioParser(
+            simulation_config=simulation_config,
+            scenario_path=scenario_path,
+            hydrogen_stations=set(station_set),
+            percent_of_hydrogen_cars=0.0,
+        )
+        fuel_stations, hydrogen_stations = scenario_parser.get_fuel_stations()
+        get_station_index(
+            scenario_path=scenario_path,
+            simulation_config=simulation_config,
+            fuel_stations=fuel_stations,
+            hydrogen_stations=hydrogen_stations,
+            logger=logger,
+            cache=cache,
+        )
+
+
+def run_sweep_job(
+    job: SweepJob,
+    scenario_path: Path,
+    simulation_config: SimulationConfig,
+    port: int | None,
+    label: str,
+    output_folder: Path | None = None,
+) -> None:
+    if job.seed is not None:
+        simulation_config = simulation_config.model_copy(update={"seed": job.seed})
+    # loguru handlers can not be pickled, workers log through their own copy
+    service = get_simulation_service(
+        logger=worker_logger.bind(label=label),  # type: ignore
+        percent_of_hydrogen_cars=job.percent_of_hydrogen_cars,
+        hydrogen_stations=job.hydrogen_stations,
+        simulation_config=simulation_config,
+        scenario_path=scenario_path,
+        port=port,
+        label=label,
+        output_folder=output_folder,
+    )
+    service.run()
+
+
+class SweepService(Service):
+    def __init__(
+        self,
+        logger: Logger,
+        simulation_config: SimulationConfig,
+        scenario_path: Path,
+        jobs: SweepJobs,
+        workers: int | None,
+        base_port: int,
+        cache: ArtifactCache | None = None,
+    ) -> None:
+        self.logger: Logger = logger
+        self.simulation_config: SimulationConfig = simulation_config
+        self.scenario_path: Path = scenario_path
+        self.jobs: SweepJobs = jobs
+        self.workers: int | None = workers
+        self.base_port: int = base_port
+        self.cache: ArtifactCache | None = cache
+
+    def plan_workers(self) -> tuple[int, int]:
+        # every SUMO instance gets its share of the cores instead of the
+        # threads requested by osm.sumocfg
+        cpus = os.cpu_count() or 1
+        workers = max(1, min(self.workers or cpus, cpus, len(self.jobs)))
+        threads = self.simulation_config.sumo_threads or max(1, cpus // workers)
+        workers = max(1, min(workers, cpus // threads))
+
+        if self.workers is not None and workers < self.workers:
+            self.logger.warning(
+                f"Reducing workers from {self.workers} to {workers} "
+                f"to avoid oversubscribing {cpus} cpus"
+            )
+
+        return workers, threads
+
+    def prepare_station_indexes(self) -> None:
+        prepare_station_indexes(
+            logger=self.logger,
+            simulation_config=self.simulation_config,
+            scenario_path=self.scenario_path,
+            jobs=self.jobs,
+            cache=self.cache,
+        )
+
+    def run(self) -> None:
+        self.prepare_station_indexes()
+        workers, threads = self.plan_workers()
+        simulation_config = self.simulation_config.model_copy(
+            update={"sumo_threads": threads}
+        )
+        self.logger.info(
+            f"Running {len(self.jobs)} simulations "
+            f"on {workers} workers with {threads} SUMO threads each"
+        )
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures: dict[Future, SweepJob] = {
+                executor.submit(
+                    run_sweep_job,
+                    job=job,
+                    scenario_path=self.scenario_path,
+                    simulation_config=simulation_config,
+                    port=self.base_port + index,
+                    label=f"sweep_{index}",
+                ): job
+                for index, job in enumerate(self.jobs)
+            }
+
+            failed = 0
+            for done, future in enumerate(as_completed(futures), start=1):
+                job = futures[future]
+                try:
+                    future.result()
+                except Exception as error:  # noqa
+                    failed += 1
+                    self.logger.error(f"Simulation {job} failed: {error}")
+                else:
+                    self.logger.info(f"[{done}/{len(futures)}] finished {job}")
+
+        self.logger.info(f"Sweep has been completed, {failed} simulations failed")
+
+
+def get_sweep_service(
+    logger: Logger,
+    simulation_config: SimulationConfig,
+    scenario_path: Path,
+    jobs: SweepJobs,
+    workers: int | None,
+    base_port: int,
+    cache: ArtifactCache | None = None,
+) -> Service:
+    return SweepService(
+        logger=logger,
+        simulation_config=simulation_config,
+        scenario_path=scenario_path,
+        jobs=jobs,
+        workers=workers,
+        base_port=base_port,
+        cache=cache,
+    )
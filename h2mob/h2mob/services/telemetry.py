@@ -0,0 +1,270 @@
+import bisect
+import queue
+import threading
+
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging import Logger
+
+from h2mob.services.profiling import HISTOGRAM_BOUNDS_SEC
+from h2mob.settings.simulation import FuelType
+
+from pydantic import BaseModel
+
+
+CONTENT_TYPE: str = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class StepSample(BaseModel):
+    wall_time: float
+    simulated_sec: float
+    loaded: int
+    running: int
+    arrived: int
+    traci_calls: int
+    step_latency_sec: float
+    # totals since the start, they change on few steps only
+    reroutes: dict[FuelType, int]
+
+
+class TelemetryState:
+    def __init__(self, rate_window_sec: float) -> None:
+        self.rate_window_sec: float = rate_window_sec
+        self.steps: int = 0
+        self.simulated_sec: float = 0.0
+        self.last_step_time: float = 0.0
+        self.loaded: int = 0
+        self.running: int = 0
+        self.arrived: int = 0
+        self.traci_calls: int = 0
+        self.reroutes: dict[FuelType, int] = dict.fromkeys(FuelType, 0)
+        self.latency_buckets: list[int] = [0] * (len(HISTOGRAM_BOUNDS_SEC) + 1)
+        self.latency_sum_sec: float = 0.0
+        # (wall time, steps, simulated time) of the rate window
+        self.history: deque[tuple[float, int, float]] = deque()
+
+    def add(self, sample: StepSample) -> None:
+        self.steps += 1
+        self.simulated_sec = sample.simulated_sec
+        self.last_step_time = sample.wall_time
+        self.loaded += sample.loaded
+        self.running = sample.running
+        self.arrived += sample.arrived
+        self.traci_calls += sample.traci_calls
+        self.reroutes = sample.reroutes
+        self.latency_buckets[
+            bisect.bisect_left(HISTOGRAM_BOUNDS_SEC, sample.step_latency_sec)
+        ] += 1
+        self.latency_sum_sec += sample.step_latency_sec
+
+        self.history.append((sample.wall_time, self.steps, self.simulated_sec))
+        while self.history[0][0] < sample.wall_time - self.rate_window_sec:
+            self.history.popleft()
+
+    def get_rates(self) -> tuple[float, float]:
+        if len(self.history) < 2:
+            return 0.0, 0.0
+        first_time, first_steps, first_simulated_sec = self.history[0]
+        last_time, last_steps, last_simulated_sec = self.history[-1]
+        elapsed_sec = last_time - first_time
+        if elapsed_sec <= 0:
+            return 0.0, 0.0
+        return (
+            (last_steps - first_steps) / elapsed_sec,
+            (last_simulated_sec - first_simulated_sec) / elapsed_sec,
+        )
+
+    def render(self, label: str) -> str:
+        run = f'run="{label}"'
+        steps_per_second, real_time_factor = self.get_rates()
+        lines: list[str] = []
+
+        def add_metric(name: str, kind: str, help_text: str, values: list) -> None:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in values:
+                lines.append(f"{name}{{{run}{labels}}} {value}")
+
+        add_metric(
+            "h2mob_simulated_time_seconds",
+            "gauge",
+            "Simulation time of the last step.",
+            [("", self.simulated_sec)],
+        )
+        add_metric(
+            "h2mob_last_step_timestamp_seconds",
+            "gauge",
+            "Unix time of the last step, a stalled run stops updating it.",
+            [("", self.last_step_time)],
+        )
+        add_metric(
+            "h2mob_steps_total", "counter", "Simulation steps.", [("", self.steps)]
+        )
+        add_metric(
+            "h2mob_steps_per_second",
+            "gauge",
+            "Steps per wall second over the rate window.",
+            [("", steps_per_second)],
+        )
+        add_metric(
+            "h2mob_simulated_seconds_per_second",
+            "gauge",
+            "Simulated seconds per wall second over the rate window.",
+            [("", real_time_factor)],
+        )
+        add_metric(
+            "h2mob_vehicles_loaded_total",
+            "counter",
+            "Vehicles loaded by SUMO.",
+            [("", self.loaded)],
+        )
+        add_metric(
+            "h2mob_vehicles_running",
+            "gauge",
+            "Vehicles driving in the simulation.",
+            [("", self.running)],
+        )
+        add_metric(
+            "h2mob_vehicles_arrived_total",
+            "counter",
+            "Vehicles that reached their destination.",
+            [("", self.arrived)],
+        )
+        add_metric(
+            "h2mob_reroutes_total",
+            "counter",
+            "Vehicles routed to a station, by fuel type.",
+            [
+                (f',fuel_type="{fuel_type.value}"', count)
+                for fuel_type, count in self.reroutes.items()
+            ],
+        )
+        add_metric(
+            "h2mob_traci_calls_total",
+            "counter",
+            "TraCI calls, subscription reads excluded.",
+            [("", self.traci_calls)],
+        )
+
+        cumulative = 0
+        buckets: list[tuple[str, float]] = []
+        for bound, count in zip(
+            [*HISTOGRAM_BOUNDS_SEC, "+Inf"], self.latency_buckets, strict=True
+        ):
+            cumulative += count
+            buckets.append((f',le="{bound}"', cumulative))
+        add_metric(
+            "h2mob_traci_step_latency_seconds",
+            "histogram",
+            "Duration of the simulationStep round trip to SUMO.",
+            [],
+        )
+        name = "h2mob_traci_step_latency_seconds"
+        lines.extend(f"{name}_bucket{{{run}{labels}}} {v}" for labels, v in buckets)
+        lines.append(f"{name}_sum{{{run}}} {self.latency_sum_sec}")
+        lines.append(f"{name}_count{{{run}}} {self.steps}")
+
+        return "\n".join(lines) + "\n"
+
+
+class SimulationTelemetry:
+    # The simulation loop only appends samples to an unbounded queue, which
+    # never blocks. A collector thread folds them into the state and an HTTP
+    # thread renders the state in the Prometheus text format on every scrape.
+    def __init__(
+        self,
+        logger: Logger,
+        host: str,
+        port: int,
+        label: str,
+        rate_window_sec: float,
+    ) -> None:
+        self.logger: Logger = logger
+        self.host: str = host
+        self.port: int = port
+        self.label: str = label
+        self.state: TelemetryState = TelemetryState(rate_window_sec=rate_window_sec)
+        self.lock: threading.Lock = threading.Lock()
+        self.samples: queue.SimpleQueue[StepSample | None] = queue.SimpleQueue()
+        self.server: ThreadingHTTPServer | None = None
+        self.threads: list[threading.Thread] = []
+
+    def get_handler(self) -> type[BaseHTTPRequestHandler]:
+        telemetry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:  # noqa: N802
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                with telemetry.lock:
+                    body = telemetry.state.render(label=telemetry.label).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args: object) -> None:
+                # scrapes would flood the simulation log
+                pass
+
+        return MetricsHandler
+
+    def start(self) -> None:
+        try:
+            self.server = ThreadingHTTPServer(
+                (self.host, self.port), self.get_handler()
+            )
+        except OSError as error:
+            # monitoring must not stop a run, e.g. when parallel runs share a port
+            self.logger.warning(
+                f"Telemetry disabled, can not listen on {self.host}:{self.port}: "
+                f"{error}"
+            )
+            return
+
+        self.server.daemon_threads = True
+        self.threads = [
+            threading.Thread(target=self.collect, daemon=True),
+            threading.Thread(target=self.server.serve_forever, daemon=True),
+        ]
+        for thread in self.threads:
+            thread.start()
+        host, port = self.server.server_address[:2]
+        self.logger.info(f"Telemetry of {self.label} on http://{host}:{port}/metrics")
+
+    def collect(self) -> None:
+        while (sample := self.samples.get()) is not None:
+            with self.lock:
+                self.state.add(sample)
+
+    def push(self, sample: StepSample) -> None:
+        if self.server is not None:
+            self.samples.put(sample)
+
+    def stop(self) -> None:
+        if self.server is None:
+            return
+        self.samples.put(None)
+        self.server.shutdown()
+        self.server.server_close()
+        for thread in self.threads:
+            thread.join()
+        self.server = None
+
+
+def get_simulation_telemetry(
+    logger: Logger,
+    host: str,
+    port: int,
+    label: str,
+    rate_window_sec: float,
+) -> SimulationTelemetry:
+    return SimulationTelemetry(
+        logger=logger,
+        host=host,
+        port=port,
+        label=label,
+        rate_window_sec=rate_window_sec,
+    )
@@ -0,0 +1,126 @@
+import gzip
+import pickle
+
+from collections import defaultdict
+from collections.abc import Callable
+from pathlib import Path
+from types import ModuleType
+from typing import Any, BinaryIO
+
+
+# one pickled dict per simulation step: call key -> responses in call order,
+# calls returning None (setters, subscribe, start) are not stored
+StepResponses = dict[str, list[Any]]
+
+
+class TraceMismatchError(RuntimeError): ...
+
+
+def get_call_key(domain: str, method: str, args: tuple, kwargs: dict) -> str:
+    return f"{domain}.{method}{args!r}{sorted(kwargs.items())!r}"
+
+
+class RecordingDomain:
+    def __init__(self, name: str, domain: Any, recorder: "TraceRecorder") -> None:
+        self.name: str = name
+        self.domain: Any = domain
+        self.recorder: TraceRecorder = recorder
+
+    def __getattr__(self, method: str) -> Callable:
+        function = getattr(self.domain, method)
+
+        def call(*args, **kwargs):
+            response = function(*args, **kwargs)
+            self.recorder.record(self.name, method, args, kwargs, response)
+            return response
+
+        return call
+
+
+class TraceRecorder:
+    def __init__(self, sumo: ModuleType, trace_file: Path) -> None:
+        self.sumo: ModuleType = sumo
+        self.trace: BinaryIO = gzip.open(trace_file, mode="wb")
+        self.step: StepResponses = defaultdict(list)
+        self.simulation: RecordingDomain = RecordingDomain(
+            "simulation", sumo.simulation, self
+        )
+        self.vehicle: RecordingDomain = RecordingDomain("vehicle", sumo.vehicle, self)
+        self.vehicletype: RecordingDomain = RecordingDomain(
+            "vehicletype", sumo.vehicletype, self
+        )
+        self.edge: RecordingDomain = RecordingDomain("edge", sumo.edge, self)
+
+    def record(
+        self, domain: str, method: str, args: tuple, kwargs: dict, response: Any
+    ) -> None:
+        if response is not None:
+            self.step[get_call_key(domain, method, args, kwargs)].append(response)
+
+    def write_step(self) -> None:
+        pickle.dump(dict(self.step), self.trace, protocol=pickle.HIGHEST_PROTOCOL)
+        self.step = defaultdict(list)
+
+    def start(self, *args, **kwargs) -> Any:
+        return self.sumo.start(*args, **kwargs)
+
+    def simulationStep(self, *args) -> Any:
+        # calls after the step belong to the next step of the trace
+        self.write_step()
+        return self.sumo.simulationStep(*args)
+
+    def close(self) -> None:
+        self.write_step()
+        self.trace.close()
+        self.sumo.close()
+
+
+class ReplayDomain:
+    def __init__(self, name: str, replay: "TraceReplay") -> None:
+        self.name: str = name
+        self.replay: TraceReplay = replay
+
+    def __getattr__(self, method: str) -> Callable:
+        def call(*args, **kwargs):
+            return self.replay.respond(self.name, method, args, kwargs)
+
+        return call
+
+
+class TraceReplay:
+    def __init__(self, trace_file: Path) -> None:
+        self.trace: BinaryIO = gzip.open(trace_file, mode="rb")
+        self.steps: int = 0
+        self.step: StepResponses = self.read_step()
+        self.simulation: ReplayDomain = ReplayDomain("simulation", self)
+        self.vehicle: ReplayDomain = ReplayDomain("vehicle", self)
+        self.vehicletype: ReplayDomain = ReplayDomain("vehicletype", self)
+        self.edge: ReplayDomain = ReplayDomain("edge", self)
+
+    def read_step(self) -> StepResponses:
+        try:
+            return pickle.load(self.trace)
+        except EOFError:
+            return {}
+
+    def respond(self, domain: str, method: str, args: tuple, kwargs: dict) -> Any:
+        key = get_call_key(domain, method, args, kwargs)
+        responses = self.step.get(key)
+        if responses:
+            # the last response is repeated if a getter is called more often
+            # than during the recording
+            return responses.pop(0) if len(responses) > 1 else responses[0]
+        if method.startswith("get"):
+            raise TraceMismatchError(f"{key} was not recorded at step {self.steps}")
+
+        return None
+
+    def start(self, *args, **kwargs) -> None:
+        return None
+
+    def simulationStep(self, *args) -> None:
+        self.steps += 1
+        self.step = self.read_step()
+
+    def close(self) -> None:
+        self.trace.close()
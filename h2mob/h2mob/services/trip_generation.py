@@ -0,0 +1,167 @@
+from logging import Logger
+from pathlib import Path
+from xml.etree import ElementTree
+
+from h2mob.services.station_routes import allows
+
+import numpy as np
+
+
+class TripNetwork:
+    def __init__(self, net_file: Path, vehicle_class: str) -> None:
+        self.net_file: Path = net_file
+        self.vehicle_class: str = vehicle_class
+        self.edge_ids: list[str] = []
+        lengths: list[float] = []
+        from_nodes: list[str] = []
+        to_nodes: list[str] = []
+        junctions: dict[str, tuple[float, float]] = {}
+
+        for _, element in ElementTree.iterparse(net_file):
+            if element.tag == "edge":
+                lanes = element.findall("lane")
+                if element.get("function") is None and any(
+                    self.allows(lane) for lane in lanes
+                ):
+                    self.edge_ids.append(element.attrib["id"])
+                    lengths.append(float(lanes[0].attrib["length"]))
+                    from_nodes.append(element.attrib["from"])
+                    to_nodes.append(element.attrib["to"])
+                element.clear()
+            elif element.tag == "junction":
+                junctions[element.attrib["id"]] = (
+                    float(element.attrib["x"]),
+                    float(element.attrib["y"]),
+                )
+                element.clear()
+
+        self.lengths: np.ndarray = np.asarray(lengths)
+        self.starts: np.ndarray = np.asarray([junctions[n] for n in from_nodes])
+        self.ends: np.ndarray = np.asarray([junctions[n] for n in to_nodes])
+
+    def allows(self, lane: ElementTree.Element) -> bool:
+        return allows(lane=lane, vehicle_class=self.vehicle_class)
+
+    def __len__(self) -> int:
+        return len(self.edge_ids)
+
+
+class TripGenerator:
+    max_rejection_rounds: int = 100
+
+    def __init__(
+        self,
+        network: TripNetwork,
+        min_trip_distance_m: float,
+        max_trip_distance_m: float,
+        weight_by_length: bool,
+        seed: int,
+        logger: Logger,
+    ) -> None:
+        self.network: TripNetwork = network
+        self.min_trip_distance_m: float = min_trip_distance_m
+        self.max_trip_distance_m: float = max_trip_distance_m
+        self.rng: np.random.Generator = np.random.default_rng(seed)
+        self.logger: Logger = logger
+
+        weights = network.lengths if weight_by_length else np.ones(len(network))
+        self.probabilities: np.ndarray = weights / weights.sum()
+
+    def compute_departures(
+        self, periods: list[float], start_time_sec: int
+    ) -> np.ndarray:
+        # same as randomTrips.py with a period list, every hour gets
+        # equidistant departures with its own period
+        return np.concatenate(
+            [
+                np.arange(
+                    start_time_sec + hour * 3600,
+                    start_time_sec + (hour + 1) * 3600,
+                    period,
+                )
+                for hour, period in enumerate(periods)
+            ]
+        )
+
+    def get_trip_distances(
+        self, origins: np.ndarray, destinations: np.ndarray
+    ) -> np.ndarray:
+        # beeline from the start of the origin to the end of the destination,
+        # the way randomTrips.py checks --min-distance and --max-distance
+        delta = self.network.ends[destinations] - self.network.starts[origins]
+        return np.hypot(delta[:, 0], delta[:, 1])
+
+    def sample_edges(self, size: int) -> np.ndarray:
+        return self.rng.choice(len(self.network), size=size, p=self.probabilities)
+
+    def sample_trips(self, trips: int) -> tuple[np.ndarray, np.ndarray]:
+        origins = self.sample_edges(trips)
+        destinations = self.sample_edges(trips)
+
+        for _ in range(self.max_rejection_rounds):
+            distances = self.get_trip_distances(origins, destinations)
+            rejected = np.flatnonzero(
+                (origins == destinations)
+                | (distances < self.min_trip_distance_m)
+                | (distances > self.max_trip_distance_m)
+            )
+            if len(rejected) == 0:
+                return origins, destinations
+
+            origins[rejected] = self.sample_edges(len(rejected))
+            destinations[rejected] = self.sample_edges(len(rejected))
+
+        raise RuntimeError(
+            f"Could not sample {len(rejected)} trips between "
+            f"{self.min_trip_distance_m} and {self.max_trip_distance_m} meters"
+        )
+
+    def write_trips(
+        self,
+        trip_file: Path,
+        departures: np.ndarray,
+        origins: np.ndarray,
+        destinations: np.ndarray,
+        prefix: str,
+        vehicle_type: str,
+        chunk_size: int = 10_000,
+    ) -> None:
+        edge_ids = self.network.edge_ids
+        with trip_file.open(mode="w") as out:
+            out.write('<?xml version="1.0" encoding="UTF-8"?>\n\n<routes>\n')
+            for start in range(0, len(departures), chunk_size):
+                end = min(start + chunk_size, len(departures))
+                out.write(
+                    "".join(
+                        f'    <trip id="{prefix}{i}" type="{vehicle_type}" '
+                        f'depart="{departures[i]:.2f}" '
+                        f'from="{edge_ids[origins[i]]}" '
+                        f'to="{edge_ids[destinations[i]]}"/>\n'
+                        for i in range(start, end)
+                    )
+                )
+            out.write("</routes>\n")
+
+    def generate(
+        self,
+        trip_file: Path,
+        periods: list[float],
+        start_time_sec: int,
+        prefix: str,
+        vehicle_type: str,
+    ) -> None:
+        departures = self.compute_departures(
+            periods=periods, start_time_sec=start_time_sec
+        )
+        origins, destinations = self.sample_trips(trips=len(departures))
+        self.write_trips(
+            trip_file=trip_file,
+            departures=departures,
+            origins=origins,
+            destinations=destinations,
+            prefix=prefix,
+            vehicle_type=vehicle_type,
+        )
+        self.logger.info(
+            f"Generated {len(departures)} trips over {len(self.network)} edges"
+        )
@@ -0,0 +1,60 @@
+from enum import IntFlag
+
+
+class VehicleFlag(IntFlag):
+    configured = 1
+    routed = 2
+
+
+class VehicleRegistry:
+    def __init__(self, default_flags: VehicleFlag = VehicleFlag(0)) -> None:
+        # flags of vehicles that were never set, e.g. configured for vehicles
+        # loaded from a baked route file
+        self.default_flags: VehicleFlag = default_flags
+        self.slots: dict[str, int] = {}
+        self.free_slots: list[int] = []
+        # one byte of flags per slot, slots of arrived vehicles are reused, so
+        # the registry only grows with the vehicles in the simulation
+        self.flags: bytearray = bytearray()
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+    def __contains__(self, vehicle_id: str) -> bool:
+        return vehicle_id in self.slots
+
+    def get_slot(self, vehicle_id: str) -> int:
+        slot = self.slots.get(vehicle_id)
+        if slot is not None:
+            return slot
+
+        if self.free_slots:
+            slot = self.free_slots.pop()
+            self.flags[slot] = self.default_flags
+        else:
+            slot = len(self.flags)
+            self.flags.append(self.default_flags)
+        self.slots[vehicle_id] = slot
+        return slot
+
+    def set_flag(self, vehicle_id: str, flag: VehicleFlag) -> None:
+        self.flags[self.get_slot(vehicle_id)] |= flag
+
+    def has_flag(self, vehicle_id: str, flag: VehicleFlag) -> bool:
+        slot = self.slots.get(vehicle_id)
+        flags = self.default_flags if slot is None else self.flags[slot]
+        return bool(flags & flag)
+
+    def evict(self, vehicle_ids: list[str]) -> None:
+        for vehicle_id in vehicle_ids:
+            slot = self.slots.pop(vehicle_id, None)
+            if slot is not None:
+                self.flags[slot] = 0
+                self.free_slots.append(slot)
+
+    def get_vehicle_ids(self, flag: VehicleFlag) -> list[str]:
+        return [
+            vehicle_id
+            for vehicle_id, slot in self.slots.items()
+            if self.flags[slot] & flag
+        ]
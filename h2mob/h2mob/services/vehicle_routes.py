@@ -0,0 +1,166 @@
+from logging import Logger
+from pathlib import Path
+from typing import TextIO
+from xml.etree import ElementTree
+
+from h2mob.services.fleet import Fleet
+from h2mob.settings.simulation import (
+    INITIAL_TANK_PARAMETER,
+    MG_IN_LITERS,
+    PHYSICS_PARAMETERS,
+    TANK_CAPACITY_PARAMETER,
+    VEHICLE_CLASS,
+    UniformRange,
+)
+
+import numpy as np
+
+
+class VehicleRouteWriter:
+    def __init__(
+        self,
+        vehicles: Fleet,
+        source_route_file: Path,
+        vehicle_type_file: Path,
+        vehicle_type_name: str,
+        logger: Logger,
+    ) -> None:
+        self.vehicles: Fleet = vehicles
+        self.source_route_file: Path = source_route_file
+        self.vehicle_type_file: Path = vehicle_type_file
+        self.vehicle_type_name: str = vehicle_type_name
+        self.logger: Logger = logger
+
+    def get_base_vehicle_type(self) -> ElementTree.Element:
+        vehicle_types_root = ElementTree.parse(self.vehicle_type_file)
+        for vehicle_type in vehicle_types_root.iter("vType"):
+            if vehicle_type.attrib["id"] == self.vehicle_type_name:
+                return vehicle_type
+
+        raise ValueError(
+            f"vType {self.vehicle_type_name} not found in {self.vehicle_type_file}"
+        )
+
+    def get_sampled_parameters(self, profile_id: int) -> list[str]:
+        # physics drawn per vehicle stay on the vehicle, grouping vehicles by
+        # them would give almost every vehicle a vehicle type of its own
+        parameters = self.vehicles.profiles[profile_id].parameters
+        return [
+            name
+            for name in PHYSICS_PARAMETERS
+            if isinstance(parameters.get(name), UniformRange)
+        ]
+
+    def build_vehicle_type(
+        self, base: ElementTree.Element, profile_id: int
+    ) -> ElementTree.Element:
+        profile = self.vehicles.profiles[profile_id]
+        selected = np.flatnonzero(self.vehicles.profile_ids == profile_id)
+        vehicle = self.vehicles.get_vehicle_at(int(selected[0]))
+        # the tank of every vehicle of the profile has to fit the battery
+        capacity_mg = (
+            float(self.vehicles.get_column("tank_liters")[selected].max())
+            * MG_IN_LITERS
+        )
+        sampled = {
+            PHYSICS_PARAMETERS[name] for name in self.get_sampled_parameters(profile_id)
+        }
+
+        vehicle_type = ElementTree.Element(
+            "vType",
+            attrib={
+                **base.attrib,
+                "id": self.get_vehicle_type_id(profile_id),
+                "vClass": VEHICLE_CLASS,
+                "color": ",".join(str(c) for c in profile.colour),
+            },
+        )
+        for param in base.iter("param"):
+            if param.attrib["key"] != TANK_CAPACITY_PARAMETER:
+                ElementTree.SubElement(vehicle_type, "param", attrib=dict(param.attrib))
+        ElementTree.SubElement(
+            vehicle_type, "param", key=TANK_CAPACITY_PARAMETER, value=str(capacity_mg)
+        )
+        for key, value in vehicle.physics_parameters().items():
+            if key not in sampled:
+                ElementTree.SubElement(vehicle_type, "param", key=key, value=str(value))
+
+        return vehicle_type
+
+    def get_vehicle_type_id(self, profile_id: int) -> str:
+        return f"{self.vehicle_type_name}_profile_{profile_id}"
+
+    @staticmethod
+    def write_element(out: TextIO, element: ElementTree.Element) -> None:
+        element.tail = None
+        ElementTree.indent(element, space="    ", level=1)
+        out.write(f"    {ElementTree.tostring(element, encoding='unicode')}\n")
+
+    def write_vehicle_types(self, out: TextIO) -> None:
+        base = self.get_base_vehicle_type()
+
+        for profile_id in np.unique(self.vehicles.profile_ids).tolist():
+            vehicle_type = self.build_vehicle_type(base=base, profile_id=profile_id)
+            self.write_element(out=out, element=vehicle_type)
+
+    def write_routes(self, out: TextIO) -> None:
+        index = self.vehicles.get_index()
+        profile_ids = self.vehicles.profile_ids.tolist()
+        tank_liters = self.vehicles.get_column("tank_liters").tolist()
+        sampled = {
+            profile_id: [
+                (PHYSICS_PARAMETERS[name], self.vehicles.get_column(name).tolist())
+                for name in self.get_sampled_parameters(profile_id)
+            ]
+            for profile_id in set(profile_ids)
+        }
+        root: ElementTree.Element | None = None
+        depth = 0
+
+        for event, element in ElementTree.iterparse(
+            self.source_route_file, events=("start", "end")
+        ):
+            if event == "start":
+                if root is None:
+                    root = element
+                depth += 1
+                continue
+
+            depth -= 1
+            if depth != 1:
+                continue
+
+            if element.tag == "vehicle":
+                i = index[element.attrib["id"]]
+                profile_id = profile_ids[i]
+                element.set("type", self.get_vehicle_type_id(profile_id))
+                # the TraCI tank parameter is not read when the battery device
+                # is created, the initial charge is
+                ElementTree.SubElement(
+                    element,
+                    "param",
+                    key=INITIAL_TANK_PARAMETER,
+                    value=str(float(tank_liters[i]) * MG_IN_LITERS),
+                )
+                for key, values in sampled[profile_id]:
+                    ElementTree.SubElement(
+                        element, "param", key=key, value=str(values[i])
+                    )
+
+            self.write_element(out=out, element=element)
+            # only the current top level element is kept in memory
+            root.clear()  # type: ignore
+
+    def write(self, route_file: Path) -> None:
+        self.logger.info(f"Writing vehicle parameters to {route_file}")
+
+        with route_file.open(mode="w") as out:
+            out.write('<?xml version="1.0" encoding="UTF-8"?>\n\n<routes>\n')
+            self.write_vehicle_types(out=out)
+            self.write_routes(out=out)
+            out.write("</routes>\n")
+
+        self.logger.info(
+            f"{len(self.vehicles)} vehicles share "
+            f"{len(np.unique(self.vehicles.profile_ids))} vehicle types"
+        )
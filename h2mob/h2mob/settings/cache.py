@@ -0,0 +1,16 @@
+from functools import lru_cache
+from pathlib import Path
+
+from pydantic_settings import BaseSettings
+
+
+class CacheConfig(BaseSettings):
+    cache_enabled: bool = True
+    cache_path: Path = Path.home() / ".cache" / "h2mob"
+    # least recently used artifacts are evicted above this size
+    cache_budget_bytes: int = 10 * 1024**3
+
+
+@lru_cache(maxsize=1)
+def get_cache_config() -> CacheConfig:
+    return CacheConfig()
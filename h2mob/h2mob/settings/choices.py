@@ -0,0 +1,17 @@
+from enum import Enum
+
+
+# choices of CLI options, kept apart from the settings so that building the
+# CLI does not import pydantic-settings
+
+
+class SumoBackend(Enum):
+    traci = "traci"
+    libsumo = "libsumo"
+
+
+class SearchStrategy(Enum):
+    greedy = "greedy"
+    # swaps single stations of the greedy set while the score improves
+    local = "local"
+    genetic = "genetic"
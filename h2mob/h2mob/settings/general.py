@@ -16,3 +16,5 @@ class GeneralConfig(BaseSettings):
     net_path: str = "osm.net.xml"
     charging_stations_path: str = "charging.add.xml"
     charging_type_file: str = "charging_type.json"
+
+    vehicle_type_name: str = "vehicle"
@@ -7,12 +7,23 @@ from h2mob.settings import general, volume_profile
 class ScenarioConfig(general.GeneralConfig):
     template_path: Path = general.ROOT_UTILS_PATH / "template"
 
-    vehicle_type_name: str = "vehicle"
     volume_profile: dict[int, float] = volume_profile.traffic_volume_profile
 
     min_trip_distance_m: int = 1500
     max_trip_distance_m: int = 30000
     prefix: str = "vehicle"
+    trip_vehicle_class: str = "passenger"
+    weight_trips_by_length: bool = False
+    # unseeded scenarios draw new trips on every run and are not cached
+    seed: int | None = None
+    # cache key and input hashes a scenario directory was generated from
+    scenario_inputs_file: str = ".scenario_inputs.json"
+
+    # trips are routed in shards of departure time windows
+    route_shard_window_sec: int = 3600
+    route_workers: int | None = None
+    route_retries: int = 2
+    route_timeout_sec: int | None = None
 
 
 @lru_cache(maxsize=1)
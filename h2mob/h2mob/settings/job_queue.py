@@ -0,0 +1,23 @@
+from functools import lru_cache
+
+from pydantic_settings import BaseSettings
+
+
+class JobQueueConfig(BaseSettings):
+    # a job is handed to another worker once its lease is not renewed for
+    # this long, e.g. because the host of its worker went down
+    job_lease_sec: float = 300.0
+    job_heartbeat_sec: float = 60.0
+    # failed and abandoned jobs are queued again until they ran this often
+    job_max_attempts: int = 3
+    # idle workers look for new jobs this often
+    worker_poll_sec: float = 30.0
+    # how long a host waits for the lock of the queue held by another host
+    job_queue_timeout_sec: float = 60.0
+    # the throughput of the status is measured over the jobs of this window
+    job_throughput_window_sec: float = 3600.0
+
+
+@lru_cache(maxsize=1)
+def get_job_queue_config() -> JobQueueConfig:
+    return JobQueueConfig()
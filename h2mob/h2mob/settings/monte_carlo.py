@@ -0,0 +1,23 @@
+from functools import lru_cache
+
+from pydantic_settings import BaseSettings
+
+
+class MonteCarloConfig(BaseSettings):
+    min_replicas: int = 5
+    max_replicas: int = 50
+    # replica i is simulated with seed replica_base_seed + i
+    replica_base_seed: int = 0
+    replica_confidence: float = 0.95
+    # replicas stop once the confidence interval half width of every KPI is
+    # below the relative tolerance of its mean, or below the absolute
+    # tolerance for KPIs close to zero (refuels, seconds and liters)
+    replica_relative_tolerance: float = 0.05
+    replica_absolute_tolerance: float = 1.0
+    monte_carlo_path: str = "monte_carlo"
+    monte_carlo_report_file: str = "monte_carlo.json"
+
+
+@lru_cache(maxsize=1)
+def get_monte_carlo_config() -> MonteCarloConfig:
+    return MonteCarloConfig()
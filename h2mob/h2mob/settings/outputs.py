@@ -0,0 +1,31 @@
+from functools import lru_cache
+
+from pydantic_settings import BaseSettings
+
+
+FCD_OUTPUT: str = "fcd.out.xml"
+BATTERY_OUTPUT: str = "battery.out.xml"
+SUMMARY_OUTPUT: str = "summary.out.xml"
+CHARGING_STATIONS_OUTPUT: str = "chargingstations.out.xml"
+STATISTICS_OUTPUT: str = "statistics.out.xml"
+SCENARIO_CONFIG_OUTPUT: str = "scenario_config.json"
+FLEET_OUTPUT: str = "fleet.npz"
+PROFILE_OUTPUT: str = "profile.json"
+TRACI_TRACE_OUTPUT: str = "traci_trace.pkl.gz"
+
+
+class OutputConfig(BaseSettings):
+    columnar_path: str = "columnar"
+    vocabulary_file: str = "vocabulary.json"
+    time_window_sec: int = 3600
+    # rows kept in memory before a chunk is written
+    chunk_rows: int = 1_000_000
+
+    report_file: str = "report.json"
+    # vehicles slower than this on a station edge are counted as queuing
+    halted_speed_threshold: float = 0.1
+
+
+@lru_cache(maxsize=1)
+def get_output_config() -> OutputConfig:
+    return OutputConfig()
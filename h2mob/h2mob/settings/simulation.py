@@ -1,18 +1,60 @@
-import random
-
 from enum import Enum
 from functools import lru_cache
 
 from h2mob.settings import general
+from h2mob.settings.choices import SumoBackend
+
+import numpy as np
 
 from pydantic import BaseModel
 
 
+MG_IN_LITERS: int = 748_900
+# every vehicle type is switched to this class, stations allow it
+VEHICLE_CLASS: str = "custom1"
+
+# tank level of a running vehicle, read and set through TraCI
+TANK_PARAMETER: str = "device.battery.actualBatteryCapacity"
+# SUMO reads these when it creates the battery device of a loaded vehicle
+INITIAL_TANK_PARAMETER: str = "device.battery.chargeLevel"
+TANK_CAPACITY_PARAMETER: str = "device.battery.capacity"
+FUEL_TYPE_PARAMETER: str = "vehicleFuelType"
+# Vehicle fields of the energy model and their SUMO parameter keys
+PHYSICS_PARAMETERS: dict[str, str] = {
+    "mass_kg": "vehicleMass",
+    "front_surface_area": "frontSurfaceArea",
+    "air_drag_coefficient": "airDragCoefficient",
+    "constant_power_intake": "constantPowerIntake",
+    "internal_moment_of_inertia": "internalMomentOfInertia",
+    "roll_drag_coefficient": "rollDragCoefficient",
+    "propulsion_efficiency": "propulsionEfficiency",
+    "recuperatoin_efficiency": "recuperationEfficiency",
+    "wheel_radius": "wheelRadius",
+    "gear_ratio": "gearRatio",
+    "maximum_torque": "maximumTorque",
+    "maximum_power": "maximumPower",
+    "maximum_recuperation_torque": "maximumRecuperationTorque",
+    "maximum_recuperation_power": "maximumRecuperationPower",
+    "internal_battery_resistance": "internalBatteryResistance",
+    "nominal_battery_voltage": "nominalBatteryVoltage",
+}
+
+
 class FuelType(Enum):
     petrol = "petrol"
     hydrogen = "hydrogen"
 
 
+class GasStation(BaseModel):
+    id: str
+    lane: str
+    fuel_type: FuelType
+
+
+FuelStations = list[GasStation]
+HydrogenStations = list[GasStation]
+
+
 class Vehicle(BaseModel):
     colour: tuple[int, int, int, int]  # RGBA
     fuel_type: FuelType
@@ -39,70 +81,155 @@ class Vehicle(BaseModel):
     internal_battery_resistance: float  # internalBatteryResistance
     nominal_battery_voltage: float  # nominalBatteryVoltage
 
+    def tank_parameters(self) -> dict[str, float]:
+        return {TANK_PARAMETER: self.tank_liters * MG_IN_LITERS}
+
+    def physics_parameters(self) -> dict[str, float | str]:
+        return {
+            FUEL_TYPE_PARAMETER: self.fuel_type.name,
+            **{key: getattr(self, name) for name, key in PHYSICS_PARAMETERS.items()},
+        }
+
 
 class SimulationConfig(general.GeneralConfig):
     fuel_threshold_liters: int = 20
+    # tank levels are only checked when a vehicle is predicted to get close to
+    # the threshold, after this share of the predicted time is left, and at
+    # least every max interval, 0 checks every vehicle on every step
+    refuel_check_safety_margin: float = 0.5
+    refuel_check_max_interval_sec: float = 30.0
+    # write vehicle parameters into the route file instead of setting them
+    # through TraCI while the simulation is running
+    bake_vehicle_parameters: bool = True
+    vehicle_route_file_path: str = "vehicles.rou.xml"
+    station_index_path: str = "station_index"
+    # vehicle ids and departures of the route file, rebuilt when it changes
+    route_index_path: str = "routes.index.json"
+    # overrides the threads of osm.sumocfg, used to avoid oversubscribing
+    # the CPU when several simulations run in parallel
+    sumo_threads: int | None = None
+    sumo_backend: SumoBackend = SumoBackend.traci
+    # refuel routes are put together from cached shortest path trees of the
+    # stations and set with setRoute instead of a SUMO routing query per
+    # vehicle, the edge travel times are read from SUMO again after
+    # station_route_refresh_sec, None keeps the free flow travel times
+    station_route_trees: bool = True
+    station_route_refresh_sec: float | None = 900.0
+    # stops the simulation early, used for benchmarks
+    end_time_sec: int | None = None
+    # SUMO state is saved at these times, later runs of the same scenario
+    # resume from the latest compatible snapshot
+    snapshot_times_sec: list[int] = []
+    snapshot_path: str = "snapshots"
+    resume_from_snapshot: bool = True
+    # times listeners and SumoClient calls, written to profile.json
+    profile: bool = False
+    profile_interval_sec: float = 10.0
+    # records the responses of SUMO to traci_trace.pkl.gz for SUMO-free replays
+    record_traci_trace: bool = False
+    # serves the progress of a run in the Prometheus text format on
+    # http://telemetry_host:telemetry_port/metrics, 0 picks a free port
+    telemetry_port: int | None = None
+    telemetry_host: str = "127.0.0.1"
+    telemetry_rate_window_sec: float = 30.0
     petrol_vehicle_colour: tuple[int, int, int, int] = (255, 0, 0, 255)
+    # seeds the fleet and SUMO, unseeded runs draw a new fleet every time
+    seed: int | None = None
+
+
+class UniformRange(BaseModel):
+    low: float
+    high: float
+    # integers between low and high (both included) without decimals
+    decimals: int | None = None
+
+    def sample(self, rng: np.random.Generator, size: int) -> np.ndarray:
+        if self.decimals is None:
+            return rng.integers(int(self.low), int(self.high), size=size, endpoint=True)
+
+        return np.round(rng.uniform(self.low, self.high, size=size), self.decimals)
+
+
+class VehicleProfile(BaseModel):
+    colour: tuple[int, int, int, int]  # RGBA
+    fuel_type: FuelType
+    # numeric Vehicle fields, either fixed or sampled per vehicle
+    parameters: dict[str, float | UniformRange]
+
+    def sample(self, rng: np.random.Generator, size: int) -> dict[str, np.ndarray]:
+        return {
+            name: value.sample(rng=rng, size=size)
+            if isinstance(value, UniformRange)
+            else np.full(size, value)
+            for name, value in self.parameters.items()
+        }
 
 
-def get_murai_vehicle_properties() -> Vehicle:
-    return Vehicle(
+def get_murai_vehicle_profile() -> VehicleProfile:
+    return VehicleProfile(
         colour=(0, 255, 0, 255),
         fuel_type=FuelType.hydrogen,
-        # Assume short idle charge duration for sim
-        charging_duration_seconds=5 * 60,
-        # Close to usable hydrogen tank capacity converted to liters
-        tank_liters=random.randint(20, 60),
-        mass_kg=random.randint(1900, 1950),
-        front_surface_area=2.23,  # 0.8 × width × height
-        air_drag_coefficient=0.29,  # Cd from source
-        constant_power_intake=100,  # Default value
-        internal_moment_of_inertia=0.01,  # Default as actual not available
-        roll_drag_coefficient=0.012,  # From PDF
-        propulsion_efficiency=0.97,  # Gear efficiency
-        # Estimated good efficiency for regen braking
-        recuperatoin_efficiency=0.8,
-        wheel_radius=0.3706,  # From tire size
-        gear_ratio=11.691,  # Reduction gear ratio
-        maximum_torque=300.0,  # Nm
-        maximum_power=134000.0,  # W
-        maximum_recuperation_torque=300.0,  # Nm
-        maximum_recuperation_power=42100.0,  # W
-        internal_battery_resistance=0.3629,  # Ohm
-        nominal_battery_voltage=310.8,  # V
+        parameters={
+            # Assume short idle charge duration for sim
+            "charging_duration_seconds": 5 * 60,
+            # Close to usable hydrogen tank capacity converted to liters
+            "tank_liters": UniformRange(low=20, high=60),
+            "mass_kg": UniformRange(low=1900, high=1950),
+            "front_surface_area": 2.23,  # 0.8 × width × height
+            "air_drag_coefficient": 0.29,  # Cd from source
+            "constant_power_intake": 100,  # Default value
+            "internal_moment_of_inertia": 0.01,  # Default as actual not available
+            "roll_drag_coefficient": 0.012,  # From PDF
+            "propulsion_efficiency": 0.97,  # Gear efficiency
+            # Estimated good efficiency for regen braking
+            "recuperatoin_efficiency": 0.8,
+            "wheel_radius": 0.3706,  # From tire size
+            "gear_ratio": 11.691,  # Reduction gear ratio
+            "maximum_torque": 300.0,  # Nm
+            "maximum_power": 134000.0,  # W
+            "maximum_recuperation_torque": 300.0,  # Nm
+            "maximum_recuperation_power": 42100.0,  # W
+            "internal_battery_resistance": 0.3629,  # Ohm
+            "nominal_battery_voltage": 310.8,  # V
+        },
     )
 
 
-def get_petrol_vehicle_properties() -> Vehicle:
-    return Vehicle(
+def get_petrol_vehicle_profile() -> VehicleProfile:
+    return VehicleProfile(
         colour=(255, 0, 0, 255),
         fuel_type=FuelType.petrol,
-        charging_duration_seconds=5 * 60,
-        tank_liters=random.randint(20, 60),  # Typical petrol tank size
-        # Common mass range for compact/mid-size ICE cars
-        mass_kg=random.randint(1200, 1600),
-        # Estimated from car dimensions
-        front_surface_area=round(random.uniform(2.0, 2.5), 2),
-        # Common Cd for modern sedans
-        constant_power_intake=0,  # No constant draw from battery like in EVs
-        air_drag_coefficient=round(random.uniform(0.28, 0.35), 3),
-        # Slightly higher due to engine drivetrain complexity
-        internal_moment_of_inertia=0.015,
-        # Typical rolling resistance
-        roll_drag_coefficient=round(random.uniform(0.01, 0.015), 4),
-        # Efficiency for ICE drivetrains
-        propulsion_efficiency=round(random.uniform(0.25, 0.35), 3),
-        recuperatoin_efficiency=0.0,  # No regen braking
-        # 16"–17" rims with tire
-        wheel_radius=round(random.uniform(0.31, 0.34), 4),
-        # Overall gear ratio including differential
-        gear_ratio=round(random.uniform(4.0, 6.5), 3),
-        maximum_torque=random.randint(150, 250),  # Nm, mid-range ICE torque
-        maximum_power=random.randint(70000, 110000),  # W, ~95–150 hp
-        maximum_recuperation_torque=0.0,  # No regen braking
-        maximum_recuperation_power=0.0,  # No regen braking
-        internal_battery_resistance=0.0,  # Not applicable to ICE simulation
-        nominal_battery_voltage=12.0,  # Standard car battery voltage
+        parameters={
+            "charging_duration_seconds": 5 * 60,
+            # Typical petrol tank size
+            "tank_liters": UniformRange(low=20, high=60),
+            # Common mass range for compact/mid-size ICE cars
+            "mass_kg": UniformRange(low=1200, high=1600),
+            # Estimated from car dimensions
+            "front_surface_area": UniformRange(low=2.0, high=2.5, decimals=2),
+            # Common Cd for modern sedans
+            "constant_power_intake": 0,  # No constant draw from battery like in EVs
+            "air_drag_coefficient": UniformRange(low=0.28, high=0.35, decimals=3),
+            # Slightly higher due to engine drivetrain complexity
+            "internal_moment_of_inertia": 0.015,
+            # Typical rolling resistance
+            "roll_drag_coefficient": UniformRange(low=0.01, high=0.015, decimals=4),
+            # Efficiency for ICE drivetrains
+            "propulsion_efficiency": UniformRange(low=0.25, high=0.35, decimals=3),
+            "recuperatoin_efficiency": 0.0,  # No regen braking
+            # 16"–17" rims with tire
+            "wheel_radius": UniformRange(low=0.31, high=0.34, decimals=4),
+            # Overall gear ratio including differential
+            "gear_ratio": UniformRange(low=4.0, high=6.5, decimals=3),
+            # Nm, mid-range ICE torque
+            "maximum_torque": UniformRange(low=150, high=250),
+            # W, ~95–150 hp
+            "maximum_power": UniformRange(low=70000, high=110000),
+            "maximum_recuperation_torque": 0.0,  # No regen braking
+            "maximum_recuperation_power": 0.0,  # No regen braking
+            "internal_battery_resistance": 0.0,  # Not applicable to ICE simulation
+            "nominal_battery_voltage": 12.0,  # Standard car battery voltage
+        },
     )
 
 
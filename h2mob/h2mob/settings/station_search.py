@@ -0,0 +1,25 @@
+from functools import lru_cache
+
+from pydantic_settings import BaseSettings
+
+
+class StationSearchConfig(BaseSettings):
+    station_search_path: str = "station_search"
+    station_search_report_file: str = "station_search.json"
+    # a set is scored by the seconds a hydrogen refuel costs, the detour
+    # driven at this speed plus the queue at the station
+    search_detour_speed: float = 13.89
+    # vehicles refuelling at a station at once
+    search_station_servers: int = 1
+    # seconds charged for a refuel without a reachable hydrogen station
+    search_unserved_penalty_sec: float = 3600.0
+    search_seed: int = 0
+    local_search_max_iterations: int = 50
+    genetic_population: int = 40
+    genetic_generations: int = 30
+    genetic_mutation_rate: float = 0.2
+
+
+@lru_cache(maxsize=1)
+def get_station_search_config() -> StationSearchConfig:
+    return StationSearchConfig()
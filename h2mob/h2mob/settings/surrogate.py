@@ -0,0 +1,25 @@
+from functools import lru_cache
+
+from pydantic_settings import BaseSettings
+
+
+class SurrogateConfig(BaseSettings):
+    # consumption of a vehicle with the mean parameters of its profile until
+    # the surrogate is calibrated against simulation outputs
+    petrol_liters_per_100km: float = 7.0
+    hydrogen_liters_per_100km: float = 6.0
+    # speed for the air drag share of the road load, in m/s
+    surrogate_reference_speed: float = 13.89
+    # seeds the vehicle parameters drawn for both fuel types of every vehicle
+    surrogate_seed: int = 0
+    # memory for one batch of configurations assigned to stations at once
+    surrogate_batch_mib: int = 256
+    surrogate_parameters_file: str = "surrogate_parameters.json"
+    surrogate_report_file: str = "surrogate.json"
+    surrogate_crossings_file: str = "surrogate_crossings.npz"
+    station_distances_file: str = "station_distances.npz"
+
+
+@lru_cache(maxsize=1)
+def get_surrogate_config() -> SurrogateConfig:
+    return SurrogateConfig()
@@ -0,0 +1,92 @@
+import os
+
+from pathlib import Path
+
+from h2mob.services.artifact_cache import ArtifactCache
+from h2mob.settings.cache import CacheConfig
+
+import pytest
+
+from loguru import logger
+
+
+def get_cache(cache_path: Path, budget_bytes: int) -> ArtifactCache:
+    return ArtifactCache(
+        config=CacheConfig(cache_path=cache_path, cache_budget_bytes=budget_bytes),
+        logger=logger,  # type: ignore
+    )
+
+
+def put(cache: ArtifactCache, tmp_path: Path, key: str, size: int) -> Path:
+    src = tmp_path / f"{key}.bin"
+    src.write_bytes(b"x" * size)
+    return cache.put(key, {"file": src})
+
+
+def set_last_use(entry: Path, timestamp: float) -> None:
+    os.utime(entry, (timestamp, timestamp))
+
+
+@pytest.fixture
+def cache(tmp_path: Path) -> ArtifactCache:
+    return get_cache(tmp_path / "cache", budget_bytes=250)
+
+
+def test_put_and_get(cache: ArtifactCache, tmp_path: Path) -> None:
+    entry = put(cache, tmp_path, "a", 100)
+
+    assert cache.get("a") == entry
+    assert (entry / "file").read_bytes() == b"x" * 100
+    assert cache.get("b") is None
+
+
+def test_evict_least_recently_used_above_budget(
+    cache: ArtifactCache, tmp_path: Path
+) -> None:
+    set_last_use(put(cache, tmp_path, "a", 100), 1000)
+    set_last_use(put(cache, tmp_path, "b", 100), 2000)
+    # a use refreshes the entry, b is the least recently used now
+    set_last_use(cache.get("a"), 3000)  # type: ignore
+
+    put(cache, tmp_path, "c", 100)
+
+    assert cache.get("a") is not None
+    assert cache.get("b") is None
+    assert cache.get("c") is not None
+
+
+def test_evict_keeps_the_new_entry_above_budget(
+    cache: ArtifactCache, tmp_path: Path
+) -> None:
+    put(cache, tmp_path, "a", 100)
+
+    # larger than the whole budget on its own
+    put(cache, tmp_path, "b", 300)
+
+    assert cache.get("a") is None
+    assert cache.get("b") is not None
+
+
+def test_evict_ignores_entries_being_written(
+    cache: ArtifactCache, tmp_path: Path
+) -> None:
+    tmp_entry = cache.artifacts_path / ".tmp_writing"
+    tmp_entry.mkdir()
+    (tmp_entry / "file").write_bytes(b"x" * 1000)
+
+    put(cache, tmp_path, "a", 100)
+
+    assert tmp_entry.is_dir()
+    assert cache.get("a") is not None
+
+
+def test_restore_links_read_only_files(cache: ArtifactCache, tmp_path: Path) -> None:
+    entry = put(cache, tmp_path, "a", 100)
+    dst = tmp_path / "restored.bin"
+    dst.write_bytes(b"old")
+
+    cache.restore(entry, {"file": dst})
+
+    assert dst.read_bytes() == b"x" * 100
+    # hard links share the mode of the cached file
+    assert dst.stat().st_mode & 0o222 == 0
@@ -0,0 +1,181 @@
+import signal
+import time
+
+from collections.abc import Iterator
+from pathlib import Path
+
+from h2mob.services.job_queue import JobQueue, JobStatus, JobWorker, QueuedJob
+from h2mob.services.sweep import SweepJob
+from h2mob.settings.job_queue import JobQueueConfig
+from h2mob.settings.simulation import SimulationConfig
+
+import pytest
+
+from loguru import logger
+
+
+JOBS = [
+    SweepJob(percent_of_hydrogen_cars=0.1, hydrogen_stations={"a"}),
+    SweepJob(percent_of_hydrogen_cars=0.2, hydrogen_stations={"a", "b"}, seed=7),
+]
+
+
+def get_queue(tmp_path: Path, **config: float) -> JobQueue:
+    return JobQueue(
+        queue_file=tmp_path / "queue.sqlite",
+        config=JobQueueConfig(job_queue_timeout_sec=1.0, **config),
+    )
+
+
+@pytest.fixture
+def queue(tmp_path: Path) -> Iterator[JobQueue]:
+    queue = get_queue(tmp_path, job_max_attempts=2)
+    yield queue
+    queue.close()
+
+
+@pytest.fixture
+def expiring_queue(tmp_path: Path) -> Iterator[JobQueue]:
+    # leases are over as soon as they are handed out
+    queue = get_queue(tmp_path, job_max_attempts=2, job_lease_sec=-1.0)
+    yield queue
+    queue.close()
+
+
+def test_submit_and_claim_in_order(queue: JobQueue, tmp_path: Path) -> None:
+    job_ids = queue.submit(tmp_path, JOBS)
+
+    first = queue.claim("w1")
+    second = queue.claim("w2")
+
+    assert first is not None and second is not None
+    assert [first.id, second.id] == job_ids
+    assert first.job == JOBS[0]
+    assert second.job == JOBS[1]
+    assert first.status == JobStatus.running
+    assert first.worker == "w1"
+    assert first.attempts == 1
+    assert second.output_folder.name.endswith("_seed_7")
+    assert queue.claim("w3") is None
+
+
+def test_a_lease_is_exclusive(queue: JobQueue, tmp_path: Path) -> None:
+    [job_id] = queue.submit(tmp_path, JOBS[:1])
+    queue.claim("w1")
+
+    assert queue.claim("w2") is None
+    assert queue.heartbeat(job_id, "w1")
+    assert not queue.heartbeat(job_id, "w2")
+    assert not queue.finish(job_id, "w2")
+    assert queue.finish(job_id, "w1")
+    assert queue.get_status().jobs[JobStatus.done] == 1
+
+
+def test_failed_job_is_queued_again_until_max_attempts(
+    queue: JobQueue, tmp_path: Path
+) -> None:
+    [job_id] = queue.submit(tmp_path, JOBS[:1])
+
+    queue.claim("w1")
+    assert queue.finish(job_id, "w1", error="boom")
+    retry = queue.claim("w2")
+    assert retry is not None
+    assert retry.attempts == 2
+    assert retry.error == "boom"
+    assert queue.finish(job_id, "w2", error="boom again")
+
+    status = queue.get_status()
+    assert queue.claim("w3") is None
+    assert status.jobs[JobStatus.failed] == 1
+    assert status.failed[0].error == "boom again"
+
+
+def test_expired_lease_is_requeued(expiring_queue: JobQueue, tmp_path: Path) -> None:
+    [job_id] = expiring_queue.submit(tmp_path, JOBS[:1])
+    expiring_queue.claim("w1")
+
+    retry = expiring_queue.claim("w2")
+
+    assert retry is not None
+    assert retry.id == job_id
+    assert retry.worker == "w2"
+    assert retry.attempts == 2
+    assert retry.error == "lease of w1 expired"
+    # the first worker lost the job and must not report on it
+    assert not expiring_queue.heartbeat(job_id, "w1")
+    assert not expiring_queue.finish(job_id, "w1")
+
+
+def test_expired_lease_fails_after_max_attempts(
+    expiring_queue: JobQueue, tmp_path: Path
+) -> None:
+    expiring_queue.submit(tmp_path, JOBS[:1])
+    expiring_queue.claim("w1")
+    expiring_queue.claim("w2")
+
+    status = expiring_queue.get_status()
+
+    assert expiring_queue.claim("w3") is None
+    assert status.jobs[JobStatus.failed] == 1
+    assert status.jobs[JobStatus.running] == 0
+    assert status.failed[0].error == "lease of w2 expired"
+
+
+def test_status_counts_and_eta(queue: JobQueue, tmp_path: Path) -> None:
+    [done_id, _] = queue.submit(tmp_path, JOBS)
+    queue.claim("w1")
+    queue.finish(done_id, "w1")
+    queue.claim("w2")
+
+    status = queue.get_status()
+
+    assert status.jobs[JobStatus.done] == 1
+    assert status.jobs[JobStatus.running] == 1
+    assert status.jobs[JobStatus.queued] == 0
+    assert [job.worker for job in status.running] == ["w2"]
+    assert status.jobs_per_hour > 0
+    assert status.eta_sec is not None
+
+
+def test_worker_stops_the_job_when_its_lease_is_lost(tmp_path: Path) -> None:
+    config = JobQueueConfig(
+        job_queue_timeout_sec=1.0, job_lease_sec=-1.0, job_heartbeat_sec=0.05
+    )
+    queue = JobQueue(queue_file=tmp_path / "queue.sqlite", config=config)
+    [job_id] = queue.submit(tmp_path, JOBS[:1])
+    worker = JobWorker(
+        logger=logger,  # type: ignore
+        queue_file=tmp_path / "queue.sqlite",
+        queue_config=config,
+        simulation_config=SimulationConfig(sumo_home="/tmp"),
+        port=None,
+        exit_when_empty=True,
+    )
+    stopped_after_sec: list[float] = []
+
+    def run_job(queued_job: QueuedJob) -> None:
+        # another worker takes over the expired lease while the job runs
+        assert queue.claim("other") is not None
+        started = time.perf_counter()
+        try:
+            while time.perf_counter() - started < 5:
+                time.sleep(0.01)
+        finally:
+            stopped_after_sec.append(time.perf_counter() - started)
+
+    worker.run_job = run_job  # type: ignore
+    previous_handler = signal.getsignal(signal.SIGINT)
+    try:
+        worker.run()
+    finally:
+        signal.signal(signal.SIGINT, previous_handler)
+
+    assert worker.interrupted
+    assert stopped_after_sec[0] < 1
+    # the stale worker did not report on the job of the other one
+    [worker_name] = queue.connection.execute(
+        "SELECT worker FROM jobs WHERE id = ?", (job_id,)
+    ).fetchone()
+    assert worker_name == "other"
+    assert queue.get_status().jobs[JobStatus.done] == 0
+    queue.close()
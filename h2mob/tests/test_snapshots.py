@@ -0,0 +1,85 @@
+from h2mob.services.snapshots import Snapshot, StationChoice
+from h2mob.services.station_index import StationIndex
+from h2mob.settings.simulation import FuelType, GasStation
+
+
+STATIONS = {
+    station_id: GasStation(id=station_id, lane=f"{station_id}_edge", fuel_type=fuel)
+    for station_id, fuel in (
+        ("a", FuelType.hydrogen),
+        ("b", FuelType.hydrogen),
+        ("c", FuelType.petrol),
+    )
+}
+
+
+def get_snapshot(hydrogen_stations: list[str], **choices: StationChoice) -> Snapshot:
+    return Snapshot(
+        time_sec=21600,
+        state_file="state.xml.gz",
+        fleet_file="fleet.npz",
+        configured_vehicles=[],
+        routed_vehicles=list(choices),
+        routed_stations={
+            choice.station: choice.fuel_type for choice in choices.values()
+        },
+        station_choices=choices,
+        hydrogen_stations=hydrogen_stations,
+        vehicles_tank_mg={},
+    )
+
+
+def get_index(nearest: dict[FuelType, dict[str, str]]) -> StationIndex:
+    return StationIndex(
+        stations=STATIONS,
+        nearest={
+            fuel_type: {edge: (station, 100.0) for edge, station in edges.items()}
+            for fuel_type, edges in nearest.items()
+        },
+    )
+
+
+def test_same_station_set_is_compatible() -> None:
+    snapshot = get_snapshot(
+        ["a"],
+        v0=StationChoice(edge=":junction", fuel_type=FuelType.hydrogen, station="a"),
+    )
+
+    assert snapshot.is_compatible([STATIONS["a"]], get_index({FuelType.hydrogen: {}}))
+
+
+def test_branch_with_the_same_nearest_stations() -> None:
+    snapshot = get_snapshot(
+        ["a"], v0=StationChoice(edge="e1", fuel_type=FuelType.hydrogen, station="a")
+    )
+    index = get_index({FuelType.hydrogen: {"e1": "a", "e2": "b"}})
+
+    assert snapshot.is_compatible([STATIONS["a"], STATIONS["b"]], index)
+
+
+def test_branch_where_a_new_station_is_nearer() -> None:
+    snapshot = get_snapshot(
+        ["a"], v0=StationChoice(edge="e1", fuel_type=FuelType.hydrogen, station="a")
+    )
+    index = get_index({FuelType.hydrogen: {"e1": "b"}})
+
+    assert not snapshot.is_compatible([STATIONS["a"], STATIONS["b"]], index)
+
+
+def test_branch_where_a_petrol_car_loses_its_station() -> None:
+    snapshot = get_snapshot(
+        ["a"], v0=StationChoice(edge="e1", fuel_type=FuelType.petrol, station="c")
+    )
+    index = get_index({FuelType.petrol: {"e1": "b"}, FuelType.hydrogen: {}})
+
+    assert not snapshot.is_compatible([], index)
+
+
+def test_branch_from_a_choice_outside_the_index() -> None:
+    snapshot = get_snapshot(
+        ["a"],
+        v0=StationChoice(edge=":junction", fuel_type=FuelType.hydrogen, station="a"),
+    )
+    index = get_index({FuelType.hydrogen: {"e1": "a"}})
+
+    assert not snapshot.is_compatible([STATIONS["a"], STATIONS["b"]], index)
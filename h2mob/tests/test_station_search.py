@@ -0,0 +1,63 @@
+from h2mob.services.analysis import HOURS
+from h2mob.services.station_search import get_queue_time_sec
+
+import numpy as np
+import pytest
+
+
+def get_refuels_per_hour(*hours: dict[int, float]) -> np.ndarray:
+    refuels_per_hour = np.zeros((len(hours), HOURS))
+    for station, refuels in enumerate(hours):
+        for hour, count in refuels.items():
+            refuels_per_hour[station, hour] = count
+    return refuels_per_hour
+
+
+def test_get_queue_time_sec_without_refuels() -> None:
+    waiting_sec = get_queue_time_sec(
+        get_refuels_per_hour({}, {}), service_sec=360.0, servers=1
+    )
+
+    assert waiting_sec.tolist() == [0.0, 0.0]
+
+
+def test_get_queue_time_sec_below_capacity() -> None:
+    # 5 arrivals an hour at a capacity of 10, half loaded M/D/1
+    waiting_sec = get_queue_time_sec(
+        get_refuels_per_hour({8: 5.0}), service_sec=360.0, servers=1
+    )
+
+    assert waiting_sec == pytest.approx([5 * 0.5 * 360 / (2 * 0.5)])
+
+
+def test_get_queue_time_sec_pools_servers() -> None:
+    single = get_queue_time_sec(
+        get_refuels_per_hour({8: 5.0}), service_sec=360.0, servers=1
+    )
+    double = get_queue_time_sec(
+        get_refuels_per_hour({8: 10.0}), service_sec=360.0, servers=2
+    )
+
+    # twice the arrivals at twice the servers wait as long in total
+    assert double == pytest.approx(single)
+
+
+def test_get_queue_time_sec_carries_the_backlog_over() -> None:
+    # 20 arrivals at a capacity of 10 leave 10 for the next hour, which
+    # serves them and leaves nothing
+    waiting_sec = get_queue_time_sec(
+        get_refuels_per_hour({8: 20.0}), service_sec=360.0, servers=1
+    )
+
+    overloaded_hour = 20 * 0.95 * 360 / (2 * 0.05) + 10 / 2 * 3600
+    drained_hour = 10 / 2 * 3600
+    assert waiting_sec == pytest.approx([overloaded_hour + drained_hour])
+
+
+def test_get_queue_time_sec_per_station() -> None:
+    waiting_sec = get_queue_time_sec(
+        get_refuels_per_hour({8: 5.0}, {}, {8: 20.0}), service_sec=360.0, servers=1
+    )
+
+    assert waiting_sec[1] == 0.0
+    assert 0 < waiting_sec[0] < waiting_sec[2]
@@ -0,0 +1,146 @@
+from h2mob.services.analysis import HOURS
+from h2mob.services.station_index import StationDistances
+from h2mob.services.surrogate import (
+    Demand,
+    RouteTable,
+    SurrogateModel,
+    SurrogateParameters,
+    get_mean_parameters,
+    get_vehicle_profiles,
+)
+from h2mob.settings.simulation import FuelType, SimulationConfig
+from h2mob.settings.surrogate import SurrogateConfig
+
+import numpy as np
+import pytest
+
+
+def get_model(departures_sec: list[float], routes: list[list[int]]) -> SurrogateModel:
+    # three 100 m edges of 10 s and two stations, the second one is not
+    # reachable from edge 2
+    lengths = np.fromiter((len(route) for route in routes), dtype=np.int64)
+    return SurrogateModel(
+        routes=RouteTable(
+            vehicle_ids=[f"v{i}" for i in range(len(routes))],
+            departures_sec=np.asarray(departures_sec, dtype=np.float64),
+            offsets=np.concatenate(([0], np.cumsum(lengths))),
+            edges=np.asarray(sum(routes, []), dtype=np.int32),
+        ),
+        station_distances=StationDistances(
+            station_ids=["a", "b"],
+            edge_ids=["e0", "e1", "e2"],
+            distances=np.asarray([[100.0, 300.0], [200.0, 50.0], [10.0, np.inf]]),
+        ),
+        edge_lengths=np.full(3, 100.0),
+        edge_travel_times=np.full(3, 10.0),
+        # 1 liter per 100 m
+        parameters=SurrogateParameters(
+            liters_per_100km={FuelType.hydrogen: 1000.0, FuelType.petrol: 1000.0}
+        ),
+        simulation_config=SimulationConfig(sumo_home="/tmp", fuel_threshold_liters=20),
+        surrogate_config=SurrogateConfig(),
+    )
+
+
+def get_columns(tank_liters: list[float]) -> dict[str, np.ndarray]:
+    # vehicles with the mean parameters consume the calibrated liters per 100 km
+    parameters = get_mean_parameters(get_vehicle_profiles()[FuelType.hydrogen])
+    columns = {
+        name: np.full(len(tank_liters), value) for name, value in parameters.items()
+    }
+    columns["tank_liters"] = np.asarray(tank_liters, dtype=np.float64)
+    return columns
+
+
+def test_get_crossings_interpolates_on_the_crossing_edge() -> None:
+    model = get_model(departures_sec=[1000.0], routes=[[0, 1, 2]])
+
+    crossings = model.get_crossings(get_columns([21.5]), fuel_type=FuelType.hydrogen)
+
+    # 1.5 liters above the threshold last 150 m, halfway along the second edge
+    assert crossings.edges.tolist() == [1]
+    assert crossings.times_sec == pytest.approx([1015.0])
+
+
+def test_get_crossings_of_a_route_that_starts_later_in_the_table() -> None:
+    model = get_model(departures_sec=[0.0, 500.0], routes=[[0], [1, 2]])
+
+    crossings = model.get_crossings(
+        get_columns([100.0, 20.5]), fuel_type=FuelType.hydrogen
+    )
+
+    assert crossings.edges.tolist() == [-1, 1]
+    assert np.isnan(crossings.times_sec[0])
+    assert crossings.times_sec[1] == pytest.approx(505.0)
+
+
+def test_get_crossings_skips_arrivals_and_unfixed_departures() -> None:
+    model = get_model(
+        departures_sec=[0.0, np.nan, 0.0], routes=[[0, 1, 2], [0, 1, 2], [0, 1, 2]]
+    )
+
+    # the first vehicle arrives with 3.5 liters above the threshold, the
+    # third one starts below it
+    crossings = model.get_crossings(
+        get_columns([23.5, 21.5, 10.0]), fuel_type=FuelType.hydrogen
+    )
+
+    assert crossings.edges.tolist() == [-1, -1, 0]
+    assert np.isnan(crossings.times_sec[:2]).all()
+    assert crossings.times_sec[2] == pytest.approx(0.0)
+
+
+def test_get_crossings_without_routes() -> None:
+    model = get_model(departures_sec=[0.0], routes=[[]])
+
+    crossings = model.get_crossings(get_columns([40.0]), fuel_type=FuelType.hydrogen)
+
+    assert crossings.edges.tolist() == [-1]
+    assert np.isnan(crossings.times_sec).all()
+
+
+def test_assign_to_the_nearest_open_station() -> None:
+    model = get_model(departures_sec=[0.0], routes=[[0]])
+    refuels_per_hour = np.zeros((3, HOURS))
+    refuels_per_hour[0, 8] = 2.0
+    refuels_per_hour[1, 9] = 1.0
+    refuels_per_hour[2, 9] = 4.0
+    demand = Demand(edges=np.asarray([0, 1, 2]), refuels_per_hour=refuels_per_hour)
+
+    assignment = model.assign(
+        demand, masks=np.asarray([[True, True], [False, True], [False, False]])
+    )
+
+    # both open
+    assert assignment.refuels_per_hour[0, 0, 8] == 2.0
+    assert assignment.refuels_per_hour[0, 0, 9] == 4.0
+    assert assignment.refuels_per_hour[0, 1, 9] == 1.0
+    assert assignment.unserved_refuels[0] == 0.0
+    assert assignment.distance_m[0] == pytest.approx(2 * 100 + 50 + 4 * 10)
+    # only b open, edge 2 has no path to it
+    assert assignment.refuels_per_hour[1, 0].sum() == 0.0
+    assert assignment.refuels_per_hour[1, 1].sum() == 3.0
+    assert assignment.unserved_refuels[1] == 4.0
+    assert assignment.distance_m[1] == pytest.approx(2 * 300 + 50)
+    # none open
+    assert assignment.refuels_per_hour[2].sum() == 0.0
+    assert assignment.unserved_refuels[2] == 7.0
+    assert assignment.distance_m[2] == 0.0
+
+
+def test_assign_in_batches_matches_one_batch() -> None:
+    model = get_model(departures_sec=[0.0], routes=[[0]])
+    rng = np.random.default_rng(0)
+    demand = Demand(
+        edges=np.asarray([0, 1, 2]), refuels_per_hour=rng.random((3, HOURS))
+    )
+    masks = rng.random((50, 2)) < 0.5
+
+    expected = model.assign(demand, masks)
+    # a batch of a single configuration
+    model.surrogate_config = SurrogateConfig(surrogate_batch_mib=0)
+    batched = model.assign(demand, masks)
+
+    assert batched.refuels_per_hour == pytest.approx(expected.refuels_per_hour)
+    assert batched.unserved_refuels == pytest.approx(expected.unserved_refuels)
+    assert batched.distance_m == pytest.approx(expected.distance_m)
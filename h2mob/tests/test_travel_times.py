@@ -0,0 +1,94 @@
+from h2mob.services.simulation import SumoClient
+from h2mob.services.station_routes import RoadNetwork, StationRouter
+
+import traci.constants as tc  # type: ignore
+
+from loguru import logger
+
+
+class EdgeDomain:
+    def __init__(self, travel_times: dict[str, float]) -> None:
+        self.travel_times: dict[str, float] = travel_times
+        self.calls: list[str] = []
+        self.subscribed: bool = False
+
+    def subscribeContext(self, *args) -> None:  # noqa: N802
+        self.calls.append("subscribeContext")
+        self.subscribed = True
+
+    def unsubscribeContext(self, *args) -> None:  # noqa: N802
+        self.calls.append("unsubscribeContext")
+        self.subscribed = False
+
+    def getContextSubscriptionResults(self, edge: str) -> dict:  # noqa: N802
+        if not self.subscribed:
+            return {}
+        return {
+            edge: {tc.VAR_CURRENT_TRAVELTIME: travel_time}
+            for edge, travel_time in self.travel_times.items()
+        }
+
+
+class Sumo:
+    def __init__(self, edge: EdgeDomain) -> None:
+        self.edge: EdgeDomain = edge
+
+
+def get_client(refresh_sec: float) -> tuple[SumoClient, EdgeDomain]:
+    network = RoadNetwork(
+        lengths={"a": 100.0, "b": 100.0},
+        travel_times={"a": 10.0, "b": 10.0},
+        successors={"a": {"b"}},
+        predecessors={"b": {"a"}},
+    )
+    client = SumoClient(logger=logger, station_route_refresh_sec=refresh_sec)  # type: ignore
+    client.station_router = StationRouter(network=network, logger=logger)  # type: ignore
+    # the travel times of the junction edge are not part of the network
+    edge = EdgeDomain({"a": 30.0, "b": 10.0, ":j": 1.0})
+    client.sumo = Sumo(edge)
+    client.simulation_state = {tc.VAR_TIME: 0.0}
+    return client, edge
+
+
+def test_refresh_reads_all_edges_with_one_subscription() -> None:
+    client, edge = get_client(refresh_sec=900.0)
+    router = client.station_router
+    assert router is not None
+
+    client.refresh_travel_times(router)
+    # the previous travel times are kept until the next step answers
+    assert router.travel_times["a"] == 10.0
+    client.read_travel_times()
+
+    assert edge.calls == ["subscribeContext", "unsubscribeContext"]
+    assert router.travel_times == {"a": 30.0, "b": 10.0}
+    assert client.travel_times_anchor is None
+
+
+def test_refresh_waits_for_the_interval() -> None:
+    client, edge = get_client(refresh_sec=900.0)
+    router = client.station_router
+    assert router is not None
+    client.refresh_travel_times(router)
+    client.read_travel_times()
+
+    client.simulation_state = {tc.VAR_TIME: 600.0}
+    client.refresh_travel_times(router)
+    assert client.travel_times_anchor is None
+
+    client.simulation_state = {tc.VAR_TIME: 900.0}
+    client.refresh_travel_times(router)
+    assert client.travel_times_anchor is not None
+    assert edge.calls.count("subscribeContext") == 2
+
+
+def test_unchanged_travel_times_keep_the_trees() -> None:
+    client, _ = get_client(refresh_sec=900.0)
+    router = client.station_router
+    assert router is not None
+    router.update_travel_times({"a": 30.0})
+    tree = router.get_to_station_tree("b")
+
+    router.update_travel_times({"a": 30.0, "b": 10.0})
+
+    assert router.to_station == {"b": tree}